@@ -1,5 +1,5 @@
 from aws_cdk import (
-    # Duration,
+    Duration,
     BundlingOptions,
     Environment,
     RemovalPolicy,
@@ -15,7 +15,10 @@ from aws_cdk import (
      aws_logs,
     aws_iam,
     aws_secretsmanager,
-    aws_codedeploy
+    aws_codedeploy,
+    aws_lambda_event_sources,
+    aws_s3,
+    aws_sqs
 )
 from datetime import datetime
 import json
@@ -24,6 +27,19 @@ from constructs import Construct
 
 DEFAULT_SECRET_NAME="ACS_secret"
 
+
+def lambdaCode() -> aws_lambda.Code:
+    """
+    The code of the functions: src with the packages of src/requirements.txt, Powertools v3,
+    numpy and orjson among them, installed at synth time in the Python 3.11 build image
+    """
+    return aws_lambda.Code.from_asset(path="../src",
+                                      bundling=BundlingOptions(
+                                          image=aws_lambda.Runtime.PYTHON_3_11.bundling_image,
+                                          command=['bash', '-c',
+                                                   'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
+                                      ))
+
 '''
 Define DynamoDB table to persist autonomous cars as part of the robot taxi inventory.
 Define the Lambda Function to support the management operation on the AutonomousCar entity
@@ -36,10 +52,22 @@ class ACMmainStack(Stack):
         super().__init__(scope, construct_id, **kwargs)
 
         carTable=self.defineCarTableDataBase()
+        outboxTable=self.defineCarOutboxTable()
+        statsTable=self.defineCarStatsTable()
+        idempotencyTable=self.defineIdempotencyTable()
         carEventBus = aws_events.EventBus(self, "carsEventBus",
                     event_bus_name="cars"
                 )
         acm_lambda, alias= self.defineAutonomousCarManagerAsLambdaFct(carTable,carEventBus,env)
+        outboxTable.grant_write_data(acm_lambda)
+        statsTable.grant_read_write_data(acm_lambda)
+        idempotencyTable.grant_read_write_data(acm_lambda)
+        self.defineOutboxRelayLambdaFct(outboxTable,carEventBus,env)
+        consumer_lambda=self.defineCarUpdatesConsumerLambdaFct(carTable,outboxTable,carEventBus,env)
+        statsTable.grant_read_write_data(consumer_lambda)
+        snapshotBucket=self.defineFleetSnapshotBuilderLambdaFct(carTable,env)
+        snapshotBucket.grant_read(acm_lambda)
+        acm_lambda.add_environment("CAR_SNAPSHOT_BUCKET", snapshotBucket.bucket_name)
         self.defineAutonomousCarManagerAPIs(alias)
         carEventBus.grant_all_put_events(acm_lambda)
         self.defineSNSTargetToEventBus(carEventBus)
@@ -70,6 +98,14 @@ class ACMmainStack(Stack):
         carTable = dynamodb.TableV2(self, "CarsTable",
                 table_name="acm_cars",
                 partition_key=dynamodb.Attribute(name="car_id", type=dynamodb.AttributeType.STRING),
+                global_secondary_indexes=[
+                    # cars by geohash cell, for the nearby car lookups
+                    dynamodb.GlobalSecondaryIndexPropsV2(
+                        index_name="geo_cell-index",
+                        partition_key=dynamodb.Attribute(name="geo_cell", type=dynamodb.AttributeType.STRING),
+                        sort_key=dynamodb.Attribute(name="car_id", type=dynamodb.AttributeType.STRING),
+                    )
+                ],
                 table_class=dynamodb.TableClass.STANDARD_INFREQUENT_ACCESS,
                 billing=dynamodb.Billing.on_demand(),
                 removal_policy=RemovalPolicy.DESTROY,
@@ -83,25 +119,159 @@ class ACMmainStack(Stack):
 
 
 
+    def defineCarOutboxTable(self):
+        """
+        Car events written in the same transaction as the car, relayed from the table stream
+        """
+        return dynamodb.TableV2(self, "CarOutboxTable",
+                table_name="acm_car_outbox",
+                # the events of a car share a partition, hence a stream shard, and are relayed in order
+                partition_key=dynamodb.Attribute(name="car_id", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="sequence", type=dynamodb.AttributeType.STRING),
+                billing=dynamodb.Billing.on_demand(),
+                dynamo_stream=dynamodb.StreamViewType.NEW_IMAGE,
+                time_to_live_attribute="expires_at",
+                removal_policy=RemovalPolicy.DESTROY,
+                )
+
+    def defineCarStatsTable(self):
+        """
+        Fleet counters by status, model and bike rack, one item updated by every car write
+        """
+        return dynamodb.TableV2(self, "CarStatsTable",
+                table_name="acm_car_stats",
+                partition_key=dynamodb.Attribute(name="stats_id", type=dynamodb.AttributeType.STRING),
+                billing=dynamodb.Billing.on_demand(),
+                removal_policy=RemovalPolicy.DESTROY,
+                )
+
+    def defineIdempotencyTable(self):
+        """
+        Responses of the car writes sent with an Idempotency-Key, expired by TTL
+        """
+        return dynamodb.TableV2(self, "CarIdempotencyTable",
+                table_name="acm_car_idempotency",
+                partition_key=dynamodb.Attribute(name="id", type=dynamodb.AttributeType.STRING),
+                billing=dynamodb.Billing.on_demand(),
+                time_to_live_attribute="expiration",
+                removal_policy=RemovalPolicy.DESTROY,
+                )
+
+    def defineOutboxRelayLambdaFct(self, outboxTable, carEventBus, env):
+        relay_lambda = aws_lambda.Function(self, 'CarOutboxRelay',
+            runtime=aws_lambda.Runtime.PYTHON_3_11,
+            code=lambdaCode(),
+            function_name= "CarOutboxRelay",
+            handler='car_outbox.handler',
+            environment = {
+                "CAR_EVENT_BUS":carEventBus.event_bus_name,
+                "POWERTOOLS_SERVICE_NAME": "CarOutboxRelay",
+                "POWERTOOLS_METRICS_NAMESPACE": "CarManager",
+                "POWERTOOLS_LOG_LEVEL": "INFO",
+            },
+        )
+        relay_lambda.add_event_source(aws_lambda_event_sources.DynamoEventSource(outboxTable,
+            starting_position=aws_lambda.StartingPosition.TRIM_HORIZON,
+            batch_size=100,
+            report_batch_item_failures=True,
+            retry_attempts=10,
+            filters=[aws_lambda.FilterCriteria.filter({"eventName": aws_lambda.FilterRule.is_equal("INSERT")})]
+        ))
+        carEventBus.grant_all_put_events(relay_lambda)
+        return relay_lambda
+
+    def defineCarUpdatesConsumerLambdaFct(self, carTable, outboxTable, carEventBus, env):
+        """
+        Asynchronous car updates from a queue, the records of failed cars are retried then sent to a DLQ
+        """
+        dlq = aws_sqs.Queue(self, "CarUpdatesDLQ", queue_name="acm_car_updates_dlq",
+                            retention_period=Duration.days(14))
+        queue = aws_sqs.Queue(self, "CarUpdatesQueue", queue_name="acm_car_updates",
+                              visibility_timeout=Duration.seconds(180),
+                              dead_letter_queue=aws_sqs.DeadLetterQueue(max_receive_count=5, queue=dlq))
+        consumer_lambda = aws_lambda.Function(self, 'CarUpdatesConsumer',
+            runtime=aws_lambda.Runtime.PYTHON_3_11,
+            code=lambdaCode(),
+            function_name= "CarUpdatesConsumer",
+            handler='car_consumer.handler',
+            timeout=Duration.seconds(30),
+            environment = {
+                "CAR_EVENT_BUS":carEventBus.event_bus_name,
+                "CAR_TABLE_NAME":carTable.table_name,
+                "CAR_EVENT_OUTBOX": "true",
+                "CAR_OUTBOX_TABLE_NAME": "acm_car_outbox",
+                "CAR_FLEET_STATS": "true",
+                "CAR_STATS_TABLE_NAME": "acm_car_stats",
+                "POWERTOOLS_SERVICE_NAME": "CarUpdatesConsumer",
+                "POWERTOOLS_METRICS_NAMESPACE": "CarManager",
+                "POWERTOOLS_LOG_LEVEL": "INFO",
+            },
+        )
+        consumer_lambda.add_event_source(aws_lambda_event_sources.SqsEventSource(queue,
+            batch_size=100,
+            max_batching_window=Duration.seconds(1),
+            report_batch_item_failures=True,
+        ))
+        carTable.grant_read_write_data(consumer_lambda)
+        outboxTable.grant_write_data(consumer_lambda)
+        carEventBus.grant_all_put_events(consumer_lambda)
+        CfnOutput(self, "CAR UPDATES QUEUE URL", value=queue.queue_url)
+        return consumer_lambda
+
+    def defineFleetSnapshotBuilderLambdaFct(self, carTable, env):
+        """
+        Compressed fleet snapshots in S3, rebuilt every minute from a parallel scan of the car table
+        """
+        snapshotBucket = aws_s3.Bucket(self, "CarSnapshotsBucket",
+                block_public_access=aws_s3.BlockPublicAccess.BLOCK_ALL,
+                # a new version is a new object, the previous ones are only read through unexpired URLs
+                lifecycle_rules=[aws_s3.LifecycleRule(prefix="snapshots/", expiration=Duration.days(1))],
+                removal_policy=RemovalPolicy.DESTROY,
+                auto_delete_objects=True,
+                )
+        builder_lambda = aws_lambda.Function(self, 'CarSnapshotBuilder',
+            runtime=aws_lambda.Runtime.PYTHON_3_11,
+            code=lambdaCode(),
+            function_name= "CarSnapshotBuilder",
+            handler='fleet_snapshot.handler',
+            timeout=Duration.seconds(55),
+            memory_size=512,
+            environment = {
+                "CAR_TABLE_NAME":carTable.table_name,
+                "CAR_SNAPSHOT_BUCKET": snapshotBucket.bucket_name,
+                "CAR_SNAPSHOT_SEGMENTS": "4",
+                "POWERTOOLS_SERVICE_NAME": "CarSnapshotBuilder",
+                "POWERTOOLS_METRICS_NAMESPACE": "CarManager",
+                "POWERTOOLS_LOG_LEVEL": "INFO",
+            },
+        )
+        aws_events.Rule(self, "CarSnapshotSchedule",
+                schedule=aws_events.Schedule.rate(Duration.minutes(1)),
+                targets=[aws_events_targets.LambdaFunction(builder_lambda)]
+                )
+        carTable.grant_read_data(builder_lambda)
+        snapshotBucket.grant_read_write(builder_lambda)
+        CfnOutput(self, "CAR SNAPSHOTS BUCKET", value=snapshotBucket.bucket_name)
+        return snapshotBucket
+
     def defineAutonomousCarManagerAsLambdaFct(self, carTable,carEventBus,env):
         lambda_role = self.defineUserRoleForLambdaExecution()
-        powertools_layer = aws_lambda.LayerVersion.from_layer_version_arn(
-            self,
-            id="lambda-powertools",
-            layer_version_arn=f"arn:aws:lambda:{env.region}:017000801446:layer:AWSLambdaPowertoolsPythonV2:61"
-        )
         
         current_date =  datetime.now().strftime('%d-%m-%Y')   
         acm_lambda = aws_lambda.Function(self, 'CarMgrService',
             runtime=aws_lambda.Runtime.PYTHON_3_11,
-            code=aws_lambda.Code.from_asset(path="../src"),
+            code=lambdaCode(),
             function_name= "CarMgrService",
             handler='app.handler',
             role=lambda_role,
-            layers=[powertools_layer],
             environment = {
                 "CAR_EVENT_BUS":carEventBus.event_bus_name,
                 "CAR_TABLE_NAME":carTable.table_name,
+                "CAR_EVENT_OUTBOX": "true",
+                "CAR_OUTBOX_TABLE_NAME": "acm_car_outbox",
+                "CAR_FLEET_STATS": "true",
+                "CAR_STATS_TABLE_NAME": "acm_car_stats",
+                "IDEMPOTENCY_TABLE_NAME": "acm_car_idempotency",
                 "secret_name": DEFAULT_SECRET_NAME,
                 "POWERTOOLS_SERVICE_NAME": "CarManager",
                 "POWERTOOLS_METRICS_NAMESPACE": "CarManager",
@@ -147,8 +317,14 @@ class ACMmainStack(Stack):
         cars_resource.add_method("GET") # get all cars
         cars_resource.add_method("POST")
         cars_resource.add_method("PUT")
+        cars_resource.add_resource("nearby").add_method("GET")
+        cars_resource.add_resource("batch").add_method("POST")
+        cars_resource.add_resource("telemetry").add_method("POST")
+        cars_resource.add_resource("stats").add_method("GET")
+        cars_resource.add_resource("snapshot").add_method("GET")
         car = cars_resource.add_resource("{car_id}")
         car.add_method("GET")
+        base_api.root.add_resource("dispatch").add_method("POST")
         CfnOutput(
             self, 
             "APIGTW URL", 
@@ -21,6 +21,8 @@ from datetime import datetime
 import json
 from constructs import Construct
 
+from .main_stack import lambdaCode
+
 
 DEFAULT_SECRET_NAME="ACS_secret"
 
@@ -86,11 +88,6 @@ class ACMmainStack(Stack):
 
     def defineAutonomousCarManagerAsLambdaFct(self, carTable,carEventBus,env):
         lambda_role = self.defineUserRoleForLambdaExecution()
-        powertools_layer = aws_lambda.LayerVersion.from_layer_version_arn(
-            self,
-            id="lambda-powertools",
-            layer_version_arn=f"arn:aws:lambda:{env.region}:017000801446:layer:AWSLambdaPowertoolsPythonV2:61"
-        )
         common_dep_layer = aws_lambda.LayerVersion(self, "CommonLayer",
             removal_policy=RemovalPolicy.RETAIN,
             code=aws_lambda.Code.from_asset(path="../src/package.zip"),
@@ -99,11 +96,11 @@ class ACMmainStack(Stack):
         current_date =  datetime.now().strftime('%d-%m-%Y')   
         acm_lambda = aws_lambda.Function(self, 'CarMgrService',
             runtime=aws_lambda.Runtime.PYTHON_3_11,
-            code=aws_lambda.Code.from_asset(path="../src/"),
+            code=lambdaCode(),
             function_name= "CarMgrService",
             handler='app.handler',
             role=lambda_role,
-            layers=[powertools_layer,common_dep_layer],
+            layers=[common_dep_layer],
             environment = {
                 "CAR_EVENT_BUS":carEventBus.event_bus_name,
                 "CAR_TABLE_NAME":carTable.table_name,
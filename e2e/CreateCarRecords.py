@@ -1,53 +1,40 @@
-import boto3
-import os
-
-AWS_ACCESS_KEY_ID=os.environ.get("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY=os.environ.get("AWS_SECRET_ACCESS_KEY")
-AWS_SESSION_TOKEN=os.environ.get("AWS_SESSION_TOKEN")
-TABLE_NAME=os.environ.get("TABLE_NAME","acm_cars")
-
-session=boto3.Session()
-client = session.client(
-    'dynamodb',
-    )
-
-dynamodb = session.resource(
-    'dynamodb'
-    )
-
+"""
+Create three sample cars in the car table and add them to the fleet counters of GET /cars/stats,
+--no-fleet-stats for a deployment without them. ImportCars.py loads a whole fleet from a file.
 
+    python e2e/CreateCarRecords.py
+"""
+import argparse, os, sys
+from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from acm_model import validateCars
+from car_repository import newCarRepository
 
-carTable = dynamodb.Table(TABLE_NAME)
-print(carTable.creation_date_time)
-carTable.put_item(
-   Item={
-     "car_id": "1",
-     "type": "Model_1", 
-     "latitude": "37.7", 
-     "longitude": "-122.42",
-     "status": "Available",
-     "nb_passenger":  0
-   })
-
-
-carTable.put_item(
-   Item={
-     "car_id": "2",
-     "type": "Model_1", 
-     "latitude": "37.7", 
-     "longitude": "-122.42",
-     "status": "InCourse",
-     "nb_passenger":  3
-   })
-
-
-carTable.put_item(
-   Item={
-     "car_id": "3",
-     "type": "Model_1", 
-     "latitude": "37.7", 
-     "longitude": "-122.42",
-     "status": "InCourse",
-     "nb_passenger":  1
-   })
\ No newline at end of file
+TABLE_NAME=os.environ.get("TABLE_NAME","acm_cars")
+STATS_TABLE_NAME=os.environ.get("STATS_TABLE_NAME","acm_car_stats")
+
+CARS = [
+    {"car_id": "1", "model": "Model_1", "year": 2023, "latitude": "37.7", "longitude": "-122.42",
+     "status": "Available", "nb_passengers": 0},
+    {"car_id": "2", "model": "Model_1", "year": 2023, "latitude": "37.7", "longitude": "-122.42",
+     "status": "InCourse", "nb_passengers": 3},
+    {"car_id": "3", "model": "Model_1", "year": 2023, "latitude": "37.7", "longitude": "-122.42",
+     "status": "InCourse", "nb_passengers": 1},
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fleet-stats', action=argparse.BooleanOptionalAction, default=True,
+                        help="update the fleet counters with the cars, on by default")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    models, errors = validateCars(CARS)
+    if errors:
+        raise SystemExit(f"invalid sample cars: {errors}")
+    repository = newCarRepository({"table_name": TABLE_NAME, "stats_table_name": STATS_TABLE_NAME,
+                                   "fleet_stats": args.fleet_stats})
+    for result in repository.createCars([aCar.model_dump(mode="json", exclude_none=True) for aCar in models]):
+        print(result)
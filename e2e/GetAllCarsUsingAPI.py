@@ -1,8 +1,23 @@
 import requests
-import os,json
+import argparse,os,json
 
 API_GTW=os.getenv('API_GTW')
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--segments', type=int, default=0, help="read the full fleet with a parallel scan")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    response = requests.get(f"{API_GTW}/cars")
-    print(json.dumps(response.json(),indent=2))
\ No newline at end of file
+    args = parse_args()
+    if args.segments:
+        params = {"segments": args.segments}
+    else:
+        params = {"limit": args.limit}
+    while True:
+        page = requests.get(f"{API_GTW}/cars", params=params).json()
+        print(json.dumps(page['cars'],indent=2))
+        if page['next_cursor'] is None:
+            break
+        params = {"limit": args.limit, "cursor": page['next_cursor']}
@@ -0,0 +1,304 @@
+"""
+Bulk import of cars from a CSV or NDJSON file, gzipped or not, of any size.
+
+The file is streamed in chunks of --chunk records. Each chunk is validated against
+AutonomousCar, then written by one of --writers parallel writers with
+CarRepositoryBackend.createCars: BatchWriteItem calls of 25 cars, whose UnprocessedItems are
+retried with backoff, and the cars still failed are retried --retries more times. At most two
+chunks per writer are in flight, so the memory does not grow with the file. The cars get no
+CarCreated event, like the ones loaded by CreateCarRecords.py.
+
+CSV files have a header row of AutonomousCar attributes, empty values are missing attributes.
+Every record needs a car_id, so a row imported twice replaces the same car. A record without
+status is Available, like with POST /cars. The rejected and failed records are appended to
+--rejects as JSON lines, with their row number and the error.
+
+The fleet counters of GET /cars/stats are updated by each batch, as by the API writes: a batch
+first reads the cars it replaces, for their previous counters. --no-fleet-stats skips that read
+and the counters, for a deployment without them or a faster import followed by
+e2e/RebuildFleetStats.py, which the import reminds of when it completes.
+
+The progress is saved in --checkpoint, <file>.checkpoint.json by default, every
+--checkpoint-seconds: the byte offset in the file up to which every chunk is written. An
+interrupted import, by Ctrl-C or a crash, continues from there when run again with the same
+file, at most the chunks in flight are written twice. --restart ignores the checkpoint.
+
+    python e2e/ImportCars.py cars.csv --writers 8
+    python e2e/ImportCars.py cars.ndjson.gz --writers 16 --chunk 1000 --rejects rejects.ndjson
+    python e2e/ImportCars.py cars.csv --no-fleet-stats && python e2e/RebuildFleetStats.py --segments 8
+    CAR_REPOSITORY_BACKEND=sqlite CAR_SQLITE_PATH=cars.db python e2e/ImportCars.py cars.csv
+"""
+import argparse, csv, gzip, json, os, resource, sys, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from acm_model import validateCars
+from car_repository import newCarRepository
+
+TABLE_NAME=os.environ.get("TABLE_NAME","acm_cars")
+STATS_TABLE_NAME=os.environ.get("STATS_TABLE_NAME","acm_car_stats")
+# attributes set by the repository, not imported
+SERVER_FIELDS = {"created_at", "updated_at"}
+
+
+def inputFormat(path: str, format: str = None) -> str:
+    if format:
+        return format
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+def openInput(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _lines(stream, position: list):
+    """The decoded lines of stream, position[0] is the offset after the last one read"""
+    for line in stream:
+        position[0] += len(line)
+        yield line.decode("utf-8")
+
+
+def readRecords(path: str, format: str, offset: int = 0):
+    """
+    Yield (offset, record, error) for the records of the file from the byte offset, offset being
+    the one after the record: a dict of its attributes, or None and the reason it can't be read.
+    """
+    with openInput(path) as stream:
+        position = [offset]
+        if format == "csv":
+            header_line = stream.readline()
+            header = next(csv.reader([header_line.decode("utf-8-sig")]), [])
+            if offset:
+                stream.seek(offset)
+            else:
+                position[0] = len(header_line)
+            # the reader takes lines one at a time, a quoted value may span several
+            for row in csv.reader(_lines(stream, position)):
+                if not row:
+                    continue
+                if len(row) != len(header):
+                    yield position[0], None, f"{len(row)} values for {len(header)} columns"
+                else:
+                    yield position[0], {k: v for k, v in zip(header, row) if v != ""}, None
+        else:
+            stream.seek(offset)
+            for line in stream:
+                position[0] += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield position[0], None, f"invalid JSON: {e}"
+                    continue
+                if isinstance(record, dict):
+                    yield position[0], record, None
+                else:
+                    yield position[0], None, "record must be an object"
+
+
+def prepareChunk(records: list, first_row: int):
+    """Validate the (offset, record, error) of a chunk, return the cars to write and the rejected rows"""
+    rejects, candidates, rows = [], [], []
+    for row, (_, record, error) in enumerate(records, start=first_row):
+        if error is None and not record.get('car_id'):
+            error = "car_id is required"
+        if error is not None:
+            rejects.append({"row": row, "error": error, "record": record})
+            continue
+        record.setdefault('status', 'Available')
+        for name in ('latitude', 'longitude'):
+            # positions are strings in AutonomousCar, NDJSON files often have numbers
+            if isinstance(record.get(name), (int, float)) and not isinstance(record.get(name), bool):
+                record[name] = str(record[name])
+        candidates.append(record)
+        rows.append(row)
+    models, errors = validateCars(candidates)
+    models = iter(models)
+    cars, seen = [], set()
+    for j, (row, record) in enumerate(zip(rows, candidates)):
+        if j in errors:
+            message = "; ".join(f"{'.'.join(map(str, e['loc'])) or 'car'}: {e['msg']}" for e in errors[j])
+            rejects.append({"row": row, "error": message, "record": record})
+            continue
+        aCar = next(models)
+        # a batch can't write the same key twice
+        if aCar.car_id in seen:
+            rejects.append({"row": row, "error": "duplicate car_id in chunk", "record": record})
+            continue
+        seen.add(aCar.car_id)
+        cars.append(aCar.model_dump(mode="json", exclude_none=True, exclude=SERVER_FIELDS))
+    return cars, rejects
+
+
+def writeChunk(repository, cars: list, retries: int, base_delay: float) -> list:
+    """Write cars, retrying the failed ones, return the results of the cars still failed"""
+    pending = cars
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(base_delay * 2 ** (attempt - 1))
+        try:
+            results = repository.createCars(pending)
+        except Exception as e:
+            results = [{"car_id": car['car_id'], "status": "failed", "error": str(e)} for car in pending]
+        failed = {r['car_id']: r for r in results if r['status'] != "created"}
+        if not failed:
+            return []
+        pending = [car for car in pending if car['car_id'] in failed]
+    return list(failed.values())
+
+
+class Checkpoint:
+    """The progress of an import of source, saved as JSON with an atomic replace"""
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.state = {"source": source, "offset": 0, "rows": 0, "imported": 0, "rejected": 0, "failed": 0,
+                      "done": False}
+
+    def load(self) -> bool:
+        """Read a saved progress of the same source, False when there is none"""
+        if not os.path.exists(self.path):
+            return False
+        state = json.loads(Path(self.path).read_text())
+        if state.get("source") != self.state["source"]:
+            raise SystemExit(f"{self.path} is the checkpoint of {state.get('source')}, use --restart or --checkpoint")
+        self.state = state
+        return True
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        Path(tmp).write_text(json.dumps(self.state))
+        os.replace(tmp, self.path)
+
+
+class Progress:
+    """Rows per second of the written chunks, printed every report_seconds"""
+
+    def __init__(self, report_seconds: float):
+        self.report_seconds = report_seconds
+        self.start = self.last = time.perf_counter()
+        self.rows = self.last_rows = 0
+
+    def add(self, rows: int, in_flight: int):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self.last >= self.report_seconds:
+            print(f"{self.rows} rows, {(self.rows - self.last_rows) / (now - self.last):.0f} rows/s, "
+                  f"{in_flight} chunks in flight", file=sys.stderr)
+            self.last, self.last_rows = now, self.rows
+
+    def rate(self) -> float:
+        return self.rows / max(time.perf_counter() - self.start, 1e-9)
+
+
+def run(args) -> dict:
+    format = inputFormat(args.file, args.format)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.file}.checkpoint.json", os.path.abspath(args.file))
+    if not args.restart and checkpoint.load():
+        if checkpoint.state["done"]:
+            print(f"{args.file} was imported, --restart to import it again", file=sys.stderr)
+            return checkpoint.state
+        print(f"resuming at row {checkpoint.state['rows']}, byte {checkpoint.state['offset']}", file=sys.stderr)
+    state = checkpoint.state
+    repository = newCarRepository({"table_name": args.table, "stats_table_name": args.stats_table,
+                                   "fleet_stats": args.fleet_stats})
+    rejects = open(args.rejects, "a") if args.rejects else None
+    progress = Progress(args.report_seconds)
+    pool = ThreadPoolExecutor(max_workers=args.writers)
+    # chunks are committed to the checkpoint in file order, whatever order the writers finish in
+    in_flight, chunks, finished = {}, {}, {}
+    next_chunk = committed = 0
+    saved_at = time.perf_counter()
+
+    def collect(futures):
+        nonlocal committed, saved_at
+        for future in futures:
+            number = in_flight.pop(future)
+            finished[number] = dict(chunks.pop(number), failed=future.result())
+        while committed in finished:
+            chunk = finished.pop(committed)
+            committed += 1
+            if rejects:
+                for reject in chunk["rejects"]:
+                    rejects.write(json.dumps(reject) + "\n")
+                for failure in chunk["failed"]:
+                    rejects.write(json.dumps(failure) + "\n")
+            state["offset"] = chunk["offset"]
+            state["rows"] += chunk["rows"]
+            state["imported"] += chunk["cars"] - len(chunk["failed"])
+            state["rejected"] += len(chunk["rejects"])
+            state["failed"] += len(chunk["failed"])
+            progress.add(chunk["rows"], len(in_flight))
+        if time.perf_counter() - saved_at >= args.checkpoint_seconds:
+            if rejects:
+                rejects.flush()
+            checkpoint.save()
+            saved_at = time.perf_counter()
+
+    def submit(records: list, first_row: int):
+        nonlocal next_chunk
+        cars, chunk_rejects = prepareChunk(records, first_row)
+        while len(in_flight) >= 2 * args.writers:
+            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        chunks[next_chunk] = {"offset": records[-1][0], "rows": len(records), "cars": len(cars), "rejects": chunk_rejects}
+        in_flight[pool.submit(writeChunk, repository, cars, args.retries, args.retry_delay)] = next_chunk
+        next_chunk += 1
+
+    interrupted = False
+    try:
+        records, first_row = [], state["rows"] + 1
+        for record in readRecords(args.file, format, state["offset"]):
+            records.append(record)
+            if len(records) == args.chunk:
+                submit(records, first_row)
+                first_row += len(records)
+                records = []
+        if records:
+            submit(records, first_row)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("interrupted, waiting for the chunks in flight", file=sys.stderr)
+    collect(wait(list(in_flight)).done)
+    pool.shutdown()
+    state["done"] = not interrupted
+    checkpoint.save()
+    if rejects:
+        rejects.close()
+    state["rows_per_s"] = round(progress.rate())
+    return state
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', help="CSV or NDJSON file, .gz for gzipped")
+    parser.add_argument('--format', choices=["csv", "ndjson"], help="by default from the file extension")
+    parser.add_argument('--table', default=TABLE_NAME)
+    parser.add_argument('--stats-table', default=STATS_TABLE_NAME)
+    parser.add_argument('--fleet-stats', action=argparse.BooleanOptionalAction, default=True,
+                        help="update the fleet counters with the cars, on by default")
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--chunk', type=int, default=500, help="records validated and written together")
+    parser.add_argument('--retries', type=int, default=3, help="retries of the cars failed after the batch retries")
+    parser.add_argument('--retry-delay', type=float, default=1.0)
+    parser.add_argument('--rejects', help="append the rejected and failed records to this file")
+    parser.add_argument('--checkpoint', help="progress file, <file>.checkpoint.json by default")
+    parser.add_argument('--checkpoint-seconds', type=float, default=5)
+    parser.add_argument('--report-seconds', type=float, default=5)
+    parser.add_argument('--restart', action="store_true", help="ignore the checkpoint, import from the start")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    state = run(args)
+    # ru_maxrss is in KiB on Linux
+    peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{state['rows']} rows read, {state['imported']} cars imported into {args.table}, "
+          f"{state['rejected']} rejected, {state['failed']} failed, {state.get('rows_per_s', 0)} rows/s, "
+          f"peak RSS {peak_mib:.0f} MiB")
+    if state["done"] and not args.fleet_stats:
+        print("the fleet counters were not updated, run e2e/RebuildFleetStats.py", file=sys.stderr)
+    sys.exit(0 if state["done"] else 130)
@@ -0,0 +1,320 @@
+"""
+Asyncio load generator replaying a mixed car workload against the car manager API.
+
+The workload mixes reads (GET /cars/<car_id>), lists (GET /cars), creates (POST /cars),
+updates (PUT /cars/<car_id>) and telemetry batches (POST /cars/telemetry), weighted by --mix.
+With --rate the requests are sent at a fixed rate (open loop) and their latency counts from
+the time they were due, so a slow server is not hidden by a slower send rate; with
+--concurrency a fixed number of workers send requests back to back (closed loop).
+The report gives per operation latency histograms, error rates and the achieved throughput.
+
+--local starts LocalApiServer on a free port and targets it, no AWS needed.
+
+    python e2e/LoadTest.py --local --rate 200 --duration 30
+    python e2e/LoadTest.py --url $API_GTW --concurrency 32 --duration 60 --mix read=70,update=20,telemetry=10
+"""
+import argparse, asyncio, collections, json, os, random, ssl, sys, time
+from urllib.parse import urlsplit, urlencode
+
+API_GTW=os.getenv('API_GTW')
+PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99, 100)
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in microseconds, as in HdrHistogram: below 2**SUB_BUCKET_BITS
+    values are exact, above each power of two is split in 2**SUB_BUCKET_BITS buckets, so
+    the recorded value is within 1% of the real one.
+    """
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value_us: int):
+        value_us = max(0, int(value_us))
+        shift = max(0, value_us.bit_length() - self.SUB_BUCKET_BITS - 1)
+        self.counts[(value_us >> shift) << shift | ((1 << shift) - 1)] += 1
+        self.count += 1
+        self.total += value_us
+        self.max = max(self.max, value_us)
+
+    def merge(self, other: "LatencyHistogram"):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> int:
+        """Highest value equivalent to the p-th percentile, in microseconds"""
+        if not self.count:
+            return 0
+        if p >= 100:
+            return self.max
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= rank:
+                return min(value, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {"count": self.count,
+                "mean_ms": round(self.total / self.count / 1000, 3) if self.count else 0,
+                **{f"p{p:g}_ms": round(self.percentile(p) / 1000, 3) for p in PERCENTILES}}
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection, with raw asyncio streams"""
+
+    def __init__(self, host: str, port: int, use_ssl: bool):
+        self.host, self.port, self.use_ssl = host, port, use_ssl
+        self.reader = self.writer = None
+
+    async def request(self, method: str, target: str, body: bytes = None):
+        if self.writer is None:
+            context = ssl.create_default_context() if self.use_ssl else None
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=context,
+                                                                     server_hostname=self.host if context else None)
+        head = [f"{method} {target} HTTP/1.1", f"Host: {self.host}", "Connection: keep-alive",
+                "Accept: application/json"]
+        if body is not None:
+            head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("ascii") + (body or b""))
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by the server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            payload = b""
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                payload += chunk[:-2]
+        else:
+            payload = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class ConnectionPool:
+    def __init__(self, url: str, size: int):
+        parts = urlsplit(url)
+        self.prefix = parts.path.rstrip("/")
+        use_ssl = parts.scheme == "https"
+        port = parts.port or (443 if use_ssl else 80)
+        self.idle = asyncio.Queue()
+        for _ in range(size):
+            self.idle.put_nowait(Connection(parts.hostname, port, use_ssl))
+
+    async def request(self, method: str, path: str, query: dict = None, payload=None):
+        target = self.prefix + path + ("?" + urlencode(query) if query else "")
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        connection = await self.idle.get()
+        try:
+            return await connection.request(method, target, body)
+        except Exception:
+            connection.close()
+            raise
+        finally:
+            self.idle.put_nowait(connection)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+class Workload:
+    """The mixed car operations, on a fleet of car ids created by setUp"""
+
+    def __init__(self, mix: dict, fleet_size: int, telemetry_batch: int, seed: int = 42):
+        self.operations = list(mix)
+        self.weights = [mix[op] for op in self.operations]
+        self.rng = random.Random(seed)
+        self.run_id = f"{int(time.time()):x}"
+        self.car_ids = [f"load-{self.run_id}-{i:06d}" for i in range(fleet_size)]
+        self.telemetry_batch = telemetry_batch
+        self.created = 0
+        self.ticks = 0
+
+    def newCar(self, car_id: str) -> dict:
+        return {"car_id": car_id, "model": f"Model_{self.rng.randint(1, 5)}", "year": 2024, "status": "Available",
+                "latitude": f"{self.rng.uniform(37.70, 37.80):.5f}", "longitude": f"{self.rng.uniform(-122.50, -122.40):.5f}"}
+
+    async def setUp(self, pool: ConnectionPool):
+        for start in range(0, len(self.car_ids), 100):
+            cars = [self.newCar(car_id) for car_id in self.car_ids[start:start + 100]]
+            status, body = await pool.request("POST", "/cars/batch", payload=cars)
+            if status != 200:
+                raise RuntimeError(f"fleet creation failed with {status}: {body[:200]}")
+
+    def next(self):
+        """Return the operation name and the request arguments of the next request"""
+        op = self.rng.choices(self.operations, self.weights)[0]
+        car_id = self.rng.choice(self.car_ids)
+        if op == "read":
+            return op, ("GET", f"/cars/{car_id}", None, None)
+        if op == "list":
+            return op, ("GET", "/cars", {"limit": 100}, None)
+        if op == "create":
+            self.created += 1
+            return op, ("POST", "/cars", None, self.newCar(f"load-{self.run_id}-new-{self.created:07d}"))
+        if op == "update":
+            return op, ("PUT", f"/cars/{car_id}", None, {"status": self.rng.choice(["Available", "Rented", "Maintenance"])})
+        self.ticks += 1
+        samples = [{"car_id": self.rng.choice(self.car_ids), "lat": self.rng.uniform(37.70, 37.80),
+                    "lon": self.rng.uniform(-122.50, -122.40), "nb_passengers": self.rng.randint(0, 4),
+                    "ts": time.time()} for _ in range(self.telemetry_batch)]
+        return op, ("POST", "/cars/telemetry", None, samples)
+
+
+class Results:
+    def __init__(self):
+        self.histograms = collections.defaultdict(LatencyHistogram)
+        self.errors = collections.defaultdict(collections.Counter)
+
+    def record(self, op: str, latency_s: float, status):
+        self.histograms[op].record(latency_s * 1_000_000)
+        if status != 200:
+            self.errors[op][str(status)] += 1
+
+
+async def send(pool: ConnectionPool, results: Results, op: str, request: tuple, started: float):
+    try:
+        status, _ = await pool.request(*request)
+    except Exception as e:
+        status = type(e).__name__
+    results.record(op, time.perf_counter() - started, status)
+
+
+async def runAtRate(pool, workload, results, rate: float, duration: float, max_in_flight: int):
+    """Open loop: a request is due every 1/rate second, its latency counts from that time"""
+    in_flight = set()
+    start = time.perf_counter()
+    sent = 0
+    while True:
+        due = start + sent / rate
+        if due - start >= duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        op, request = workload.next()
+        task = asyncio.create_task(send(pool, results, op, request, due))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        sent += 1
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return time.perf_counter() - start
+
+
+async def runWithConcurrency(pool, workload, results, concurrency: int, duration: float):
+    """Closed loop: each worker sends its next request when the previous one completed"""
+    start = time.perf_counter()
+
+    async def worker():
+        while time.perf_counter() - start < duration:
+            op, request = workload.next()
+            await send(pool, results, op, request, time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def report(results: Results, elapsed: float, args) -> dict:
+    total = LatencyHistogram()
+    operations = {}
+    for op, histogram in sorted(results.histograms.items()):
+        total.merge(histogram)
+        errors = sum(results.errors[op].values())
+        operations[op] = {**histogram.summary(), "errors": dict(results.errors[op]),
+                          "error_rate": round(errors / histogram.count, 4)}
+    errors = sum(sum(counter.values()) for counter in results.errors.values())
+    summary = {"target": {"rate": args.rate, "concurrency": args.concurrency, "duration_s": args.duration},
+               "elapsed_s": round(elapsed, 2),
+               "throughput_rps": round(total.count / elapsed, 1) if elapsed else 0,
+               "error_rate": round(errors / total.count, 4) if total.count else 0,
+               "all": total.summary(), "operations": operations}
+    print(f"{total.count} requests in {elapsed:.1f}s: {summary['throughput_rps']} req/s"
+          + (f" (target {args.rate})" if args.rate else f" ({args.concurrency} workers)")
+          + f", error rate {summary['error_rate']:.2%}")
+    columns = "".join(f"{'p%g' % p:>9}" for p in PERCENTILES)
+    print(f"{'operation':<10}{'count':>8}{'errors':>8}{columns}   (ms)")
+    for op, r in list(operations.items()) + [("all", dict(summary["all"], errors={}))]:
+        values = "".join(f"{r[f'p{p:g}_ms']:>9.2f}" for p in PERCENTILES)
+        print(f"{op:<10}{r['count']:>8}{sum(r['errors'].values()):>8}{values}")
+    for op, r in operations.items():
+        if r["errors"]:
+            print(f"  {op} errors: {r['errors']}")
+    return summary
+
+
+async def main(args):
+    server = None
+    url = args.url
+    if args.local:
+        from LocalApiServer import startServer
+        server = startServer()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    if not url:
+        raise SystemExit("set --url, API_GTW or use --local")
+    mix = {op: float(weight) for op, weight in (item.split("=") for item in args.mix.split(","))}
+    workload = Workload(mix, args.fleet, args.telemetry_batch)
+    pool = ConnectionPool(url, args.connections)
+    try:
+        await workload.setUp(pool)
+        results = Results()
+        if args.rate:
+            elapsed = await runAtRate(pool, workload, results, args.rate, args.duration, args.connections * 4)
+        else:
+            elapsed = await runWithConcurrency(pool, workload, results, args.concurrency, args.duration)
+    finally:
+        pool.close()
+        if server:
+            server.shutdown()
+    summary = report(results, elapsed, args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=API_GTW, help="base URL of the API, API_GTW by default")
+    parser.add_argument('--local', action='store_true', help="start LocalApiServer and target it")
+    parser.add_argument('--rate', type=float, help="requests per second, open loop")
+    parser.add_argument('--concurrency', type=int, default=16, help="workers, closed loop when --rate is not set")
+    parser.add_argument('--duration', type=float, default=30, help="seconds")
+    parser.add_argument('--connections', type=int, default=64, help="keep-alive connections")
+    parser.add_argument('--mix', default="read=60,list=5,create=10,update=15,telemetry=10")
+    parser.add_argument('--fleet', type=int, default=1000, help="cars created before the run")
+    parser.add_argument('--telemetry-batch', type=int, default=50, help="samples per telemetry request")
+    parser.add_argument('--output', help="save the report as JSON")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(main(parse_args()))
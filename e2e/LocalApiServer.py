@@ -0,0 +1,102 @@
+"""
+Local stand-in for the API Gateway REST API: an HTTP server turning each request into a REST
+proxy event for app.handler. The cars are kept in a local backend (CAR_REPOSITORY_BACKEND,
+memory by default) and the events go to a stub EventBridge client, so no AWS account is needed.
+
+Requests are handled one at a time, like a single Lambda execution environment.
+
+    python e2e/LocalApiServer.py --port 8080
+    API_GTW=http://localhost:8080 python e2e/GetCarByIdUsingAPI.py 1
+"""
+import argparse, contextlib, os, sys, threading, warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+os.environ.setdefault("CAR_REPOSITORY_BACKEND", "memory")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "WARNING")
+
+import app
+
+warnings.filterwarnings("ignore", message="No application metrics to publish")
+
+
+class LambdaContext:
+    function_name = "CarMgrService"
+    memory_limit_in_mb = 128
+    invoked_function_arn = "arn:aws:lambda:us-west-2:123456789012:function:CarMgrService"
+    aws_request_id = "local"
+
+
+class StubEventBridge:
+    def put_events(self, Entries):
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": "local"} for _ in Entries]}
+
+
+class ApiGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    # the metrics printed by each invocation are dropped, unless --metrics
+    metrics_output = open(os.devnull, "w")
+
+    def invoke(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/") or "/"
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8") if length else None
+        query = dict(parse_qsl(url.query)) or None
+        event = {"resource": path, "path": path, "httpMethod": self.command,
+                 "headers": dict(self.headers), "multiValueHeaders": {},
+                 "queryStringParameters": query, "multiValueQueryStringParameters": None,
+                 "pathParameters": None, "stageVariables": None,
+                 "requestContext": {"httpMethod": self.command, "path": path, "stage": "local",
+                                    "requestId": "local", "identity": {"sourceIp": self.client_address[0]}},
+                 "body": body, "isBase64Encoded": False}
+        with self.lock, contextlib.redirect_stdout(self.metrics_output):
+            response = app.handler(event, LambdaContext())
+        payload = (response.get("body") or "").encode("utf-8")
+        self.send_response(response["statusCode"])
+        for name, value in (response.get("headers") or {}).items():
+            self.send_header(name, value)
+        for name, values in (response.get("multiValueHeaders") or {}).items():
+            for value in values:
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = invoke
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startServer(port: int = 0, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Start the server in a daemon thread, port 0 picks a free port, return the server"""
+    app.event_producer.event_backbone = StubEventBridge()
+    server = ThreadingHTTPServer((host, port), ApiGatewayHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="local-api", daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--metrics', action='store_true', help="print the metrics of each request")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.metrics:
+        ApiGatewayHandler.metrics_output = sys.stdout
+    server = startServer(args.port, args.host)
+    print(f"serving app.handler on http://{args.host}:{server.server_port}, backend {os.environ['CAR_REPOSITORY_BACKEND']}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,31 @@
+"""
+Recompute the fleet counters served by GET /cars/stats from a parallel scan of the car table,
+to repair a drift left by failed counter updates.
+
+    python e2e/RebuildFleetStats.py --segments 8
+"""
+import argparse, json, os, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from car_repository import newCarRepository
+
+TABLE_NAME=os.environ.get("TABLE_NAME","acm_cars")
+STATS_TABLE_NAME=os.environ.get("STATS_TABLE_NAME","acm_car_stats")
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--segments', type=int, default=4)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    repository = newCarRepository({"table_name": TABLE_NAME, "stats_table_name": STATS_TABLE_NAME,
+                                   "fleet_stats": True})
+    before = repository.getFleetStats()
+    start = time.perf_counter()
+    after = repository.rebuildFleetStats(segments=args.segments)
+    elapsed = time.perf_counter() - start
+    print(f"Rebuilt the stats of {after['total']} cars from {TABLE_NAME} with {args.segments} segments in {elapsed:.2f}s, "
+          f"the counters had {before['total']}")
+    print(json.dumps(after, indent=2))
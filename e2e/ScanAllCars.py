@@ -0,0 +1,27 @@
+import boto3
+import argparse, os, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from parallel_scan import parallelScan
+
+TABLE_NAME=os.environ.get("TABLE_NAME","acm_cars")
+
+# parse arguments to tune the parallel scan
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--page-size', type=int, default=None)
+    parser.add_argument('--max-in-flight', type=int, default=None)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    client = boto3.Session().client('dynamodb')
+    start = time.perf_counter()
+    count = 0
+    for page in parallelScan(client, TABLE_NAME, total_segments=args.segments,
+                             page_size=args.page_size, max_in_flight=args.max_in_flight):
+        count += len(page)
+    elapsed = time.perf_counter() - start
+    print(f"Scanned {count} cars from {TABLE_NAME} with {args.segments} segments in {elapsed:.2f}s ({count / elapsed:.0f} cars/s)")
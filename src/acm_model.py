@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from datetime import datetime
+from typing import List, Optional
 
 class AutonomousCar(BaseModel):
     car_id: str=None
@@ -9,10 +10,41 @@ class AutonomousCar(BaseModel):
     latitude: str=None
     longitude: str=None
     nb_passengers: int=0
+    # seat capacity, DISPATCH_DEFAULT_SEATS when unknown
+    seats: Optional[int]=Field(None, ge=1)
     bike_rack: bool=False
     created_at: datetime=None
     updated_at: datetime=None
 
+class AutonomousCarUpdate(BaseModel):
+    """Attributes a client may change on an existing car, all optional for partial updates"""
+    model: str=None
+    year: int=None
+    status: str=None
+    latitude: str=None
+    longitude: str=None
+    nb_passengers: int=None
+    seats: Optional[int]=Field(None, ge=1)
+    bike_rack: bool=None
+    version: int=None
+
+class CarTelemetry(BaseModel):
+    """One position sample reported by a car, ts in seconds since the epoch"""
+    car_id: str
+    lat: float=Field(ge=-90, le=90)
+    lon: float=Field(ge=-180, le=180)
+    nb_passengers: int=None
+    status: str=None
+    ts: float
+
+class RideRequest(BaseModel):
+    """A ride to dispatch: the pickup position, the riders and whether they bring a bike"""
+    lat: float=Field(ge=-90, le=90)
+    lon: float=Field(ge=-180, le=180)
+    party_size: int=Field(1, ge=1)
+    bike_rack: bool=False
+    radius: float=Field(None, gt=0)
+
 class AutonomousCarEvent(BaseModel):
     car_id: str
     model: str
@@ -27,20 +59,46 @@ class AutonomousCarEvent(BaseModel):
     event_version: str=None
     
     def fromAutonomousCar(aCar: AutonomousCar, eventType: str):
-        carEvent = AutonomousCarEvent(
-            car_id=aCar.car_id,
-            model=aCar.model,
-            year=aCar.year,
-            status=aCar.status,
-            nb_passengers=aCar.nb_passengers,
-            event_type = eventType,
-            event_source="acs.acm",
-            event_version="1.0"
-        )
-        if aCar.latitude != None:
-            carEvent.latitude = aCar.latitude
-        if aCar.bike_rack != None:
-            carEvent.bike_rack = aCar.bike_rack
-        if aCar.longitude != None:
-            carEvent.longitude = aCar.longitude
-        return carEvent
\ No newline at end of file
+        """Build the event of a car in one constructor call, without assignment after creation"""
+        # a single validated init is faster than model_construct, implemented in python
+        attributes = dict(car_id=aCar.car_id,
+                          model=aCar.model,
+                          year=aCar.year,
+                          status=aCar.status,
+                          nb_passengers=aCar.nb_passengers,
+                          event_type=eventType,
+                          event_source="acs.acm",
+                          event_version="1.0")
+        # the optional attributes keep their default when the car has none
+        for name in ("latitude", "longitude", "bike_rack"):
+            value = getattr(aCar, name)
+            if value is not None:
+                attributes[name] = value
+        return AutonomousCarEvent(**attributes)
+
+
+# built once, validating a list with them is one call into pydantic-core
+AutonomousCarList = TypeAdapter(List[AutonomousCar])
+CarTelemetryList = TypeAdapter(List[CarTelemetry])
+
+def _validateList(adapter: TypeAdapter, items: list):
+    try:
+        return adapter.validate_python(items), {}
+    except ValidationError as e:
+        errors = {}
+        for err in e.errors():
+            position, *loc = err['loc']
+            errors.setdefault(position, []).append(dict(err, loc=tuple(loc)))
+    valid = [item for i, item in enumerate(items) if i not in errors]
+    return adapter.validate_python(valid), errors
+
+def validateCars(cars: list):
+    """
+    Validate a list of car dicts in bulk. Return the models of the valid cars, in order,
+    and the validation errors of the invalid ones by their position in cars.
+    """
+    return _validateList(AutonomousCarList, cars)
+
+def validateTelemetry(samples: list):
+    """Validate a list of telemetry samples in bulk, like validateCars"""
+    return _validateList(CarTelemetryList, samples)
\ No newline at end of file
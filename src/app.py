@@ -1,9 +1,12 @@
 
 import os
-import boto3,json,datetime
-from boto3 import resource
+import json,datetime
 
-from aws_lambda_powertools.event_handler import APIGatewayRestResolver
+from aws_lambda_powertools.event_handler import APIGatewayRestResolver, Response, content_types
+from aws_lambda_powertools.event_handler.exceptions import BadRequestError, NotFoundError, ServiceError
+from aws_lambda_powertools.event_handler.middlewares import NextMiddleware
+from aws_lambda_powertools.utilities.idempotency.exceptions import (IdempotencyAlreadyInProgressError,
+                                                                    IdempotencyValidationError)
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools import Logger
@@ -11,73 +14,202 @@ from aws_lambda_powertools import Tracer
 from aws_lambda_powertools import Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
-from car_repository import CarRepository
-from acm_model import AutonomousCar, AutonomousCarEvent
+from car_repository import (CarRepository, newCarRepository, InvalidCursorError, CarNotFoundError, CarVersionConflictError,
+                            NearbyAreaTooLargeError, DEFAULT_PAGE_SIZE, UPDATE_MAX_ATTEMPTS, VERSION_FIELDS,
+                            project)
+from car_event_producer import CarEventProducer
+from car_outbox import CAR_EVENT_OUTBOX
+from car_serializer import carSerializer
+from car_idempotency import idempotent_writes, IDEMPOTENCY_KEY_HEADER
+from request_executor import request_executor
+from fleet_snapshot import snapshot_store, SNAPSHOT_FORMATS
+from http_cache import (CAR_CACHE_CONTROL, CARS_CACHE_CONTROL, SNAPSHOT_CACHE_CONTROL, bodyETag, cacheHeaders,
+                        carETag, etagMatches)
+import instrumentation
+from acm_model import AutonomousCar, AutonomousCarEvent, AutonomousCarUpdate, RideRequest, validateCars, validateTelemetry
+from pydantic import ValidationError
+import geo
     
 import uuid
 
 POWERTOOLS_METRICS_NAMESPACE=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", "Powertools")
-app = APIGatewayRestResolver()  # proxy_type=ProxyEventType.APIGatewayProxyEvent
+serializer = carSerializer()
+app = APIGatewayRestResolver(serializer=serializer)  # proxy_type=ProxyEventType.APIGatewayProxyEvent
 tracer = Tracer()
 logger = Logger()
 metrics = Metrics(namespace=POWERTOOLS_METRICS_NAMESPACE)
 
-DEFAULT_REPOSITORY_DEFINITION = {"resource": resource('dynamodb'),
+# AWS clients are created lazily by aws_clients on first use, keep the cold start short
+DEFAULT_REPOSITORY_DEFINITION = {"resource": None,
                                  "table_name": os.environ.get("CAR_TABLE_NAME","acm_cars")}
 
+DEFAULT_NEARBY_RADIUS = 1000
+MAX_NEARBY_RADIUS = float(os.environ.get("MAX_NEARBY_RADIUS", "10000"))
+
+# upper bound of scan workers a single GET /cars?segments= request may start
+MAX_SCAN_SEGMENTS = int(os.environ.get("MAX_SCAN_SEGMENTS", "16"))
+
+# number of cars accepted by one POST /cars/batch
+MAX_BATCH_CARS = int(os.environ.get("MAX_BATCH_CARS", "1000"))
+
+# number of samples accepted by one POST /cars/telemetry, and the move producing an event
+MAX_TELEMETRY_SAMPLES = int(os.environ.get("MAX_TELEMETRY_SAMPLES", "1000"))
+TELEMETRY_EVENT_DISTANCE_M = float(os.environ.get("TELEMETRY_EVENT_DISTANCE_M", "500"))
+
 DEFAULT_EVENT_PRODUCER = {"event_bus": os.environ.get("CAR_EVENT_BUS","acm_cars")}
+CAR_CREATED_EVENT = "acme.acs.acm.events.CarCreated"
+CAR_UPDATED_EVENT = "acme.acs.acm.events.CarUpdated"
 
-class CarEventProducer:
-    def __init__(self, event_backbone_resource):
-        self.event_backbone = boto3.client('events')
-        self.event_bus = event_backbone_resource["event_bus"]
-
-    def produceCarEvent(self, aCar: AutonomousCar, eventType: str):
-        payload=AutonomousCarEvent.fromAutonomousCar(aCar=aCar,eventType=eventType)
-        carEvent = {
-                    'Source': 'acs.acm',
-                    'DetailType': eventType, #'acme.acs.acm.events.CarUpdated',
-                    'Detail': payload.model_dump_json(),
-                    'EventBusName': self.event_bus
-                }
-        logger.info(carEvent)
-        
-        return self.event_backbone.put_events(
-            Entries=[
-                carEvent
-            ]
-        )
-
-
-car_repository=CarRepository(DEFAULT_REPOSITORY_DEFINITION)
+car_repository=newCarRepository(DEFAULT_REPOSITORY_DEFINITION)
 event_producer=CarEventProducer(DEFAULT_EVENT_PRODUCER)
 
-# Demo code
+# Demo code: the secret is read on first use with aws_clients.secrets.get(secret_name),
+# and cached for SECRET_TTL_SECONDS
 secret_name=os.getenv("secret_name",default="ACS_secret")
-region=os.getenv("AWS_DEFAULT_REGION")
-session = boto3.session.Session()
-secret_client=session.client(service_name="secretsmanager")
-try:
-        secret_value_response = secret_client.get_secret_value(
-            SecretId=secret_name
-        )
-        logger.info(f"secret read from AWS secret {secret_value_response['username']}")
-except Exception as e:
-    logger.error(e)
-
-@app.get("/cars")
+
+def _intQueryParameter(name: str, default: int) -> int:
+    value = app.current_event.get_query_string_value(name, None)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequestError(f"{name} must be an integer")
+
+CAR_FIELDS = frozenset(AutonomousCar.model_fields)
+
+def _fieldsQueryParameter() -> list:
+    """Parse fields=a,b,c, the AutonomousCar attributes to return, None for all"""
+    value = app.current_event.get_query_string_value("fields", None)
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in CAR_FIELDS]
+    if unknown:
+        raise BadRequestError(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+def conditionalListRead(app: APIGatewayRestResolver, next_middleware: NextMiddleware) -> Response:
+    """ETag of a list response from its serialized body, 304 when If-None-Match holds it"""
+    response = next_middleware(app)
+    if response.status_code != 200 or not isinstance(response.body, dict):
+        return response
+    body = serializer(response.body)
+    headers = cacheHeaders(bodyETag(body), CARS_CACHE_CONTROL)
+    if etagMatches(app.current_event.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.body = body
+    response.headers.update(headers)
+    return response
+
+@app.get("/cars", middlewares=[conditionalListRead])
 @tracer.capture_method
 def getAllCars():
-    return car_repository.getAllCars()
+    fields = _fieldsQueryParameter()
+    limit = _intQueryParameter("limit", DEFAULT_PAGE_SIZE)
+    cursor = app.current_event.get_query_string_value("cursor", None)
+    segments = _intQueryParameter("segments", 0)
+    if segments:
+        # opt-in full fleet read with a parallel scan, no pagination
+        if cursor is not None or not 1 <= segments <= MAX_SCAN_SEGMENTS:
+            raise BadRequestError(f"segments must be between 1 and {MAX_SCAN_SEGMENTS}, without cursor")
+        return {"cars": car_repository.getAllCars(segments=segments, fields=fields), "next_cursor": None}
+    try:
+        cars, next_cursor = car_repository.getCarsPage(limit=limit, cursor=cursor, fields=fields)
+    except InvalidCursorError as e:
+        raise BadRequestError(str(e))
+    return {"cars": cars, "next_cursor": next_cursor}
+
+def _floatQueryParameter(name: str, default: float = None) -> float:
+    value = app.current_event.get_query_string_value(name, None)
+    if value is None:
+        if default is None:
+            raise BadRequestError(f"{name} is required")
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequestError(f"{name} must be a number")
 
-@app.get("/cars/<car_id>")
+@app.get("/cars/nearby")
+@tracer.capture_method
+def getCarsNearby():
+    position = geo.parseCoordinates(_floatQueryParameter("lat"), _floatQueryParameter("lon"))
+    if position is None:
+        raise BadRequestError("lat and lon must be a valid position")
+    radius = _floatQueryParameter("radius", DEFAULT_NEARBY_RADIUS)
+    if not 0 < radius <= MAX_NEARBY_RADIUS:
+        raise BadRequestError(f"radius must be between 0 and {MAX_NEARBY_RADIUS} meters")
+    status = app.current_event.get_query_string_value("status", None)
+    limit = _intQueryParameter("limit", DEFAULT_PAGE_SIZE)
+    try:
+        cars = car_repository.findCarsNearby(*position, radius=radius, status=status, limit=limit)
+    except NearbyAreaTooLargeError as e:
+        raise BadRequestError(str(e))
+    return {"cars": cars}
+
+@app.get("/cars/stats")
+@tracer.capture_method
+def getFleetStats():
+    """Number of cars by status, model and bike rack, from the counters maintained by the writes"""
+    if not car_repository.fleet_stats:
+        raise ServiceError(501, "fleet statistics are not enabled, set CAR_FLEET_STATS")
+    return car_repository.getFleetStats()
+
+@app.get("/cars/snapshot")
+@tracer.capture_method
+def getFleetSnapshot():
+    """
+    Latest fleet snapshot of format rows (default) or columns: its version and a presigned URL
+    of the gzip blob, or 304 when If-None-Match holds the latest version. No table read.
+    """
+    format = app.current_event.get_query_string_value("format", "rows")
+    if format not in SNAPSHOT_FORMATS:
+        raise BadRequestError(f"format must be one of {', '.join(SNAPSHOT_FORMATS)}")
+    pointer = snapshot_store.latest(format)
+    if pointer is None:
+        raise NotFoundError(f"no {format} snapshot built yet")
+    headers = cacheHeaders(f'"{pointer["version"]}"', SNAPSHOT_CACHE_CONTROL)
+    if etagMatches(app.current_event.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(status_code=200, content_type=content_types.APPLICATION_JSON, headers=headers,
+                    body=dict(pointer, url=snapshot_store.presignedUrl(pointer["key"])))
+
+def conditionalCarRead(app: APIGatewayRestResolver, next_middleware: NextMiddleware) -> Response:
+    """
+    ETag of a car from its version. An If-None-Match is checked with a projected read of the
+    version, and answered with 304 without reading nor serializing the car.
+    """
+    fields = _fieldsQueryParameter()
+    if_none_match = app.current_event.headers.get("If-None-Match")
+    if if_none_match:
+        car_id = app.context.get("_route_args", {}).get("car_id")
+        # read before the car: a write in between gives the response an older ETag, never a newer one
+        headers = cacheHeaders(carETag(car_repository.getCarVersion(car_id), fields), CAR_CACHE_CONTROL)
+        if etagMatches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    response = next_middleware(app)
+    if response.status_code == 200 and isinstance(response.body, dict):
+        # a projection has no version, the route reads it along and leaves it in the context
+        version = app.context.get("car_version") if fields else response.body
+        response.headers.update(cacheHeaders(carETag(version, fields), CAR_CACHE_CONTROL))
+    return response
+
+@app.get("/cars/<car_id>", middlewares=[conditionalCarRead])
 @tracer.capture_method
 def getCarUsingCarId(car_id: str):
-    return car_repository.getCarUsingCarId(car_id=car_id)
+    fields = _fieldsQueryParameter()
+    if not fields:
+        return car_repository.getCarUsingCarId(car_id=car_id)
+    # one read for the projection and its ETag, the version is returned only when asked for
+    car = car_repository.getCarUsingCarId(car_id=car_id, fields=fields + [f for f in VERSION_FIELDS if f not in fields])
+    app.append_context(car_version=project(car, VERSION_FIELDS))
+    return project(car, fields)
 
-@app.post("/cars")
-def createCar():
-    car: dict = app.current_event.json_body 
+def _validationMessage(errors: list) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in errors)
+
+def _withCarDefaults(car: dict) -> dict:
     if 'car_id' not in car:
         car['car_id'] = str(uuid.uuid4())
     if 'status' not in car:
@@ -86,21 +218,273 @@ def createCar():
         car['latitude'] = "0"
     if 'longitude' not in car or car['longitude'] == None:
         car['longitude'] = "0"
-    car_repository.createCar(car)
-    
-    event_producer.produceCarEvent(aCar=AutonomousCar.model_validate(car), eventType="acme.acs.acm.events.CarCreated")
+    return _withoutNullTimestamps(car)
+
+def _withoutNullTimestamps(car: dict) -> dict:
+    # timestamps are set by the repository, a null sent by the client is not a valid datetime
+    for field in ('created_at', 'updated_at'):
+        if field in car and car[field] is None:
+            del car[field]
+    return car
+
+def idempotentWrite(app: APIGatewayRestResolver, next_middleware: NextMiddleware) -> Response:
+    """
+    Run a write with an Idempotency-Key header once: a retry of the key gets the stored
+    response, without writing the car nor publishing its event
+    """
+    key = app.current_event.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if not key or not idempotent_writes.enabled:
+        return next_middleware(app)
+    def execute() -> dict:
+        response = next_middleware(app)
+        body = response.body
+        if body is not None and not isinstance(body, str):
+            body = serializer(body)
+        return {"statusCode": response.status_code, "body": body, "headers": response.headers}
+    event = app.current_event
+    stored = idempotent_writes.run(key, event.http_method, event.path, event.body, execute, app.lambda_context)
+    return Response(status_code=stored["statusCode"], body=stored["body"], headers=stored["headers"])
+
+@app.post("/cars", middlewares=[idempotentWrite])
+def createCar():
+    car = app.current_event.json_body
+    if not isinstance(car, dict):
+        raise BadRequestError("body must be a car object")
+    car = _withCarDefaults(car)
+    try:
+        aCar = AutonomousCar.model_validate(car)
+    except ValidationError as e:
+        raise BadRequestError(_validationMessage(e.errors()))
+    if CAR_EVENT_OUTBOX:
+        car_repository.createCar(car, outbox_entry=event_producer.carEventEntry(aCar, CAR_CREATED_EVENT))
+    elif request_executor is not None:
+        request_executor.writeAndPublish(lambda: car_repository.createCar(car),
+                                         [event_producer.carEventEntry(aCar, CAR_CREATED_EVENT)], event_producer)
+    else:
+        car_repository.createCar(car)
+        event_producer.bufferCarEvent(aCar=aCar, eventType=CAR_CREATED_EVENT)
     return {
         'statusCode': 200,
         'body': json.dumps('Car added')
     }
 
-@app.put("/cars/<car_id>")
+@app.post("/cars/batch")
+@tracer.capture_method
+def createCars():
+    """Create or replace a list of cars with batched writes, return one result per car"""
+    body = app.current_event.json_body
+    cars = body.get('cars') if isinstance(body, dict) else body
+    if not isinstance(cars, list) or not 0 < len(cars) <= MAX_BATCH_CARS:
+        raise BadRequestError(f"body must be a list of 1 to {MAX_BATCH_CARS} cars")
+    results = [None] * len(cars)
+    candidates, candidate_positions = [], []
+    for i, car in enumerate(cars):
+        if not isinstance(car, dict):
+            results[i] = {"car_id": None, "status": "failed", "error": "car must be an object"}
+            continue
+        candidates.append(_withCarDefaults(car))
+        candidate_positions.append(i)
+    validated, errors = validateCars(candidates)
+    validated = iter(validated)
+    valid, models, positions = [], [], []
+    seen = set()
+    for j, (i, car) in enumerate(zip(candidate_positions, candidates)):
+        if j in errors:
+            results[i] = {"car_id": car['car_id'], "status": "failed", "error": _validationMessage(errors[j])}
+            continue
+        aCar = next(validated)
+        if car['car_id'] in seen:
+            results[i] = {"car_id": car['car_id'], "status": "failed", "error": "duplicate car_id in batch"}
+            continue
+        seen.add(car['car_id'])
+        models.append(aCar)
+        valid.append(car)
+        positions.append(i)
+    if CAR_EVENT_OUTBOX:
+        entries = [event_producer.carEventEntry(aCar, CAR_CREATED_EVENT) for aCar in models]
+        written = car_repository.createCars(valid, outbox_entries=entries) if valid else []
+    elif request_executor is not None:
+        # the events of all the valid cars are published while they are written
+        entries = [event_producer.carEventEntry(aCar, CAR_CREATED_EVENT) for aCar in models]
+        written = request_executor.writeAndPublish(
+            lambda: car_repository.createCars(valid) if valid else [], entries, event_producer,
+            failedEntries=lambda written: [entry for entry, result in zip(entries, written) if result['status'] != "created"])
+    else:
+        written = car_repository.createCars(valid) if valid else []
+    for i, result in zip(positions, written):
+        results[i] = result
+    created = [model for model, result in zip(models, written) if result['status'] == "created"]
+    if not CAR_EVENT_OUTBOX and request_executor is None:
+        for aCar in created:
+            event_producer.bufferCarEvent(aCar, eventType=CAR_CREATED_EVENT)
+    return {"results": results, "created": len(created), "failed": len(cars) - len(created)}
+
+def _isSignificantChange(previous: dict, car: dict) -> bool:
+    if previous.get('status') != car.get('status'):
+        return True
+    before = geo.parseCoordinates(previous.get('latitude'), previous.get('longitude'))
+    after = geo.parseCoordinates(car.get('latitude'), car.get('longitude'))
+    if before is None or after is None:
+        return before != after
+    return geo.distance(*before, *after) >= TELEMETRY_EVENT_DISTANCE_M
+
+def _recordSample(sample: dict):
+    """
+    Write one sample, return its outcome, the car of its CarUpdated event or None, and the error
+    of a car which failed: its write, or the validation of its event once written.
+    """
+    try:
+        outcome, previous, car = car_repository.recordTelemetry(sample)
+    except Exception as e:
+        logger.warning(f"telemetry of car {sample['car_id']} not written: {e}")
+        return "failed", None, str(e)
+    if outcome != "written" or not _isSignificantChange(previous, car):
+        return outcome, None, None
+    try:
+        return outcome, AutonomousCar.model_validate(car), None
+    except ValidationError as e:
+        return outcome, None, f"written without event: {_validationMessage(e.errors())}"
+
+@app.post("/cars/telemetry")
+@tracer.capture_method
+def recordTelemetry():
+    """
+    Record a batch of car position samples. Only the newest sample of each car is written,
+    a sample older than the last one recorded is dropped, and a CarUpdated event is produced
+    only when the car changed status or moved at least TELEMETRY_EVENT_DISTANCE_M. The cars
+    whose write or event failed are reported in failures, the others are recorded anyway.
+    """
+    body = app.current_event.json_body
+    samples = body.get('samples') if isinstance(body, dict) else body
+    if not isinstance(samples, list) or not 0 < len(samples) <= MAX_TELEMETRY_SAMPLES:
+        raise BadRequestError(f"body must be a list of 1 to {MAX_TELEMETRY_SAMPLES} samples")
+    valid, errors = validateTelemetry(samples)
+    latest = {}
+    for sample in valid:
+        if sample.car_id not in latest or sample.ts > latest[sample.car_id].ts:
+            latest[sample.car_id] = sample
+    outcomes = {"written": 0, "stale": 0, "unknown": 0, "failed": 0}
+    events = 0
+    failures = []
+    samples = [sample.model_dump(exclude_none=True) for sample in latest.values()]
+    if request_executor is not None:
+        # one sample per car, the writes of distinct cars may run concurrently
+        recorded = request_executor.map(_recordSample, samples)
+    else:
+        recorded = map(_recordSample, samples)
+    for sample, (outcome, aCar, error) in zip(samples, recorded):
+        outcomes[outcome] += 1
+        if error is not None:
+            failures.append({"car_id": sample['car_id'], "error": error})
+        if aCar is not None:
+            # also buffered in outbox mode: a missed movement event is superseded by the next one
+            event_producer.bufferCarEvent(aCar=aCar, eventType=CAR_UPDATED_EVENT)
+            events += 1
+    rejected = [{"index": i, "error": _validationMessage(errs)} for i, errs in errors.items()]
+    return {"accepted": len(valid), "coalesced": len(valid) - len(latest), **outcomes,
+            "events": events, "rejected": rejected, "failures": failures}
+
+@app.put("/cars/<car_id>", middlewares=[idempotentWrite])
 def updateCar(car_id: str):
-    car: dict = app.current_event.json_body 
+    """
+    Partial update: only the attributes that differ from the stored car are written,
+    and no event is produced when nothing changed. A version in the body must match
+    the stored version, otherwise the request fails with 409.
+    """
+    try:
+        patch = AutonomousCarUpdate.model_validate(app.current_event.json_body)
+    except ValidationError as e:
+        raise BadRequestError(_validationMessage(e.errors()))
+    car = patch.model_dump(mode="json", exclude_unset=True)
+    expected_version = car.pop('version', None)
     car['car_id'] = car_id
-    car_repository.updateCar(car)
-    event_producer.produceCarEvent(aCar=AutonomousCar.model_validate(car), eventType="acme.acs.acm.events.CarUpdated")  
-    return {"status": "updated"}
+    for attempt in range(UPDATE_MAX_ATTEMPTS):
+        update = car_repository.planUpdate(car, expected_version=expected_version)
+        if not update.changes:
+            return {"status": "unchanged", "version": update.version}
+        try:
+            aCar = AutonomousCar.model_validate(update.car)
+        except ValidationError as e:
+            raise BadRequestError(_validationMessage(e.errors()))
+        try:
+            _applyUpdateWithEvent(update, aCar)
+        except CarVersionConflictError:
+            # without a version from the client, the update is replayed on the new state
+            if expected_version is not None or attempt == UPDATE_MAX_ATTEMPTS - 1:
+                raise
+            continue
+        return {"status": "updated", "version": update.version}
+
+def _applyUpdateWithEvent(update, aCar: AutonomousCar):
+    """
+    Write a planned update with its CarUpdated event, in the outbox or buffered. The write is
+    conditional, so the event is published after it, even with CAR_CONCURRENT_IO: published
+    concurrently, a lost race would send a false event and its compensation.
+    """
+    if CAR_EVENT_OUTBOX:
+        car_repository.applyUpdate(update, outbox_entry=event_producer.carEventEntry(aCar, CAR_UPDATED_EVENT))
+    else:
+        car_repository.applyUpdate(update)
+        event_producer.bufferCarEvent(aCar=aCar, eventType=CAR_UPDATED_EVENT)
+
+@app.post("/dispatch")
+@tracer.capture_method
+def dispatchRide():
+    """
+    Reserve the best available car for a ride: the candidates ranked by the dispatcher are tried
+    in order, each with a status transition from Available to Reserved conditioned on the version
+    just read, so two rides never get the same car. 404 without candidate, 409 when all were taken.
+    """
+    # numpy is only loaded by the containers serving dispatches
+    from dispatch import dispatcher, freeSeats, AVAILABLE, RESERVED, DISPATCH_RADIUS_M
+    try:
+        ride = RideRequest.model_validate(app.current_event.json_body)
+    except ValidationError as e:
+        raise BadRequestError(_validationMessage(e.errors()))
+    candidates = dispatcher.rank(car_repository, ride.lat, ride.lon, party_size=ride.party_size,
+                                 bike_rack=ride.bike_rack, radius=ride.radius or DISPATCH_RADIUS_M)
+    if not candidates:
+        raise NotFoundError("no available car for this ride")
+    for car_id, distance in candidates:
+        update = car_repository.planUpdate({"car_id": car_id, "status": RESERVED})
+        if update.current is None or update.current.get('status') != AVAILABLE \
+                or freeSeats(update.current) < ride.party_size:
+            # taken or boarded by a write the snapshot did not see
+            dispatcher.drop(car_id)
+            continue
+        try:
+            aCar = AutonomousCar.model_validate(update.car)
+        except ValidationError as e:
+            logger.warning(f"car {car_id} can't be dispatched: {_validationMessage(e.errors())}")
+            dispatcher.drop(car_id)
+            continue
+        try:
+            _applyUpdateWithEvent(update, aCar)
+        except CarVersionConflictError:
+            continue
+        metrics.add_metric(name="RidesDispatched", unit=MetricUnit.Count, value=1)
+        return {"car_id": car_id, "distance_m": distance, "status": RESERVED, "version": update.version}
+    raise ServiceError(409, "the candidate cars were reserved by other rides, retry")
+
+@app.exception_handler(CarVersionConflictError)
+def handleVersionConflict(e: CarVersionConflictError):
+    return Response(status_code=409, content_type=content_types.APPLICATION_JSON,
+                    body=json.dumps({"statusCode": 409, "message": str(e)}))
+
+@app.exception_handler(CarNotFoundError)
+def handleCarNotFound(e: CarNotFoundError):
+    return Response(status_code=404, content_type=content_types.APPLICATION_JSON,
+                    body=json.dumps({"statusCode": 404, "message": f"car {e.args[0]} not found"}))
+
+@app.exception_handler(IdempotencyAlreadyInProgressError)
+def handleRequestInProgress(e: IdempotencyAlreadyInProgressError):
+    return Response(status_code=409, content_type=content_types.APPLICATION_JSON, headers={"Retry-After": "1"},
+                    body=json.dumps({"statusCode": 409, "message": "a request with this Idempotency-Key is in progress"}))
+
+@app.exception_handler(IdempotencyValidationError)
+def handleIdempotencyKeyReuse(e: IdempotencyValidationError):
+    return Response(status_code=422, content_type=content_types.APPLICATION_JSON,
+                    body=json.dumps({"statusCode": 422, "message": "Idempotency-Key already used with another body"}))
 
 
 # Enrich logging with contextual information from Lambda
@@ -109,7 +493,25 @@ def updateCar(car_id: str):
 # ensures metrics are flushed upon request completion/failure and capturing ColdStart metric
 @metrics.log_metrics(capture_cold_start_metric=True)
 def handler(message: dict, context: LambdaContext) -> dict:
-    return app.resolve(message, context)
+    try:
+        return app.resolve(message, context)
+    finally:
+        cache_stats = car_repository.cache.drainStats()
+        if any(cache_stats.values()):
+            metrics.add_metric(name="CarCacheHits", unit=MetricUnit.Count, value=cache_stats["hits"])
+            metrics.add_metric(name="CarCacheMisses", unit=MetricUnit.Count, value=cache_stats["misses"])
+            metrics.add_metric(name="CarCacheEvictions", unit=MetricUnit.Count, value=cache_stats["evictions"])
+        # events buffered by the routes are always sent before the invocation ends
+        stats = event_producer.flush()
+        # plus the events the routes published themselves, in the concurrent mode
+        for name, count in event_producer.drainPublishStats().items():
+            stats[name] += count
+        if stats["sent"] or stats["retried"] or stats["failed"]:
+            metrics.add_metric(name="CarEventsSent", unit=MetricUnit.Count, value=stats["sent"])
+            metrics.add_metric(name="CarEventsRetried", unit=MetricUnit.Count, value=stats["retried"])
+            metrics.add_metric(name="CarEventsFailed", unit=MetricUnit.Count, value=stats["failed"])
+        # DynamoDB and EventBridge calls of the invocation, when CAR_INSTRUMENTATION is on
+        instrumentation.publish(metrics)
 
 
 
@@ -0,0 +1,118 @@
+"""
+Lazy, memoized AWS clients and secrets.
+
+Nothing is created at import time: a client is built on its first use and reused by the next
+invocations of the warm container, so each route only pays for the AWS services it calls.
+"""
+import json, os, threading, time
+from aws_lambda_powertools import Logger
+import instrumentation
+
+logger = Logger()
+
+SECRET_TTL_SECONDS = float(os.environ.get("SECRET_TTL_SECONDS", "300"))
+# refresh a secret in a background thread when it reaches this fraction of its TTL
+SECRET_BACKGROUND_REFRESH = os.environ.get("SECRET_BACKGROUND_REFRESH", "false").lower() == "true"
+SECRET_REFRESH_RATIO = 0.8
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _memoized(kind: str, service_name: str, factory):
+    key = (kind, service_name)
+    instance = _clients.get(key)
+    if instance is None:
+        with _lock:
+            instance = _clients.get(key)
+            if instance is None:
+                instance = factory()
+                _clients[key] = instance
+    return instance
+
+
+def client(service_name: str):
+    """Return the boto3 client of a service, created on first call"""
+    def factory():
+        import boto3
+        return instrumentation.instrument(boto3.client(service_name))
+    return _memoized("client", service_name, factory)
+
+
+def resource(service_name: str):
+    """Return the boto3 resource of a service, created on first call"""
+    def factory():
+        import boto3
+        instance = boto3.resource(service_name)
+        instrumentation.instrument(instance.meta.client)
+        return instance
+    return _memoized("resource", service_name, factory)
+
+
+def reset():
+    """Forget the created clients, the next accessor calls create new ones"""
+    with _lock:
+        _clients.clear()
+
+
+class SecretCache:
+    """
+    Cache Secrets Manager values for ttl seconds. With background_refresh, a value reaching
+    SECRET_REFRESH_RATIO of its ttl is refreshed by a daemon thread while the current value
+    is still served, so callers never wait on Secrets Manager once the secret is loaded.
+    """
+
+    def __init__(self, ttl: float = SECRET_TTL_SECONDS, background_refresh: bool = SECRET_BACKGROUND_REFRESH,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.background_refresh = background_refresh
+        self.clock = clock
+        self.values = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def get(self, secret_name: str):
+        """Return the secret, parsed when it is a JSON string"""
+        entry = self.values.get(secret_name)
+        now = self.clock()
+        if entry is not None:
+            loaded_at, value = entry
+            age = now - loaded_at
+            if age < self.ttl:
+                if self.background_refresh and age >= self.ttl * SECRET_REFRESH_RATIO:
+                    self._refreshInBackground(secret_name)
+                return value
+        return self._load(secret_name)
+
+    def _load(self, secret_name: str):
+        response = client("secretsmanager").get_secret_value(SecretId=secret_name)
+        value = response.get("SecretString", response.get("SecretBinary"))
+        try:
+            value = json.loads(value)
+        except (TypeError, ValueError):
+            pass
+        self.values[secret_name] = (self.clock(), value)
+        return value
+
+    def _refreshInBackground(self, secret_name: str):
+        with self.lock:
+            if secret_name in self.refreshing:
+                return
+            self.refreshing.add(secret_name)
+
+        def refresh():
+            try:
+                self._load(secret_name)
+            except Exception as e:
+                logger.warning(f"background refresh of secret {secret_name} failed: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(secret_name)
+
+        threading.Thread(target=refresh, name="secret-refresh", daemon=True).start()
+
+    def invalidate(self, secret_name: str):
+        self.values.pop(secret_name, None)
+
+
+secrets = SecretCache()
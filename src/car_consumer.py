@@ -0,0 +1,119 @@
+"""
+Asynchronous car updates, consumed from an SQS queue or a Kinesis stream.
+
+Each record holds a partial car update, like the body of PUT /cars/<car_id>, with its car_id.
+The records of a batch are grouped by car and merged in arrival order, so a car is written
+at most once per batch; the cars are written concurrently. The records of a car whose write
+failed are reported as batch item failures, and retried alone by the event source.
+"""
+import base64, json, os
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from pydantic import ValidationError
+
+from acm_model import AutonomousCar, AutonomousCarUpdate
+from car_event_producer import CarEventProducer
+from car_outbox import CAR_EVENT_OUTBOX
+import instrumentation
+from car_repository import CarRepository, newCarRepository, CarVersionConflictError, UPDATE_MAX_ATTEMPTS
+
+logger = Logger()
+metrics = Metrics(namespace=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", "Powertools"))
+
+CAR_UPDATED_EVENT = "acme.acs.acm.events.CarUpdated"
+# cars written in parallel for one batch
+CONSUMER_WORKERS = int(os.environ.get("CAR_CONSUMER_WORKERS", "8"))
+
+DEFAULT_REPOSITORY_DEFINITION = {"resource": None,
+                                 "table_name": os.environ.get("CAR_TABLE_NAME","acm_cars")}
+DEFAULT_EVENT_PRODUCER = {"event_bus": os.environ.get("CAR_EVENT_BUS","acm_cars")}
+
+car_repository = newCarRepository(DEFAULT_REPOSITORY_DEFINITION)
+event_producer = CarEventProducer(DEFAULT_EVENT_PRODUCER)
+
+
+def recordPayload(record: dict):
+    """Return the item identifier and the decoded body of an SQS or Kinesis record"""
+    if record.get("eventSource") == "aws:kinesis":
+        return record["kinesis"]["sequenceNumber"], json.loads(base64.b64decode(record["kinesis"]["data"]))
+    return record["messageId"], json.loads(record["body"])
+
+
+def groupByCar(records: list):
+    """
+    Merge the valid updates of each car, in record order. Return the merged updates and the
+    record identifiers by car_id, and the number of rejected records.
+    """
+    updates, identifiers = {}, {}
+    rejected = 0
+    for record in records:
+        try:
+            identifier, body = recordPayload(record)
+            car_id = body['car_id']
+            patch = AutonomousCarUpdate.model_validate(body)
+        except (KeyError, TypeError, ValueError, ValidationError) as e:
+            # a malformed record would fail again on every retry, it is logged and dropped
+            logger.error(f"rejected car update record: {e}", extra={"record": record})
+            rejected += 1
+            continue
+        changes = patch.model_dump(mode="json", exclude_unset=True)
+        changes.pop('version', None)
+        updates.setdefault(car_id, {"car_id": car_id}).update(changes)
+        identifiers.setdefault(car_id, []).append(identifier)
+    return updates, identifiers, rejected
+
+
+def updateCar(car: dict):
+    """Write the merged update of a car, return the updated car model or None when unchanged"""
+    for attempt in range(UPDATE_MAX_ATTEMPTS):
+        update = car_repository.planUpdate(car)
+        if not update.changes:
+            return None
+        aCar = AutonomousCar.model_validate(update.car)
+        entry = event_producer.carEventEntry(aCar, CAR_UPDATED_EVENT) if CAR_EVENT_OUTBOX else None
+        try:
+            car_repository.applyUpdate(update, outbox_entry=entry)
+            return aCar
+        except CarVersionConflictError:
+            if attempt == UPDATE_MAX_ATTEMPTS - 1:
+                raise
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Apply the car updates of a batch of records. Malformed or invalid updates are dropped;
+    the records of the cars that could not be written are returned as batch item failures.
+    """
+    updates, identifiers, rejected = groupByCar(event.get("Records", []))
+    failures = []
+    updated = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(CONSUMER_WORKERS, len(updates))),
+                            thread_name_prefix="car-update") as executor:
+        futures = {car_id: executor.submit(updateCar, car) for car_id, car in updates.items()}
+    for car_id, future in futures.items():
+        try:
+            aCar = future.result()
+        except ValidationError as e:
+            logger.error(f"rejected update of car {car_id}: {e}")
+            rejected += len(identifiers[car_id])
+            continue
+        except Exception as e:
+            logger.error(f"update of car {car_id} failed: {e}")
+            failures.extend(identifiers[car_id])
+            continue
+        if aCar is not None:
+            updated += 1
+            if not CAR_EVENT_OUTBOX:
+                event_producer.bufferCarEvent(aCar=aCar, eventType=CAR_UPDATED_EVENT)
+    stats = event_producer.flush()
+    metrics.add_metric(name="CarsUpdated", unit=MetricUnit.Count, value=updated)
+    metrics.add_metric(name="CarUpdatesFailed", unit=MetricUnit.Count, value=len(failures))
+    metrics.add_metric(name="CarUpdatesRejected", unit=MetricUnit.Count, value=rejected)
+    metrics.add_metric(name="CarEventsSent", unit=MetricUnit.Count, value=stats["sent"])
+    instrumentation.publish(metrics)
+    return {"batchItemFailures": [{"itemIdentifier": identifier} for identifier in failures]}
@@ -0,0 +1,198 @@
+from aws_lambda_powertools import Logger
+logger = Logger()
+import json, os, random, threading, time
+import aws_clients
+
+from acm_model import AutonomousCar, AutonomousCarEvent
+
+EVENTS_PER_PUT = 10  # EventBridge PutEvents limits
+MAX_PUT_SIZE = 256 * 1024
+EVENTS_MAX_ATTEMPTS = int(os.environ.get("EVENTS_MAX_ATTEMPTS", "4"))
+EVENTS_BASE_DELAY = 0.05
+# flush before the buffer grows past this number of entries, to bound memory on bulk paths
+MAX_BUFFERED_EVENTS = int(os.environ.get("MAX_BUFFERED_EVENTS", "500"))
+# compensation of an event published concurrently with a car write that failed
+CAR_WRITE_FAILED_EVENT = "acme.acs.acm.events.CarWriteFailed"
+
+
+def entrySize(entry: dict) -> int:
+    """Size of a PutEvents entry as computed by EventBridge"""
+    size = 14 if "Time" in entry else 0
+    for field in ("Source", "DetailType", "Detail"):
+        if entry.get(field):
+            size += len(entry[field].encode("utf-8"))
+    for resource in entry.get("Resources", []):
+        size += len(resource.encode("utf-8"))
+    return size
+
+
+class EventPublishError(Exception):
+    pass
+
+
+class CarEventProducer:
+    """
+    Publish car events to EventBridge. Events are buffered with bufferCarEvent and sent by flush,
+    up to EVENTS_PER_PUT entries and MAX_PUT_SIZE bytes per PutEvents call. Only the failed entries
+    of a call are retried, with exponential backoff.
+    """
+
+    def __init__(self, event_backbone_resource):
+        self._event_backbone = event_backbone_resource.get("client")
+        self.event_bus = event_backbone_resource["event_bus"]
+        self.buffer = []
+        # entries the last flush could not deliver, with those of the automatic flushes before it
+        self.failed_entries = []
+        # counts and failures of the automatic flushes, reported by the next flush
+        self._unreported = {"sent": 0, "retried": 0, "failed": 0}
+        self._unreported_failures = []
+        self.base_delay = EVENTS_BASE_DELAY
+        # counts of the entries sent by publishEntries, outside of the buffer
+        self.published = {"sent": 0, "retried": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def event_backbone(self):
+        """EventBridge client, created on the first publication"""
+        if self._event_backbone is None:
+            self._event_backbone = aws_clients.client('events')
+        return self._event_backbone
+
+    @event_backbone.setter
+    def event_backbone(self, client):
+        self._event_backbone = client
+
+    @event_backbone.deleter
+    def event_backbone(self):
+        self._event_backbone = None
+
+    def carEventEntry(self, aCar: AutonomousCar, eventType: str) -> dict:
+        payload=AutonomousCarEvent.fromAutonomousCar(aCar=aCar,eventType=eventType)
+        return {
+                    'Source': 'acs.acm',
+                    'DetailType': eventType, #'acme.acs.acm.events.CarUpdated',
+                    'Detail': payload.model_dump_json(),
+                    'EventBusName': self.event_bus
+                }
+
+    def produceCarEvent(self, aCar: AutonomousCar, eventType: str):
+        """Send one event now and return the PutEvents response"""
+        carEvent = self.carEventEntry(aCar, eventType)
+        logger.info(carEvent)
+        response, _, failed = self._putWithRetry([carEvent])
+        if failed:
+            raise EventPublishError(f"car event {eventType} not delivered")
+        return response
+
+    def compensationEntry(self, entry: dict) -> dict:
+        """The CarWriteFailed entry withdrawing a delivered entry whose car write failed"""
+        detail = json.loads(entry['Detail'])
+        detail.update(failed_event_type=entry['DetailType'], event_type=CAR_WRITE_FAILED_EVENT)
+        return dict(entry, DetailType=CAR_WRITE_FAILED_EVENT, Detail=json.dumps(detail))
+
+    def publishEntries(self, entries: list) -> list:
+        """
+        Send entries now, without the buffer, and return the undelivered ones.
+        May be called by concurrent threads, the counts are kept for drainPublishStats.
+        """
+        stats = {"sent": 0, "retried": 0, "failed": 0}
+        undelivered = [entry for entry in entries if entrySize(entry) > MAX_PUT_SIZE]
+        stats["failed"] = len(undelivered)
+        for batch in self._batches([entry for entry in entries if entrySize(entry) <= MAX_PUT_SIZE]):
+            _, retried, failed = self._putWithRetry(batch)
+            undelivered.extend(failed)
+            stats["sent"] += len(batch) - len(failed)
+            stats["retried"] += retried
+            stats["failed"] += len(failed)
+        with self.lock:
+            for name, count in stats.items():
+                self.published[name] += count
+        return undelivered
+
+    def drainPublishStats(self) -> dict:
+        """Return the counts of publishEntries since the last call"""
+        with self.lock:
+            stats, self.published = self.published, {"sent": 0, "retried": 0, "failed": 0}
+            return stats
+
+    def bufferCarEvent(self, aCar: AutonomousCar, eventType: str):
+        self.bufferEntry(self.carEventEntry(aCar, eventType))
+
+    def bufferEntry(self, entry: dict):
+        self.buffer.append(entry)
+        if len(self.buffer) >= MAX_BUFFERED_EVENTS:
+            self._sendBuffer()
+
+    def produceCarEvents(self, cars: list, eventType: str) -> dict:
+        """Publish one event per car, in as few PutEvents calls as possible"""
+        for aCar in cars:
+            self.bufferCarEvent(aCar, eventType)
+        return self.flush()
+
+    def flush(self) -> dict:
+        """
+        Send all the buffered entries. Return the count of sent, retried and failed entries since
+        the previous flush, the automatic flushes of a full buffer included, and keep their
+        undelivered entries in failed_entries.
+        """
+        self._sendBuffer()
+        stats, self._unreported = self._unreported, {"sent": 0, "retried": 0, "failed": 0}
+        self.failed_entries, self._unreported_failures = self._unreported_failures, []
+        return stats
+
+    def _sendBuffer(self):
+        buffered, self.buffer = self.buffer, []
+        stats = {"sent": 0, "retried": 0, "failed": 0}
+        entries = []
+        for entry in buffered:
+            size = entrySize(entry)
+            if size > MAX_PUT_SIZE:
+                logger.error(f"car event of {size} bytes exceeds the PutEvents limit: {entry['DetailType']}")
+                self._unreported_failures.append(entry)
+                stats["failed"] += 1
+            else:
+                entries.append(entry)
+        for batch in self._batches(entries):
+            _, retried, failed = self._putWithRetry(batch)
+            self._unreported_failures.extend(failed)
+            stats["sent"] += len(batch) - len(failed)
+            stats["retried"] += retried
+            stats["failed"] += len(failed)
+        if entries or stats["failed"]:
+            logger.info("car events flushed", extra=stats)
+        for name, count in stats.items():
+            self._unreported[name] += count
+
+    def _batches(self, entries: list):
+        batch, batch_size = [], 0
+        for entry in entries:
+            size = entrySize(entry)
+            if len(batch) == EVENTS_PER_PUT or batch_size + size > MAX_PUT_SIZE:
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(entry)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def _putWithRetry(self, entries: list):
+        """
+        Put the entries, then retry only the failed ones.
+        Return the last response, the number of retried entries and the entries still failing.
+        """
+        response = None
+        retried = 0
+        for attempt in range(EVENTS_MAX_ATTEMPTS):
+            if attempt > 0:
+                retried += len(entries)
+                time.sleep(random.uniform(0, self.base_delay * (2 ** attempt)))
+            try:
+                response = self.event_backbone.put_events(Entries=entries)
+            except Exception as e:
+                logger.warning(f"put_events failed: {e}")
+                continue
+            if not response.get('FailedEntryCount'):
+                return response, retried, []
+            entries = [entry for entry, result in zip(entries, response['Entries']) if 'ErrorCode' in result]
+        logger.error(f"{len(entries)} car events not delivered after {EVENTS_MAX_ATTEMPTS} attempts")
+        return response, retried, entries
@@ -0,0 +1,73 @@
+"""
+Idempotency-Key support of the car writes, with the Powertools idempotency utility.
+
+A POST /cars or PUT /cars/<car_id> with an Idempotency-Key header runs once per key and route
+for IDEMPOTENCY_TTL_SECONDS: its response is stored in the IDEMPOTENCY_TABLE_NAME table, whose
+items expire with a TTL, and a retry gets the stored response, from the in-container cache when
+warm, without writing the car nor publishing its event. A retry arriving while the first request
+still runs fails with IdempotencyAlreadyInProgressError, the same key sent with another body with
+IdempotencyValidationError. Without IDEMPOTENCY_TABLE_NAME the header is ignored.
+"""
+import os
+
+from aws_lambda_powertools.utilities.idempotency import (DynamoDBPersistenceLayer, IdempotencyConfig,
+                                                         idempotent_function)
+
+import aws_clients
+
+IDEMPOTENCY_TABLE_NAME = os.environ.get("IDEMPOTENCY_TABLE_NAME", "")
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "3600"))
+# completed responses kept in the container, a replay found there makes no DynamoDB call
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "256"))
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+# set on the responses of a replayed request
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _markReplayed(response: dict, data_record) -> dict:
+    return dict(response, headers=dict(response["headers"], **{REPLAYED_HEADER: "true"}))
+
+
+def _execute(request: dict, execute) -> dict:
+    """The idempotent call: request is hashed into the key, execute() returns the response to store"""
+    return execute()
+
+
+class IdempotentWrites:
+
+    def __init__(self, definition: dict):
+        self.table_name = definition.get("table_name", IDEMPOTENCY_TABLE_NAME)
+        self._client = definition.get("client")
+        self.config = IdempotencyConfig(event_key_jmespath="[key, method, path]",
+                                        payload_validation_jmespath="body",
+                                        expires_after_seconds=definition.get("ttl", IDEMPOTENCY_TTL_SECONDS),
+                                        use_local_cache=True,
+                                        local_cache_max_items=definition.get("cache_size", IDEMPOTENCY_CACHE_SIZE),
+                                        response_hook=_markReplayed)
+        self._idempotent = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.table_name)
+
+    @property
+    def idempotent(self):
+        """_execute made idempotent, with its persistence layer built on first use like the other AWS clients"""
+        if self._idempotent is None:
+            persistence = DynamoDBPersistenceLayer(table_name=self.table_name,
+                                                   boto3_client=self._client or aws_clients.client('dynamodb'))
+            self._idempotent = idempotent_function(_execute, data_keyword_argument="request",
+                                                   persistence_store=persistence, config=self.config)
+        return self._idempotent
+
+    def run(self, key: str, method: str, path: str, body: str, execute, lambda_context) -> dict:
+        """
+        Return the response of execute(), a dict of statusCode, body and headers, stored under key,
+        method and path: execute() is only called by the first request of the key.
+        """
+        # an in progress record expires with the invocation, a timed out request can be retried
+        self.config.register_lambda_context(lambda_context)
+        return self.idempotent(request={"key": key, "method": method, "path": path, "body": body}, execute=execute)
+
+
+idempotent_writes = IdempotentWrites({})
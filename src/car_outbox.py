@@ -0,0 +1,73 @@
+"""
+Transactional outbox for the car events.
+
+In outbox mode the car item and its event record are written in the same DynamoDB transaction,
+so the API path does a single round trip and an event can not be lost between the two writes.
+The relay handler consumes the outbox table stream and forwards the events to EventBridge in batches.
+
+The records are keyed by car_id, with a sequence sort key starting with the car version: the
+records of one car share a partition, hence a stream shard, where they come in write order, so
+the events of a car are relayed in the order of its writes.
+"""
+import json, os, time, uuid
+from boto3.dynamodb.types import TypeDeserializer
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from car_event_producer import CarEventProducer
+import instrumentation
+
+logger = Logger()
+metrics = Metrics(namespace=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", "Powertools"))
+
+CAR_EVENT_OUTBOX = os.environ.get("CAR_EVENT_OUTBOX", "false").lower() == "true"
+OUTBOX_TABLE_NAME = os.environ.get("CAR_OUTBOX_TABLE_NAME", "acm_car_outbox")
+# outbox records are removed by the DynamoDB TTL once relayed
+OUTBOX_TTL_SECONDS = int(os.environ.get("CAR_OUTBOX_TTL_SECONDS", "86400"))
+
+DEFAULT_EVENT_PRODUCER = {"event_bus": os.environ.get("CAR_EVENT_BUS","acm_cars")}
+
+_deserializer = TypeDeserializer()
+
+
+def outboxRecord(car_id: str, version: int, entry: dict) -> dict:
+    """Build the outbox item holding the PutEvents entry of the write of a car version"""
+    event_id = str(uuid.uuid4())
+    # the event_id keeps apart the records of a car created again, whose version restarts at 1
+    return {"car_id": car_id,
+            "sequence": f"{int(version):012d}#{event_id}",
+            "event_id": event_id,
+            "entry": json.dumps(entry),
+            "expires_at": int(time.time()) + OUTBOX_TTL_SECONDS}
+
+
+event_producer = CarEventProducer(DEFAULT_EVENT_PRODUCER)
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Forward the inserted outbox records to EventBridge.
+    Undelivered events are reported as batch item failures from the first failing record,
+    so the stream retries them in order.
+    """
+    pending = []
+    for record in event.get("Records", []):
+        if record.get("eventName") != "INSERT":
+            continue
+        image = record["dynamodb"]["NewImage"]
+        entry = json.loads(_deserializer.deserialize(image["entry"]))
+        pending.append((record["dynamodb"]["SequenceNumber"], entry))
+        event_producer.bufferEntry(entry)
+    stats = event_producer.flush()
+    metrics.add_metric(name="OutboxEventsRelayed", unit=MetricUnit.Count, value=stats["sent"])
+    metrics.add_metric(name="OutboxEventsRetried", unit=MetricUnit.Count, value=stats["retried"])
+    instrumentation.publish(metrics)
+    failed = [sequence for sequence, entry in pending
+              if any(entry is undelivered for undelivered in event_producer.failed_entries)]
+    if failed:
+        return {"batchItemFailures": [{"itemIdentifier": failed[0]}]}
+    return {"batchItemFailures": []}
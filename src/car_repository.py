@@ -1,40 +1,671 @@
-
 from aws_lambda_powertools import Logger
 logger = Logger()
-import datetime
+import abc, base64, datetime, json, math, os, random, time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key, Attr
+from parallel_scan import parallelScan, DEFAULT_SEGMENTS
+from car_outbox import outboxRecord, OUTBOX_TABLE_NAME
+from fleet_stats import (CAR_FLEET_STATS, STATS_TABLE_NAME, STATS_KEY, STATS_FIELDS, addStatsArgs, countCars,
+                         fleetStats, statsDelta)
+from ttl_cache import TTLCache
+import aws_clients
+import geo
+
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("CARS_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+
+GEO_INDEX_NAME = os.environ.get("CAR_GEO_INDEX", "geo_cell-index")
+# precision 5 cells are about 4.9 km wide at the equator
+GEO_CELL_PRECISION = int(os.environ.get("CAR_GEO_CELL_PRECISION", "5"))
+# cells read by a nearby query at the equator, the limit grows toward the poles as the cells narrow
+MAX_NEARBY_CELLS = 64
+# above this latitude the limit stops growing
+NEARBY_CELLS_MAX_LATITUDE = 80.0
+
+BATCH_WRITE_SIZE = 25  # DynamoDB BatchWriteItem limit
+BATCH_GET_SIZE = 100  # DynamoDB BatchGetItem limit
+BATCH_MAX_ATTEMPTS = int(os.environ.get("BATCH_MAX_ATTEMPTS", "6"))
+BATCH_BASE_DELAY = 0.05
+# read-through cache of getCarUsingCarId, a size of 0 disables it
+CAR_CACHE_SIZE = int(os.environ.get("CAR_CACHE_SIZE", "1000"))
+CAR_CACHE_TTL_SECONDS = float(os.environ.get("CAR_CACHE_TTL_SECONDS", "5"))
+
+UPDATE_MAX_ATTEMPTS = 3
+# attributes managed by the repository, never taken from the client
+SERVER_ATTRIBUTES = ("car_id", "created_at", "updated_at", "version", "geohash", "geo_cell", "distance_m",
+                     "telemetry_ts")
+
+# attributes changed by every write, enough to tell whether a car changed
+VERSION_FIELDS = ["version", "updated_at"]
+
+TRANSACTION_PAIRS = 50  # TransactWriteItems accepts 100 items: 50 cars and their events
+
+# storage of the cars: dynamodb, or memory and sqlite for local runs and benchmarks
+CAR_REPOSITORY_BACKEND = os.environ.get("CAR_REPOSITORY_BACKEND", "dynamodb")
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class NearbyAreaTooLargeError(ValueError):
+    pass
+
+
+def nearbyCells(latitude: float, longitude: float, radius: float) -> set:
+    """
+    The geo cells covering the circle. A cover has more cells at high latitudes for the same radius,
+    the cells being narrower, so the limit is MAX_NEARBY_CELLS scaled by the same factor: every
+    radius served at the equator is served up to NEARBY_CELLS_MAX_LATITUDE.
+    """
+    cells = geo.coveringCells(latitude, longitude, radius, GEO_CELL_PRECISION)
+    widest = min(abs(latitude) + math.degrees(radius / geo.EARTH_RADIUS_M), NEARBY_CELLS_MAX_LATITUDE)
+    limit = int(MAX_NEARBY_CELLS / math.cos(math.radians(widest)))
+    if len(cells) > limit:
+        raise NearbyAreaTooLargeError(f"radius {radius} covers {len(cells)} geo cells at latitude {latitude}, "
+                                      f"more than {limit}, use a smaller radius")
+    return cells
+
+
+def encodeCursor(lastEvaluatedKey: dict) -> str:
+    """Build an opaque pagination cursor from a DynamoDB LastEvaluatedKey"""
+    if not lastEvaluatedKey:
+        return None
+    raw = json.dumps(lastEvaluatedKey, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decodeCursor(cursor: str) -> dict:
+    """Return the ExclusiveStartKey hidden in a cursor built by encodeCursor"""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError(f"invalid cursor: {cursor}") from e
+    # a scan of the cars table resumes from its key only
+    if not isinstance(key, dict) or key.keys() != {"car_id"} or not isinstance(key["car_id"], str):
+        raise InvalidCursorError(f"invalid cursor: {cursor}")
+    return key
+
+
+def withGeoIndex(car: dict) -> dict:
+    """Set the geohash and the indexed geo_cell of a car from its position"""
+    position = geo.parseCoordinates(car.get('latitude'), car.get('longitude'))
+    if position is None:
+        car.pop('geohash', None)
+        car.pop('geo_cell', None)
+    else:
+        car['geohash'] = geo.encodeGeohash(*position)
+        car['geo_cell'] = car['geohash'][:GEO_CELL_PRECISION]
+    return car
+
+
+def batchWriteItems(client, table_name: str, items: list, max_attempts: int = BATCH_MAX_ATTEMPTS,
+                    base_delay: float = BATCH_BASE_DELAY) -> dict:
+    """
+    Put items in BATCH_WRITE_SIZE chunks with BatchWriteItem, retrying the UnprocessedItems
+    with exponential backoff and full jitter.
+    Return the items that could not be written, as a dict car_id -> error message.
+    """
+    failed = {}
+    for start in range(0, len(items), BATCH_WRITE_SIZE):
+        requests = [{"PutRequest": {"Item": item}} for item in items[start:start + BATCH_WRITE_SIZE]]
+        attempt = 0
+        while requests:
+            try:
+                response = client.batch_write_item(RequestItems={table_name: requests})
+            except Exception as e:
+                logger.warning(f"batch write failed: {e}")
+                for request in requests:
+                    failed[request["PutRequest"]["Item"]["car_id"]] = str(e)
+                break
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            attempt += 1
+            if requests and attempt >= max_attempts:
+                for request in requests:
+                    failed[request["PutRequest"]["Item"]["car_id"]] = "unprocessed after retries"
+                break
+            if requests:
+                time.sleep(random.uniform(0, base_delay * (2 ** attempt)))
+    return failed
+
+
+def projectionArgs(fields: list) -> dict:
+    """
+    Build the ProjectionExpression reading only fields, plus car_id. Every name goes through
+    ExpressionAttributeNames, as some car attributes like status are DynamoDB reserved words.
+    """
+    if not fields:
+        return {}
+    names = {}
+    for attribute in ["car_id"] + [f for f in fields if f != "car_id"]:
+        names[f"#p{len(names)}"] = attribute
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+
+def project(car: dict, fields: list) -> dict:
+    """Keep only car_id and fields of a car read in full"""
+    if not fields:
+        return car
+    return {k: v for k, v in car.items() if k == "car_id" or k in fields}
+
+
+class CarVersionConflictError(Exception):
+    """The car was modified since the version the update is based on"""
+    pass
+
+
+class CarNotFoundError(KeyError):
+    pass
+
+
+@dataclass
+class CarUpdate:
+    """A planned partial update: the changed attributes of a car and the version they apply to"""
+    car_id: str
+    current: dict
+    changes: dict
+    expected_version: int
+    car: dict = field(default_factory=dict)
+
+    @property
+    def version(self) -> int:
+        return self.expected_version + 1 if self.changes else self.expected_version
+
+
+def _sameValue(a, b) -> bool:
+    numbers = (int, float, Decimal)
+    if isinstance(a, numbers) and isinstance(b, numbers) and not isinstance(a, bool) and not isinstance(b, bool):
+        return Decimal(str(a)) == Decimal(str(b))
+    return a == b
+
+
+def _isConditionFailure(e: ClientError) -> bool:
+    code = e.response.get("Error", {}).get("Code")
+    if code == "ConditionalCheckFailedException":
+        return True
+    reasons = e.response.get("CancellationReasons", [])
+    return code == "TransactionCanceledException" and any(r.get("Code") == "ConditionalCheckFailed" for r in reasons)
+
+
+class CarRepositoryBackend(abc.ABC):
+    """
+    Storage independent part of the car repositories: the read-through cache, the partial
+    update planning, the pagination helpers and the fleet statistics. A backend implements the
+    storage access: getCarsPage, _readCar, createCar, createCars, applyUpdate, recordTelemetry,
+    deleteCar and findCarsNearby, with the semantics of the DynamoDB CarRepository, and the
+    counters storage: _addStats, _readStats and _replaceStats.
+    """
+
+    def __init__(self, definition: dict):
+        self.cache = TTLCache(max_size=definition.get("cache_size", CAR_CACHE_SIZE),
+                              ttl=definition.get("cache_ttl", CAR_CACHE_TTL_SECONDS))
+        # fleet counters maintained by every car write
+        self.fleet_stats = definition.get("fleet_stats", CAR_FLEET_STATS)
+        # callbacks of the (before, after) pairs of every write, see observeWrites
+        self.write_observers = []
+
+    @abc.abstractmethod
+    def getCarsPage(self, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, fields: list = None):
+        ...
+
+    @abc.abstractmethod
+    def _readCar(self, car_id: str, fields: list = None, consistent: bool = False) -> dict:
+        """Return the stored car, None when it does not exist"""
 
+    @abc.abstractmethod
+    def createCar(self, car: dict, outbox_entry: dict = None):
+        ...
+
+    @abc.abstractmethod
+    def createCars(self, cars: list, outbox_entries: list = None) -> list:
+        ...
+
+    @abc.abstractmethod
+    def applyUpdate(self, update: CarUpdate, outbox_entry: dict = None):
+        ...
+
+    @abc.abstractmethod
+    def recordTelemetry(self, sample: dict):
+        ...
+
+    @abc.abstractmethod
+    def deleteCar(self, car_id: str):
+        ...
+
+    @abc.abstractmethod
+    def findCarsNearby(self, latitude: float, longitude: float, radius: float, status: str = None, limit: int = None):
+        ...
+
+    @abc.abstractmethod
+    def _addStats(self, delta: dict):
+        """Add delta to the stored fleet counters"""
+
+    @abc.abstractmethod
+    def _readStats(self) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def _replaceStats(self, counters: dict):
+        ...
+
+    def observeWrites(self, observer):
+        """Call observer(changes) after every write, with the (before, after) pairs of the written cars"""
+        self.write_observers.append(observer)
+
+    def _carsWritten(self, changes: list):
+        """Apply the (before, after) pairs of written cars, None for a missing car, to the counters and the observers"""
+        self._updateStats(changes)
+        for observer in self.write_observers:
+            try:
+                observer(changes)
+            except Exception as e:
+                # the car is written, an observer only keeps a derived view of it
+                logger.warning(f"car write observer failed: {e}")
+
+    def _updateStats(self, changes: list):
+        """Apply the counter changes of the (before, after) pairs of written cars"""
+        if not self.fleet_stats:
+            return
+        delta = {}
+        for before, after in changes:
+            for name, count in statsDelta(before, after).items():
+                delta[name] = delta.get(name, 0) + count
+        delta = {name: count for name, count in delta.items() if count}
+        if delta:
+            self._addStats(delta)
+
+    def getFleetStats(self) -> dict:
+        """Cars by status, model and bike rack, read from the counters"""
+        return fleetStats(self._readStats())
+
+    def rebuildFleetStats(self, segments: int = 1) -> dict:
+        """
+        Recompute the counters from a scan of the fleet and replace the stored ones.
+        Cars written during the scan may be missed, rebuild when the writes are quiet.
+        """
+        counters = countCars(self.iterFleetPages(segments=segments, fields=STATS_FIELDS))
+        counters["rebuilt_at"] = datetime.datetime.now().isoformat()
+        self._replaceStats(counters)
+        return fleetStats(counters)
+
+    def iterCarPages(self, page_size: int = DEFAULT_PAGE_SIZE, cursor: str = None, fields: list = None):
+        """Lazily yield the fleet page by page so only one page is kept in memory"""
+        while True:
+            cars, cursor = self.getCarsPage(limit=page_size, cursor=cursor, fields=fields)
+            if cars:
+                yield cars
+            if cursor is None:
+                return
+
+    def iterFleetPages(self, segments: int = 1, fields: list = None):
+        """Yield the pages of a full fleet read, in no particular order, a scan with segments workers when supported"""
+        return self.iterCarPages(page_size=MAX_PAGE_SIZE, fields=fields)
+
+    def getAllCars(self, segments: int = 1, fields: list = None):
+        """Read the full fleet, with a parallel scan when segments > 1 and the backend supports it"""
+        cars = []
+        for page in self.iterFleetPages(segments=segments, fields=fields):
+            cars.extend(page)
+        return cars
+
+    def getCarUsingCarId(self, car_id: str, fields: list = None):
+        cached = self.cache.get(car_id)
+        if cached is not None:
+            return project(dict(cached), fields)
+        car = self._readCar(car_id, fields=fields)
+        logger.debug(car)
+        if car is None:
+            raise CarNotFoundError(car_id)
+        # a partial item is returned as is, it does not go to the cache
+        if not fields:
+            self.cache.put(car_id, dict(car))
+        return car
+
+    def getCarVersion(self, car_id: str) -> dict:
+        """The car_id and VERSION_FIELDS of a car, from the cache or a projected read"""
+        cached = self.cache.get(car_id)
+        if cached is not None:
+            return project(cached, VERSION_FIELDS)
+        car = self._readCar(car_id, fields=VERSION_FIELDS)
+        if car is None:
+            raise CarNotFoundError(car_id)
+        return car
+
+    def planUpdate(self, car: dict, expected_version: int = None) -> CarUpdate:
+        """
+        Read the current car and compute the attributes of car that differ from it.
+        expected_version is the version the client based its changes on, the current one when None.
+        """
+        car_id = car['car_id']
+        current = self._readCar(car_id, consistent=True)
+        if current is None:
+            return CarUpdate(car_id=car_id, current=None, changes=dict(car), expected_version=0, car=dict(car))
+        current_version = int(current.get('version', 0))
+        if expected_version is not None and expected_version != current_version:
+            raise CarVersionConflictError(f"car {car_id} is at version {current_version}, not {expected_version}")
+        changes = {k: v for k, v in car.items()
+                   if k not in SERVER_ATTRIBUTES and not _sameValue(current.get(k), v)}
+        merged = {k: v for k, v in {**current, **changes}.items() if v is not None}
+        if 'latitude' in changes or 'longitude' in changes:
+            withGeoIndex(merged)
+            for attribute in ('geohash', 'geo_cell'):
+                if not _sameValue(current.get(attribute), merged.get(attribute)):
+                    changes[attribute] = merged.get(attribute)
+        return CarUpdate(car_id=car_id, current=current, changes=changes, expected_version=current_version, car=merged)
+
+    def updateCar(self, car: dict, outbox_entry: dict = None) -> CarUpdate:
+        """
+        Write only the attributes of car that changed, nothing when the car is unchanged.
+        A version in car is the expected current version, otherwise the update is retried
+        on concurrent modifications.
+        """
+        car = dict(car)
+        expected_version = car.pop('version', None)
+        for attempt in range(UPDATE_MAX_ATTEMPTS):
+            update = self.planUpdate(car, expected_version=None if expected_version is None else int(expected_version))
+            try:
+                self.applyUpdate(update, outbox_entry=outbox_entry)
+                return update
+            except CarVersionConflictError:
+                if expected_version is not None or attempt == UPDATE_MAX_ATTEMPTS - 1:
+                    raise
+
+
+class CarRepository(CarRepositoryBackend):
+    """Cars persisted in a DynamoDB table"""
 
-class CarRepository:
-    
     def __init__(self, table_resource):
+        super().__init__(table_resource)
         self.table_name = table_resource["table_name"]
-        self.resource = table_resource["resource"]
-        self.table = self.resource.Table(self.table_name)
+        # the DynamoDB resource and table are created on first use, not on cold start
+        self._resource = table_resource.get("resource")
+        self._table = None
+        self.outbox_table_name = table_resource.get("outbox_table_name", OUTBOX_TABLE_NAME)
+        self.stats_table_name = table_resource.get("stats_table_name", STATS_TABLE_NAME)
 
+    @property
+    def resource(self):
+        if self._resource is None:
+            self._resource = aws_clients.resource('dynamodb')
+        return self._resource
 
-    def getAllCars(self):
-        cars = self.table.scan()
-        return cars['Items']
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = self.resource.Table(self.table_name)
+        return self._table
 
-    def getCarUsingCarId(self, car_id: str):
-        car = self.table.get_item( Key={"car_id": car_id})
-        logger.debug(car)
-        return car['Item']
 
-    def createCar(self, car: dict):
+    def getCarsPage(self, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, fields: list = None):
+        """
+        Read one page of cars, at most limit items, starting after the cursor.
+        Return the cars and the cursor of the next page, None when the scan is complete.
+        With fields, only those attributes and car_id are read.
+        """
+        scan_args = {"Limit": max(1, min(limit, MAX_PAGE_SIZE)), **projectionArgs(fields)}
+        start_key = decodeCursor(cursor)
+        if start_key:
+            scan_args["ExclusiveStartKey"] = start_key
+        page = self.table.scan(**scan_args)
+        return page['Items'], encodeCursor(page.get('LastEvaluatedKey'))
+
+    def parallelScan(self, total_segments: int = DEFAULT_SEGMENTS, page_size: int = None, max_in_flight: int = None,
+                     fields: list = None):
+        """Stream the fleet pages from total_segments concurrent scan workers"""
+        return parallelScan(self.resource.meta.client, self.table_name, total_segments=total_segments,
+                            page_size=page_size, max_in_flight=max_in_flight, deserialize=False,
+                            **projectionArgs(fields))
+
+    def _readCar(self, car_id: str, fields: list = None, consistent: bool = False) -> dict:
+        # the resource client, unlike the Table resource, may be shared by concurrent threads
+        return self.resource.meta.client.get_item(TableName=self.table_name, Key={"car_id": car_id},
+                                                  ConsistentRead=consistent, **projectionArgs(fields)).get('Item')
+
+    def findCarsNearby(self, latitude: float, longitude: float, radius: float, status: str = None, limit: int = None):
+        """
+        Query the geo cells covering the circle and return the cars within radius meters,
+        nearest first, each with its distance_m.
+        """
+        cells = nearbyCells(latitude, longitude, radius)
+        query_args = {"IndexName": GEO_INDEX_NAME}
+        if status:
+            query_args["FilterExpression"] = Attr('status').eq(status)
+        found = []
+        for cell in cells:
+            args = dict(query_args, KeyConditionExpression=Key('geo_cell').eq(cell))
+            while True:
+                page = self.table.query(**args)
+                for car in page['Items']:
+                    position = geo.parseCoordinates(car.get('latitude'), car.get('longitude'))
+                    if position is None:
+                        continue
+                    d = geo.distance(latitude, longitude, *position)
+                    if d <= radius:
+                        car['distance_m'] = round(d, 1)
+                        found.append(car)
+                if 'LastEvaluatedKey' not in page:
+                    break
+                args['ExclusiveStartKey'] = page['LastEvaluatedKey']
+        found.sort(key=lambda car: car['distance_m'])
+        return found[:limit] if limit else found
+
+    def createCar(self, car: dict, outbox_entry: dict = None):
         car['created_at'] = datetime.datetime.now().isoformat()
         car['updated_at'] = datetime.datetime.now().isoformat()
+        car['version'] = 1
+        withGeoIndex(car)
         logger.debug(car)
-        carOut = self.table.put_item( Item=car)
+        if outbox_entry:
+            before = self._storedCars([car['car_id']]).get(car['car_id']) if self.fleet_stats else None
+            carOut = self._writeWithOutbox([car], [outbox_entry])
+        else:
+            carOut = self.table.put_item( Item=car, **({"ReturnValues": "ALL_OLD"} if self.fleet_stats else {}))
+            before = carOut.get('Attributes')
+        self.cache.invalidate(car['car_id'])
+        self._carsWritten([(before, car)])
         return carOut
 
-    def updateCar(self, car: dict):
-        car['updated_at'] = datetime.datetime.now().isoformat()
-        logger.debug(car)
-        carOut = self.table.put_item( Item=car)
+    def createCars(self, cars: list, outbox_entries: list = None) -> list:
+        """
+        Write the cars with batched puts and return one result per car, in order,
+        with the status created or failed.
+        With outbox_entries, one per car, each car is written with its event record in
+        transactions of TRANSACTION_PAIRS cars.
+        """
+        now = datetime.datetime.now().isoformat()
+        for car in cars:
+            car['created_at'] = now
+            car['updated_at'] = now
+            car['version'] = 1
+            withGeoIndex(car)
+        # a car may replace a stored one, its counters are moved rather than added
+        stored = self._storedCars([car['car_id'] for car in cars]) if self.fleet_stats else {}
+        if outbox_entries:
+            failed = {}
+            for start in range(0, len(cars), TRANSACTION_PAIRS):
+                chunk = cars[start:start + TRANSACTION_PAIRS]
+                try:
+                    self._writeWithOutbox(chunk, outbox_entries[start:start + TRANSACTION_PAIRS])
+                except Exception as e:
+                    logger.warning(f"outbox transaction failed: {e}")
+                    failed.update({car['car_id']: str(e) for car in chunk})
+        else:
+            failed = batchWriteItems(self.resource.meta.client, self.table_name, cars)
+        for car in cars:
+            self.cache.invalidate(car['car_id'])
+        self._carsWritten([(stored.get(car['car_id']), car) for car in cars if car['car_id'] not in failed])
+        return [{"car_id": car['car_id'], "status": "failed", "error": failed[car['car_id']]}
+                if car['car_id'] in failed else {"car_id": car['car_id'], "status": "created"}
+                for car in cars]
+
+    def applyUpdate(self, update: CarUpdate, outbox_entry: dict = None):
+        """
+        Write the changes of a planned update with UpdateItem, conditioned on the expected version,
+        or create the car when it does not exist. Raise CarVersionConflictError when the car changed.
+        """
+        if not update.changes:
+            return None
+        now = datetime.datetime.now().isoformat()
+        if update.current is None:
+            item = {k: v for k, v in update.car.items() if v is not None}
+            item.update(created_at=now, updated_at=now, version=1)
+            withGeoIndex(item)
+            write = {"TableName": self.table_name, "Item": item,
+                     "ConditionExpression": "attribute_not_exists(car_id)"}
+            operation = "Put"
+        else:
+            names = {"#car_id": "car_id", "#updated_at": "updated_at", "#version": "version"}
+            values = {":updated_at": now, ":next_version": update.expected_version + 1}
+            sets, removes = ["#updated_at = :updated_at", "#version = :next_version"], []
+            for i, (attribute, value) in enumerate(update.changes.items()):
+                names[f"#a{i}"] = attribute
+                if value is None:
+                    removes.append(f"#a{i}")
+                else:
+                    values[f":v{i}"] = value
+                    sets.append(f"#a{i} = :v{i}")
+            expression = "SET " + ", ".join(sets)
+            if removes:
+                expression += " REMOVE " + ", ".join(removes)
+            if update.expected_version:
+                condition = "attribute_exists(#car_id) AND #version = :expected_version"
+                values[":expected_version"] = update.expected_version
+            else:
+                condition = "attribute_exists(#car_id) AND attribute_not_exists(#version)"
+            write = {"TableName": self.table_name, "Key": {"car_id": update.car_id},
+                     "UpdateExpression": expression, "ConditionExpression": condition,
+                     "ExpressionAttributeNames": names, "ExpressionAttributeValues": values}
+            operation = "Update"
+        logger.debug(write)
+        try:
+            if outbox_entry:
+                carOut = self.resource.meta.client.transact_write_items(TransactItems=[
+                    {operation: write},
+                    {"Put": {"TableName": self.outbox_table_name, "Item": outboxRecord(update.car_id, update.version, outbox_entry)}}])
+            elif operation == "Put":
+                carOut = self.resource.meta.client.put_item(**write)
+            else:
+                carOut = self.resource.meta.client.update_item(**write)
+        except ClientError as e:
+            if _isConditionFailure(e):
+                raise CarVersionConflictError(f"car {update.car_id} changed since version {update.expected_version}") from e
+            raise
+        finally:
+            self.cache.invalidate(update.car_id)
+        update.car['updated_at'] = now
+        update.car['version'] = update.version
+        self._carsWritten([(update.current, update.car)])
         return carOut
-    
+
+    def recordTelemetry(self, sample: dict):
+        """
+        Write the position of a telemetry sample with one UpdateItem, conditioned on the sample
+        being newer than the last one recorded for the car. Only the position attributes, and the
+        status when the sample has one, are written and the version is incremented.
+        Return the outcome, written, stale or unknown (no such car), the car before and after the write.
+        """
+        car_id = sample['car_id']
+        timestamp = Decimal(str(sample['ts']))
+        changes = withGeoIndex({"latitude": str(sample['lat']), "longitude": str(sample['lon'])})
+        for attribute in ("nb_passengers", "status"):
+            if sample.get(attribute) is not None:
+                changes[attribute] = sample[attribute]
+        changes['updated_at'] = datetime.datetime.now().isoformat()
+        names = {"#car_id": "car_id", "#telemetry_ts": "telemetry_ts", "#version": "version"}
+        values = {":ts": timestamp, ":one": 1}
+        sets = ["#telemetry_ts = :ts"]
+        for i, (attribute, value) in enumerate(changes.items()):
+            names[f"#a{i}"] = attribute
+            values[f":v{i}"] = value
+            sets.append(f"#a{i} = :v{i}")
+        try:
+            response = self.resource.meta.client.update_item(
+                TableName=self.table_name, Key={"car_id": car_id},
+                UpdateExpression="SET " + ", ".join(sets) + " ADD #version :one",
+                ConditionExpression="attribute_exists(#car_id) AND (attribute_not_exists(#telemetry_ts) OR #telemetry_ts < :ts)",
+                ExpressionAttributeNames=names, ExpressionAttributeValues=values,
+                ReturnValues="ALL_OLD", ReturnValuesOnConditionCheckFailure="ALL_OLD")
+        except ClientError as e:
+            if _isConditionFailure(e):
+                return ("stale" if e.response.get("Item") else "unknown"), None, None
+            raise
+        finally:
+            self.cache.invalidate(car_id)
+        previous = response.get("Attributes", {})
+        car = dict(previous, **changes, telemetry_ts=timestamp, version=previous.get('version', 0) + 1)
+        self._carsWritten([(previous, car)])
+        return "written", previous, car
+
+    def _writeWithOutbox(self, cars: list, entries: list):
+        """Put the cars and their event records in the outbox table in one transaction"""
+        items = []
+        for car, entry in zip(cars, entries):
+            items.append({"Put": {"TableName": self.table_name, "Item": car}})
+            items.append({"Put": {"TableName": self.outbox_table_name, "Item": outboxRecord(car['car_id'], car['version'], entry)}})
+        return self.resource.meta.client.transact_write_items(TransactItems=items)
+
     def deleteCar(self, car_id: str):
-        car = self.table.delete_item( Key={"car_id": car_id})
+        # the deleted car is needed by the counters and the write observers
+        car = self.table.delete_item( Key={"car_id": car_id}, ReturnValues="ALL_OLD")
+        self.cache.invalidate(car_id)
+        self._carsWritten([(car.get('Attributes'), None)])
         return car
 
+    def _storedCars(self, car_ids: list) -> dict:
+        """The counted attributes of the stored cars among car_ids, by car_id"""
+        client = self.resource.meta.client
+        stored = {}
+        car_ids = list(dict.fromkeys(car_ids))
+        for start in range(0, len(car_ids), BATCH_GET_SIZE):
+            request = {self.table_name: {"Keys": [{"car_id": car_id} for car_id in car_ids[start:start + BATCH_GET_SIZE]],
+                                         "ConsistentRead": True, **projectionArgs(STATS_FIELDS)}}
+            for attempt in range(BATCH_MAX_ATTEMPTS):
+                if attempt > 0:
+                    time.sleep(random.uniform(0, BATCH_BASE_DELAY * (2 ** attempt)))
+                response = client.batch_get_item(RequestItems=request)
+                for car in response["Responses"].get(self.table_name, []):
+                    stored[car['car_id']] = car
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+        return stored
+
+    def _addStats(self, delta: dict):
+        try:
+            self.resource.meta.client.update_item(TableName=self.stats_table_name, **addStatsArgs(delta))
+        except Exception as e:
+            # the car is written, the drift is repaired by the next rebuild
+            logger.warning(f"fleet stats not updated: {e}", extra={"delta": delta})
+
+    def _readStats(self) -> dict:
+        return self.resource.meta.client.get_item(TableName=self.stats_table_name, Key=STATS_KEY).get('Item', {})
+
+    def _replaceStats(self, counters: dict):
+        self.resource.meta.client.put_item(TableName=self.stats_table_name, Item=dict(counters, **STATS_KEY))
+
+    def iterFleetPages(self, segments: int = 1, fields: list = None):
+        if segments <= 1:
+            return super().iterFleetPages(fields=fields)
+        return self.parallelScan(total_segments=segments, fields=fields)
+
+
+def newCarRepository(definition: dict) -> CarRepositoryBackend:
+    """
+    Create the repository of the backend named by definition["backend"], CAR_REPOSITORY_BACKEND
+    by default: dynamodb, memory or sqlite.
+    """
+    backend = definition.get("backend", CAR_REPOSITORY_BACKEND)
+    if backend == "dynamodb":
+        return CarRepository(definition)
+    # imported here as the local backends build on this module
+    import local_car_repository
+    if backend == "memory":
+        return local_car_repository.MemoryCarRepository(definition)
+    if backend == "sqlite":
+        return local_car_repository.SqliteCarRepository(definition)
+    raise ValueError(f"unknown car repository backend: {backend}")
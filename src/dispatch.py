@@ -0,0 +1,208 @@
+"""
+Dispatch of ride requests to the best available car.
+
+The dispatcher ranks the cars from a snapshot of the available ones held in numpy arrays, one
+row per car: position in radians, free seats and bike rack. The free seats are the seat capacity,
+seats or DISPATCH_DEFAULT_SEATS, less the nb_passengers on board. A request scores every
+eligible row at once, the distance plus DISPATCH_SEAT_PENALTY_M per seat left empty by the party,
+with an equirectangular distance to shortlist, then the haversine distance of the shortlist, and
+keeps the best DISPATCH_CANDIDATES within the radius.
+
+The snapshot is loaded with a projected scan of the fleet, then kept current incrementally from
+the writes of the container, seen through CarRepositoryBackend.observeWrites: a car becoming
+available gets a row, free rows are reused, a reserved or removed car loses its row. Writes by
+other containers are caught by a full reload every DISPATCH_RELOAD_SECONDS, and a car they took
+is dropped when its reservation fails.
+"""
+import os, threading, time
+
+import numpy as np
+from aws_lambda_powertools import Logger
+
+import geo
+
+logger = Logger()
+
+AVAILABLE = "Available"
+RESERVED = "Reserved"
+# attributes read by the snapshot scan
+SNAPSHOT_FIELDS = ["status", "latitude", "longitude", "nb_passengers", "seats", "bike_rack"]
+DISPATCH_RELOAD_SECONDS = float(os.environ.get("DISPATCH_RELOAD_SECONDS", "300"))
+DISPATCH_RADIUS_M = float(os.environ.get("DISPATCH_RADIUS_M", "5000"))
+# ranked cars a request tries to reserve, in score order
+DISPATCH_CANDIDATES = int(os.environ.get("DISPATCH_CANDIDATES", "8"))
+# a seat left empty weighs like this many meters of pickup distance
+DISPATCH_SEAT_PENALTY_M = float(os.environ.get("DISPATCH_SEAT_PENALTY_M", "200"))
+DISPATCH_SCAN_SEGMENTS = int(os.environ.get("DISPATCH_SCAN_SEGMENTS", "4"))
+# seat capacity of the cars stored without seats
+DISPATCH_DEFAULT_SEATS = int(os.environ.get("DISPATCH_DEFAULT_SEATS", "4"))
+
+
+def freeSeats(car: dict) -> int:
+    """The seats of car not taken by the passengers on board"""
+    return max(0, int(car.get('seats') or DISPATCH_DEFAULT_SEATS) - int(car.get('nb_passengers') or 0))
+
+
+class AvailableCars:
+    """Array backed set of the available cars, rows of removed cars are reused"""
+
+    def __init__(self, capacity: int = 1024):
+        self.car_ids = [None] * capacity
+        self.latitude = np.zeros(capacity)
+        self.longitude = np.zeros(capacity)
+        self.cos_latitude = np.zeros(capacity)
+        self.free_seats = np.zeros(capacity, dtype=np.int16)
+        self.bike_rack = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.rows = {}
+        self.free = []
+        # rows in use are below size
+        self.size = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def apply(self, car: dict):
+        """Add or move an available car, remove any other"""
+        position = geo.parseCoordinates(car.get('latitude'), car.get('longitude')) if car else None
+        if position is None or car.get('status', AVAILABLE) != AVAILABLE:
+            if car:
+                self.remove(car['car_id'])
+            return
+        row = self.rows.get(car['car_id'])
+        if row is None:
+            row = self.free.pop() if self.free else self._newRow()
+            self.rows[car['car_id']] = row
+            self.car_ids[row] = car['car_id']
+        latitude = np.radians(position[0])
+        self.latitude[row] = latitude
+        self.longitude[row] = np.radians(position[1])
+        self.cos_latitude[row] = np.cos(latitude)
+        self.free_seats[row] = freeSeats(car)
+        self.bike_rack[row] = bool(car.get('bike_rack'))
+        self.active[row] = True
+
+    def remove(self, car_id: str):
+        row = self.rows.pop(car_id, None)
+        if row is not None:
+            self.active[row] = False
+            self.car_ids[row] = None
+            self.free.append(row)
+
+    def _newRow(self) -> int:
+        if self.size == len(self.active):
+            self._grow(2 * len(self.active))
+        self.size += 1
+        return self.size - 1
+
+    def _grow(self, capacity: int):
+        self.car_ids.extend([None] * (capacity - len(self.car_ids)))
+        for name in ("latitude", "longitude", "cos_latitude", "free_seats", "bike_rack", "active"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def rank(self, latitude: float, longitude: float, party_size: int = 1, bike_rack: bool = False,
+             radius: float = DISPATCH_RADIUS_M, limit: int = DISPATCH_CANDIDATES) -> list:
+        """The best cars for a pickup, as (car_id, distance_m) by increasing score"""
+        n = self.size
+        phi, lam = np.radians(latitude), np.radians(longitude)
+        # the latitude band of the radius leaves out most of a large fleet before any arithmetic per car
+        eligible = np.abs(self.latitude[:n] - phi) <= radius / geo.EARTH_RADIUS_M
+        eligible &= self.active[:n]
+        eligible &= self.free_seats[:n] >= party_size
+        if bike_rack:
+            eligible &= self.bike_rack[:n]
+        rows = np.flatnonzero(eligible)
+        if not len(rows):
+            return []
+        # equirectangular distance, within a few meters of haversine over a dispatch radius, to shortlist
+        # wrapped into [-pi, pi) so that cars across the antimeridian are near, not a world away
+        dx = (self.longitude[rows] - lam + np.pi) % (2 * np.pi) - np.pi
+        dx *= np.cos(phi)
+        dy = self.latitude[rows] - phi
+        approximate = geo.EARTH_RADIUS_M * np.sqrt(dx * dx + dy * dy)
+        score = approximate + DISPATCH_SEAT_PENALTY_M * (self.free_seats[rows] - party_size)
+        shortlist = 4 * limit
+        if len(rows) > shortlist:
+            best = np.argpartition(score, shortlist)[:shortlist]
+            rows = rows[best]
+        # exact haversine distance and score of the shortlist
+        a = (np.sin((self.latitude[rows] - phi) / 2) ** 2
+             + np.cos(phi) * self.cos_latitude[rows] * np.sin((self.longitude[rows] - lam) / 2) ** 2)
+        distance = 2 * geo.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        within = distance <= radius
+        rows, distance = rows[within], distance[within]
+        score = distance + DISPATCH_SEAT_PENALTY_M * (self.free_seats[rows] - party_size)
+        if len(rows) > limit:
+            best = np.argpartition(score, limit)[:limit]
+            rows, distance, score = rows[best], distance[best], score[best]
+        order = np.argsort(score, kind="stable")
+        return [(self.car_ids[row], round(float(d), 1)) for row, d in zip(rows[order], distance[order])]
+
+
+class Dispatcher:
+    """The available cars snapshot of a repository, loaded on first use and reloaded periodically"""
+
+    def __init__(self, reload_seconds: float = DISPATCH_RELOAD_SECONDS, clock=time.monotonic):
+        self.reload_seconds = reload_seconds
+        self.clock = clock
+        self.cars = None
+        self.loaded_at = None
+        self.repository = None
+        self.lock = threading.Lock()
+        # writes seen while a reload scans the fleet, applied to the new snapshot
+        self.pending = None
+
+    def snapshot(self, repository) -> AvailableCars:
+        """The current snapshot of repository, loaded or reloaded when needed"""
+        if repository is not self.repository:
+            with self.lock:
+                self.repository, self.cars = repository, None
+            if self._carsWritten not in repository.write_observers:
+                repository.observeWrites(self._carsWritten)
+        if self.cars is None or self.clock() - self.loaded_at >= self.reload_seconds:
+            self.reload(repository)
+        return self.cars
+
+    def reload(self, repository):
+        """Rebuild the snapshot from a projected scan, the repository is never called under the lock"""
+        with self.lock:
+            self.pending = []
+        cars = AvailableCars()
+        start = self.clock()
+        for page in repository.iterFleetPages(segments=DISPATCH_SCAN_SEGMENTS, fields=SNAPSHOT_FIELDS):
+            for car in page:
+                cars.apply(car)
+        with self.lock:
+            for car in self.pending:
+                cars.apply(car)
+            self.cars, self.loaded_at, self.pending = cars, start, None
+        logger.info(f"dispatch snapshot of {len(cars)} available cars loaded")
+
+    def _carsWritten(self, changes: list):
+        with self.lock:
+            for before, after in changes:
+                if after is None and before is None:
+                    continue
+                # a deleted car is removed like an unavailable one
+                car = after if after is not None else dict(before, status=None)
+                if self.cars is not None:
+                    self.cars.apply(car)
+                if self.pending is not None:
+                    self.pending.append(car)
+
+    def rank(self, repository, *args, **kwargs) -> list:
+        cars = self.snapshot(repository)
+        with self.lock:
+            return cars.rank(*args, **kwargs)
+
+    def drop(self, car_id: str):
+        """Forget a car the snapshot wrongly holds as available"""
+        with self.lock:
+            if self.cars is not None:
+                self.cars.remove(car_id)
+
+
+dispatcher = Dispatcher()
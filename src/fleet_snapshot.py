@@ -0,0 +1,204 @@
+"""
+Materialized fleet snapshots for bulk readers.
+
+The builder scans the fleet page by page and streams it, gzip compressed, into a spooled
+temporary file uploaded to S3, so its memory stays bounded whatever the fleet size. Two formats:
+  - rows: one JSON car per line (NDJSON), the items of GET /cars
+  - columns: one JSON object {"count": n, "columns": {attribute: [values]}}, each column spooled
+    to its own temporary file during the scan and concatenated at the end
+A snapshot is versioned by a fingerprint of its cars, independent of the scan order: a build of
+an unchanged fleet keeps the current version. The latest version of each format is recorded in
+a small latest.json pointer, the only object GET /cars/snapshot reads.
+"""
+import datetime, gzip, hashlib, json, os, shutil, tempfile
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+import aws_clients
+from car_serializer import jsonSerializer
+from ttl_cache import TTLCache
+
+logger = Logger()
+metrics = Metrics(namespace=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", "Powertools"))
+
+SNAPSHOT_BUCKET = os.environ.get("CAR_SNAPSHOT_BUCKET", "acm-car-snapshots")
+SNAPSHOT_PREFIX = os.environ.get("CAR_SNAPSHOT_PREFIX", "snapshots/")
+SNAPSHOT_FORMATS = ("rows", "columns")
+# scan workers of a build
+SNAPSHOT_SEGMENTS = int(os.environ.get("CAR_SNAPSHOT_SEGMENTS", "4"))
+SNAPSHOT_URL_TTL_SECONDS = int(os.environ.get("CAR_SNAPSHOT_URL_TTL_SECONDS", "300"))
+# the latest.json pointers are cached this long by the API
+SNAPSHOT_POINTER_TTL_SECONDS = float(os.environ.get("CAR_SNAPSHOT_POINTER_TTL_SECONDS", "5"))
+# bytes kept in memory by a spooled file before it goes to disk
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+COLUMN_SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class Fingerprint:
+    """Order independent digest of the cars: the sum of their sha256, modulo 2**256"""
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, line: bytes):
+        self.value = (self.value + int.from_bytes(hashlib.sha256(line).digest(), "big")) % (1 << 256)
+
+    def hexdigest(self) -> str:
+        return f"{self.value:064x}"
+
+
+class RowWriter:
+    """Gzip NDJSON, one car per line"""
+    extension = "ndjson.gz"
+
+    def __init__(self, output):
+        self.stream = gzip.GzipFile(fileobj=output, mode="wb", mtime=0)
+
+    def addPage(self, cars: list, lines: list):
+        self.stream.write(b"\n".join(lines) + b"\n")
+
+    def close(self):
+        self.stream.close()
+
+
+class ColumnWriter:
+    """Gzip JSON of the columns, each column spooled to its own temporary file until close"""
+    extension = "json.gz"
+
+    def __init__(self, output):
+        self.output = output
+        self.columns = {}
+        self.count = 0
+
+    def addPage(self, cars: list, lines: list):
+        for car in cars:
+            for attribute in car.keys() - self.columns.keys():
+                # a column first seen in this page is null for the cars of the previous pages
+                column = self.columns[attribute] = tempfile.SpooledTemporaryFile(max_size=COLUMN_SPOOL_MAX_SIZE)
+                column.write(b",null" * self.count)
+        for attribute, column in self.columns.items():
+            # one encoding per column and page, not per value: "[a,b]" is written as ",a,b"
+            values = jsonSerializer([car.get(attribute) for car in cars]).encode("utf-8")
+            column.write(b"," + values[1:-1])
+        self.count += len(cars)
+
+    def close(self):
+        try:
+            with gzip.GzipFile(fileobj=self.output, mode="wb", mtime=0) as stream:
+                stream.write(f'{{"count":{self.count},"columns":{{'.encode("utf-8"))
+                for i, (attribute, column) in enumerate(sorted(self.columns.items())):
+                    stream.write((',' if i else '').encode("utf-8") + json.dumps(attribute).encode("utf-8") + b":[")
+                    column.seek(1)  # after the leading comma
+                    shutil.copyfileobj(column, stream)
+                    stream.write(b"]")
+                stream.write(b"}}")
+        finally:
+            for column in self.columns.values():
+                column.close()
+
+
+WRITERS = {"rows": RowWriter, "columns": ColumnWriter}
+
+
+class FleetSnapshotStore:
+    """The snapshots of a bucket: <prefix><format>/<version>.<extension> and <prefix><format>/latest.json"""
+
+    def __init__(self, definition: dict):
+        self.bucket = definition.get("bucket", SNAPSHOT_BUCKET)
+        self.prefix = definition.get("prefix", SNAPSHOT_PREFIX)
+        self._s3 = definition.get("client")
+        self.pointers = TTLCache(max_size=len(SNAPSHOT_FORMATS),
+                                 ttl=definition.get("pointer_ttl", SNAPSHOT_POINTER_TTL_SECONDS))
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = aws_clients.client('s3')
+        return self._s3
+
+    def pointerKey(self, format: str) -> str:
+        return f"{self.prefix}{format}/latest.json"
+
+    def latest(self, format: str) -> dict:
+        """The pointer to the latest snapshot of a format, None before the first build"""
+        pointer = self.pointers.get(format)
+        if pointer is None:
+            try:
+                response = self.s3.get_object(Bucket=self.bucket, Key=self.pointerKey(format))
+            except self.s3.exceptions.NoSuchKey:
+                return None
+            pointer = json.loads(response["Body"].read())
+            self.pointers.put(format, pointer)
+        return pointer
+
+    def presignedUrl(self, key: str, expires_in: int = SNAPSHOT_URL_TTL_SECONDS) -> str:
+        return self.s3.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key},
+                                              ExpiresIn=expires_in)
+
+    def build(self, pages, formats=SNAPSHOT_FORMATS) -> dict:
+        """
+        Stream the pages, in a single pass, into a snapshot of each format and publish them as the
+        latest ones. Return the pointers by format, the current one of a format when the fleet
+        did not change.
+        """
+        pointers = {}
+        outputs = {format: tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) for format in formats}
+        try:
+            writers = {format: WRITERS[format](output) for format, output in outputs.items()}
+            count, fingerprint = 0, Fingerprint()
+            for page in pages:
+                if not page:
+                    continue
+                lines = [jsonSerializer(car).encode("utf-8") for car in page]
+                for line in lines:
+                    fingerprint.add(line)
+                for writer in writers.values():
+                    writer.addPage(page, lines)
+                count += len(page)
+            version = fingerprint.hexdigest()[:32]
+            built_at = datetime.datetime.now().isoformat()
+            for format, writer in writers.items():
+                writer.close()
+                pointers[format] = self._publish(format, outputs[format], version, count, built_at)
+        finally:
+            for output in outputs.values():
+                output.close()
+        return pointers
+
+    def _publish(self, format: str, output, version: str, count: int, built_at: str) -> dict:
+        self.pointers.invalidate(format)
+        current = self.latest(format)
+        if current is not None and current["version"] == version:
+            logger.info(f"fleet unchanged, {format} snapshot {version} kept")
+            return current
+        size = output.tell()
+        output.seek(0)
+        key = f"{self.prefix}{format}/{version}.{WRITERS[format].extension}"
+        self.s3.upload_fileobj(output, self.bucket, key, ExtraArgs={"ContentType": "application/gzip"})
+        pointer = {"version": version, "format": format, "key": key, "count": count, "size": size,
+                   "built_at": built_at}
+        # the pointer is written after the snapshot, a reader never sees a missing version
+        self.s3.put_object(Bucket=self.bucket, Key=self.pointerKey(format), Body=json.dumps(pointer).encode("utf-8"),
+                           ContentType="application/json")
+        self.pointers.put(format, pointer)
+        return pointer
+
+
+snapshot_store = FleetSnapshotStore({})
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """Scheduled build of the fleet snapshots"""
+    # the repository is only needed by the builder, not by the API which reads the pointers
+    from car_repository import newCarRepository
+    repository = newCarRepository({"table_name": os.environ.get("CAR_TABLE_NAME", "acm_cars"), "cache_size": 0})
+    pointers = snapshot_store.build(repository.iterFleetPages(segments=SNAPSHOT_SEGMENTS))
+    for format, pointer in pointers.items():
+        logger.info(f"{format} snapshot {pointer['version']}", extra=pointer)
+    metrics.add_metric(name="SnapshotBytes", unit=MetricUnit.Bytes, value=sum(p["size"] for p in pointers.values()))
+    metrics.add_metric(name="SnapshotCars", unit=MetricUnit.Count, value=max(p["count"] for p in pointers.values()))
+    return pointers
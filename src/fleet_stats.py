@@ -0,0 +1,69 @@
+"""
+Fleet statistics kept as counters: number of cars by status, model and bike rack.
+
+The counters live in one item of the stats table, so reading them is a single GetItem whatever
+the fleet size. Each car write adds the difference between the car before and after it, with
+an atomic ADD of only the counters that changed. The counters are updated after the car write,
+not in its transaction, so a failed counter update leaves a drift, repaired by a rebuild from
+a full scan (e2e/RebuildFleetStats.py).
+"""
+import os
+from collections import Counter
+
+CAR_FLEET_STATS = os.environ.get("CAR_FLEET_STATS", "false").lower() == "true"
+STATS_TABLE_NAME = os.environ.get("CAR_STATS_TABLE_NAME", "acm_car_stats")
+STATS_KEY = {"stats_id": "fleet"}
+# car attributes counted, the only ones read by a rebuild
+STATS_FIELDS = ["status", "model", "bike_rack"]
+TOTAL = "total"
+
+
+def carCounters(car: dict) -> Counter:
+    """The counters a car contributes to, none for a missing car"""
+    if car is None:
+        return Counter()
+    counters = Counter({TOTAL: 1})
+    for attribute in ("status", "model"):
+        if car.get(attribute) is not None:
+            counters[f"{attribute}#{car[attribute]}"] = 1
+    counters[f"bike_rack#{'true' if car.get('bike_rack') else 'false'}"] = 1
+    return counters
+
+
+def statsDelta(before: dict, after: dict) -> dict:
+    """Counter increments turning the stats of car before into those of car after, without zeros"""
+    delta = carCounters(after)
+    delta.subtract(carCounters(before))
+    return {name: count for name, count in delta.items() if count}
+
+
+def countCars(pages) -> dict:
+    """Counters of all the cars of the pages"""
+    counters = Counter()
+    for page in pages:
+        for car in page:
+            counters.update(carCounters(car))
+    return dict(counters)
+
+
+def addStatsArgs(delta: dict) -> dict:
+    """UpdateItem arguments adding delta to the counters of the stats item"""
+    names, values, adds = {}, {}, []
+    for i, (name, count) in enumerate(delta.items()):
+        names[f"#c{i}"] = name
+        values[f":d{i}"] = count
+        adds.append(f"#c{i} :d{i}")
+    return {"Key": STATS_KEY, "UpdateExpression": "ADD " + ", ".join(adds),
+            "ExpressionAttributeNames": names, "ExpressionAttributeValues": values}
+
+
+def fleetStats(counters: dict) -> dict:
+    """Group the stored counters by attribute, dropping the ones back to zero"""
+    stats = {TOTAL: int(counters.get(TOTAL, 0)), "status": {}, "model": {}, "bike_rack": {}}
+    for name, count in counters.items():
+        attribute, _, value = name.partition("#")
+        if attribute in stats and value and int(count):
+            stats[attribute][value] = int(count)
+    if counters.get("rebuilt_at"):
+        stats["rebuilt_at"] = counters["rebuilt_at"]
+    return stats
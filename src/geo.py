@@ -0,0 +1,88 @@
+"""
+Geohash cells to index car positions, and great circle distances to rank them.
+"""
+import math
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_M = 6371008.8
+
+
+def encodeGeohash(latitude: float, longitude: float, precision: int = 9) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, rng = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def cellSize(precision: int):
+    """Return the (latitude, longitude) size in degrees of a geohash cell"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def coveringCells(latitude: float, longitude: float, radius_m: float, precision: int) -> set:
+    """Return the geohash cells, at the given precision, covering the circle bounding box"""
+    lat_size, lon_size = cellSize(precision)
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    lat_min = max(-90.0, latitude - dlat)
+    lat_max = min(90.0, latitude + dlat)
+    # longitude degrees shrink toward the poles, use the widest latitude of the box
+    widest = max(abs(lat_min), abs(lat_max))
+    cos_lat = math.cos(math.radians(min(widest, 89.9)))
+    dlon = min(180.0, math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)))
+    cells = set()
+    lat = _cellCenter(lat_min, -90.0, lat_size)
+    while lat - lat_size / 2 <= lat_max:
+        lon = _cellCenter(longitude - dlon, -180.0, lon_size)
+        while lon - lon_size / 2 <= longitude + dlon:
+            cells.add(encodeGeohash(min(lat, 90.0), _wrapLongitude(lon), precision))
+            lon += lon_size
+        lat += lat_size
+    return cells
+
+
+def _cellCenter(value: float, origin: float, size: float) -> float:
+    return origin + (math.floor((value - origin) / size) + 0.5) * size
+
+
+def _wrapLongitude(longitude: float) -> float:
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parseCoordinates(latitude, longitude):
+    """Return (lat, lon) as floats from the string attributes of a car, None when not a valid position"""
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
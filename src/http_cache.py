@@ -0,0 +1,49 @@
+"""
+HTTP caching of the read routes: strong ETags, If-None-Match matching and Cache-Control values.
+
+A car ETag is derived from the version and updated_at the repository sets on every write, so
+a poller's If-None-Match is answered from a projected read of those attributes, without
+reading nor serializing the car. A list has no version: its ETag is a digest of the
+serialized body, a 304 only saves the response bytes.
+"""
+import hashlib, os
+
+# Cache-Control of each route, an empty value sends none. no-cache lets the clients and API
+# Gateway keep a response, revalidated by each request with If-None-Match
+CAR_CACHE_CONTROL = os.environ.get("CAR_CACHE_CONTROL", "no-cache")
+CARS_CACHE_CONTROL = os.environ.get("CARS_CACHE_CONTROL", "no-cache")
+SNAPSHOT_CACHE_CONTROL = os.environ.get("SNAPSHOT_CACHE_CONTROL", "no-cache")
+
+
+def etagMatches(if_none_match: str, etag: str) -> bool:
+    """True when an If-None-Match header names the ETag, or is *"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def carETag(car: dict, fields: list = None) -> str:
+    """
+    ETag of a car, or of its projection on fields: its version and a digest of its updated_at,
+    which tells apart a car replaced by a create, back to version 1
+    """
+    digest = hashlib.sha1(f"{car.get('updated_at')}|{','.join(sorted(fields or []))}".encode("utf-8"))
+    return f'"{car.get("version", 0)}-{digest.hexdigest()[:12]}"'
+
+
+def bodyETag(body: str) -> str:
+    """ETag of a serialized response body"""
+    return f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()[:24]}"'
+
+
+def cacheHeaders(etag: str, cache_control: str) -> dict:
+    headers = {"ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return headers
@@ -0,0 +1,156 @@
+"""
+Per call instrumentation of the AWS clients used by the repositories and the event producer.
+
+instrument(client) hooks the botocore events of a client to record, for every call, the wall
+time including the SDK retries, the retry count, the DynamoDB consumed capacity (requested
+with ReturnConsumedCapacity) and the request and response payload sizes. The calls are
+aggregated per service and operation until the handler publishes them with publish(metrics):
+one metric blob per operation with the Service and Operation dimensions, and the same figures
+as X-Ray metadata. Each call also annotates its own botocore X-Ray subsegment.
+
+Switched on by CAR_INSTRUMENTATION=true, read on every call: when off, the hooks return at once.
+"""
+import os, threading, time
+
+from aws_lambda_powertools import Tracer
+from aws_lambda_powertools.metrics import EphemeralMetrics, Metrics, MetricUnit
+
+tracer = Tracer()
+
+# operations accepting ReturnConsumedCapacity
+CAPACITY_OPERATIONS = frozenset(("GetItem", "PutItem", "UpdateItem", "DeleteItem", "Query", "Scan",
+                                 "BatchGetItem", "BatchWriteItem", "TransactGetItems", "TransactWriteItems"))
+# keys of the botocore request context, kept from before-call to after-call
+_START = "instrumentation_start"
+_REQUEST_BYTES = "instrumentation_request_bytes"
+_MODEL = "instrumentation_model"
+
+
+def enabled() -> bool:
+    return os.environ.get("CAR_INSTRUMENTATION", "false").lower() == "true"
+
+
+class CallStats:
+    """Calls aggregated by (service, operation), shared by the threads of an invocation"""
+
+    FIELDS = ("calls", "errors", "time_ms", "max_ms", "retries", "capacity", "request_bytes", "response_bytes")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def record(self, service: str, operation: str, elapsed_ms: float, retries: int = 0, capacity: float = 0,
+               request_bytes: int = 0, response_bytes: int = 0, error: bool = False):
+        with self.lock:
+            stats = self.operations.get((service, operation))
+            if stats is None:
+                stats = self.operations[(service, operation)] = dict.fromkeys(self.FIELDS, 0)
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["time_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["retries"] += retries
+            stats["capacity"] += capacity
+            stats["request_bytes"] += request_bytes
+            stats["response_bytes"] += response_bytes
+
+    def drain(self) -> dict:
+        """Return the stats recorded since the last drain, by (service, operation), and reset them"""
+        with self.lock:
+            operations, self.operations = self.operations, {}
+        return operations
+
+
+stats = CallStats()
+
+
+def _consumedCapacity(parsed: dict) -> float:
+    consumed = parsed.get("ConsumedCapacity")
+    if consumed is None:
+        return 0
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(c.get("CapacityUnits", 0) for c in consumed)
+
+
+def _provideParams(params: dict, model, **kwargs):
+    if enabled() and model.name in CAPACITY_OPERATIONS:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _beforeCall(model, params: dict, context: dict, **kwargs):
+    if enabled():
+        # after-call-error does not receive the operation model
+        context[_MODEL] = model
+        context[_REQUEST_BYTES] = len(params.get("body") or b"")
+        context[_START] = time.perf_counter()
+
+
+def _afterCall(http_response, parsed: dict, model, context: dict, **kwargs):
+    start = context.pop(_START, None)
+    if start is None:
+        return
+    context.pop(_MODEL, None)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    service = model.service_model.service_name
+    call = {"retries": parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+            "capacity": _consumedCapacity(parsed),
+            "request_bytes": context.pop(_REQUEST_BYTES, 0),
+            "response_bytes": len(http_response.content or b"")}
+    stats.record(service, model.name, elapsed_ms, **call)
+    # inside the subsegment of the call, when botocore is traced
+    tracer.put_metadata(key=model.name, value=dict(call, time_ms=round(elapsed_ms, 3)), namespace=service)
+
+
+def _afterCallError(exception, context: dict, **kwargs):
+    start = context.pop(_START, None)
+    if start is None:
+        return
+    model = context.pop(_MODEL)
+    stats.record(model.service_model.service_name, model.name, (time.perf_counter() - start) * 1000,
+                 request_bytes=context.pop(_REQUEST_BYTES, 0), error=True)
+
+
+def instrument(client):
+    """Register the instrumentation hooks on a boto3 client, once, and return the client"""
+    if getattr(client.meta, "instrumented", False):
+        return client
+    events = client.meta.events
+    service_id = client.meta.service_model.service_id.hyphenize()
+    if service_id == "dynamodb":
+        events.register("provide-client-params.dynamodb", _provideParams, unique_id="instrumentation-capacity")
+    events.register("before-call", _beforeCall, unique_id="instrumentation-before")
+    events.register("after-call", _afterCall, unique_id="instrumentation-after")
+    events.register("after-call-error", _afterCallError, unique_id="instrumentation-error")
+    client.meta.instrumented = True
+    return client
+
+
+def publish(metrics: Metrics) -> dict:
+    """
+    Emit the calls recorded since the last publication, one metric blob per operation in the
+    namespace of metrics, and return them by "service.operation"
+    """
+    operations = stats.drain()
+    summary = {}
+    for (service, operation), call in operations.items():
+        summary[f"{service}.{operation}"] = call
+        # the dimensions of a Metrics object apply to all its metrics, each operation gets its own blob
+        blob = EphemeralMetrics(namespace=metrics.namespace, service=metrics.service)
+        for name, value in metrics.default_dimensions.items():
+            blob.add_dimension(name=name, value=value)
+        blob.add_dimension(name="Service", value=service)
+        blob.add_dimension(name="Operation", value=operation)
+        blob.add_metric(name="AwsCalls", unit=MetricUnit.Count, value=call["calls"])
+        blob.add_metric(name="AwsCallErrors", unit=MetricUnit.Count, value=call["errors"])
+        blob.add_metric(name="AwsCallTime", unit=MetricUnit.Milliseconds, value=round(call["time_ms"], 3))
+        blob.add_metric(name="AwsCallMaxTime", unit=MetricUnit.Milliseconds, value=round(call["max_ms"], 3))
+        blob.add_metric(name="AwsCallRetries", unit=MetricUnit.Count, value=call["retries"])
+        blob.add_metric(name="AwsRequestBytes", unit=MetricUnit.Bytes, value=call["request_bytes"])
+        blob.add_metric(name="AwsResponseBytes", unit=MetricUnit.Bytes, value=call["response_bytes"])
+        if service == "dynamodb":
+            blob.add_metric(name="ConsumedCapacity", unit=MetricUnit.Count, value=call["capacity"])
+        blob.flush_metrics()
+    if summary:
+        tracer.put_metadata(key="aws_calls", value=summary)
+    return summary
@@ -0,0 +1,326 @@
+"""
+In-process car repositories, for local runs, tests and benchmarks without DynamoDB latency.
+
+Both backends keep the semantics of the DynamoDB CarRepository: pagination cursors, versions
+and conditional updates, telemetry ordering, geo cells for the nearby lookups, outbox records
+written with the car, fleet counters and write observers updated once it is committed. Cars
+are scanned in car_id order.
+"""
+import abc, datetime, json, os, sqlite3, threading
+
+from aws_lambda_powertools import Logger
+
+from car_repository import (CarRepositoryBackend, CarUpdate, CarVersionConflictError, DEFAULT_PAGE_SIZE,
+                            MAX_PAGE_SIZE, decodeCursor, encodeCursor, nearbyCells,
+                            project, withGeoIndex)
+from car_outbox import outboxRecord
+from car_serializer import jsonSerializer
+import geo
+
+logger = Logger()
+
+CAR_SQLITE_PATH = os.environ.get("CAR_SQLITE_PATH", ":memory:")
+
+
+class LocalCarRepository(CarRepositoryBackend):
+    """
+    Repository logic shared by the local backends. A backend stores plain dicts and implements
+    _get, _put, _delete, _scanAfter, _carsInCells, _appendOutbox and the counters storage;
+    every write runs under _transaction, which makes its read, check and write atomic.
+    """
+
+    @abc.abstractmethod
+    def _transaction(self):
+        ...
+
+    @abc.abstractmethod
+    def _get(self, car_id: str) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def _put(self, car: dict):
+        ...
+
+    @abc.abstractmethod
+    def _delete(self, car_id: str) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def _scanAfter(self, car_id: str, limit: int) -> list:
+        """Return up to limit cars with a car_id greater than car_id, ordered by car_id"""
+
+    @abc.abstractmethod
+    def _carsInCells(self, cells: set) -> list:
+        ...
+
+    @abc.abstractmethod
+    def _appendOutbox(self, record: dict):
+        ...
+
+    def getCarsPage(self, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, fields: list = None):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        start_key = decodeCursor(cursor)
+        cars = self._scanAfter(start_key['car_id'] if start_key else None, limit + 1)
+        next_cursor = encodeCursor({"car_id": cars[limit - 1]['car_id']}) if len(cars) > limit else None
+        return [project(car, fields) for car in cars[:limit]], next_cursor
+
+    def _readCar(self, car_id: str, fields: list = None, consistent: bool = False) -> dict:
+        car = self._get(car_id)
+        return None if car is None else project(car, fields)
+
+    def findCarsNearby(self, latitude: float, longitude: float, radius: float, status: str = None, limit: int = None):
+        cells = nearbyCells(latitude, longitude, radius)
+        found = []
+        for car in self._carsInCells(cells):
+            if status and car.get('status') != status:
+                continue
+            position = geo.parseCoordinates(car.get('latitude'), car.get('longitude'))
+            if position is None:
+                continue
+            d = geo.distance(latitude, longitude, *position)
+            if d <= radius:
+                car['distance_m'] = round(d, 1)
+                found.append(car)
+        found.sort(key=lambda car: car['distance_m'])
+        return found[:limit] if limit else found
+
+    def _stored(self, car_id: str) -> dict:
+        """The car a create replaces, only read when its counters must be moved"""
+        return self._get(car_id) if self.fleet_stats else None
+
+    def _newCar(self, car: dict, now: str) -> dict:
+        car['created_at'] = now
+        car['updated_at'] = now
+        car['version'] = 1
+        return withGeoIndex(car)
+
+    def createCar(self, car: dict, outbox_entry: dict = None):
+        self._newCar(car, datetime.datetime.now().isoformat())
+        with self._transaction():
+            before = self._stored(car['car_id'])
+            self._put(car)
+            if outbox_entry:
+                self._appendOutbox(outboxRecord(car['car_id'], car['version'], outbox_entry))
+        self.cache.invalidate(car['car_id'])
+        self._carsWritten([(before, car)])
+
+    def createCars(self, cars: list, outbox_entries: list = None) -> list:
+        now = datetime.datetime.now().isoformat()
+        with self._transaction():
+            changes = []
+            for i, car in enumerate(cars):
+                changes.append((self._stored(car['car_id']), self._newCar(car, now)))
+                self._put(car)
+                if outbox_entries:
+                    self._appendOutbox(outboxRecord(car['car_id'], car['version'], outbox_entries[i]))
+        for car in cars:
+            self.cache.invalidate(car['car_id'])
+        self._carsWritten(changes)
+        return [{"car_id": car['car_id'], "status": "created"} for car in cars]
+
+    def applyUpdate(self, update: CarUpdate, outbox_entry: dict = None):
+        if not update.changes:
+            return None
+        now = datetime.datetime.now().isoformat()
+        try:
+            with self._transaction():
+                stored = self._get(update.car_id)
+                if update.current is None:
+                    if stored is not None:
+                        raise CarVersionConflictError(f"car {update.car_id} was created concurrently")
+                    car = self._newCar({k: v for k, v in update.car.items() if v is not None}, now)
+                else:
+                    if stored is None or int(stored.get('version', 0)) != update.expected_version:
+                        raise CarVersionConflictError(f"car {update.car_id} changed since version {update.expected_version}")
+                    car = {k: v for k, v in {**stored, **update.changes}.items() if v is not None}
+                    car['updated_at'] = now
+                    car['version'] = update.version
+                self._put(car)
+                if outbox_entry:
+                    self._appendOutbox(outboxRecord(update.car_id, update.version, outbox_entry))
+        finally:
+            self.cache.invalidate(update.car_id)
+        self._carsWritten([(stored, car)])
+        update.car['updated_at'] = now
+        update.car['version'] = update.version
+        return car
+
+    def recordTelemetry(self, sample: dict):
+        car_id = sample['car_id']
+        changes = withGeoIndex({"latitude": str(sample['lat']), "longitude": str(sample['lon'])})
+        for attribute in ("nb_passengers", "status"):
+            if sample.get(attribute) is not None:
+                changes[attribute] = sample[attribute]
+        changes['updated_at'] = datetime.datetime.now().isoformat()
+        try:
+            with self._transaction():
+                previous = self._get(car_id)
+                if previous is None:
+                    return "unknown", None, None
+                if previous.get('telemetry_ts') is not None and previous['telemetry_ts'] >= sample['ts']:
+                    return "stale", None, None
+                car = dict(previous, **changes, telemetry_ts=sample['ts'], version=previous.get('version', 0) + 1)
+                self._put(car)
+        finally:
+            self.cache.invalidate(car_id)
+        self._carsWritten([(previous, car)])
+        return "written", previous, dict(car)
+
+    def deleteCar(self, car_id: str):
+        with self._transaction():
+            car = self._delete(car_id)
+        self.cache.invalidate(car_id)
+        self._carsWritten([(car, None)])
+        return car
+
+
+class MemoryCarRepository(LocalCarRepository):
+    """Cars kept in a dict, the outbox records in a list"""
+
+    def __init__(self, definition: dict = None):
+        definition = definition or {}
+        super().__init__(definition)
+        self.table_name = definition.get("table_name", "acm_cars")
+        self.items = {}
+        self.outbox = []
+        self.stats = {}
+        self.lock = threading.RLock()
+
+    def _transaction(self):
+        return self.lock
+
+    def _get(self, car_id: str) -> dict:
+        car = self.items.get(car_id)
+        return None if car is None else dict(car)
+
+    def _put(self, car: dict):
+        with self.lock:
+            self.items[car['car_id']] = dict(car)
+
+    def _delete(self, car_id: str) -> dict:
+        with self.lock:
+            return self.items.pop(car_id, None)
+
+    def _scanAfter(self, car_id: str, limit: int) -> list:
+        with self.lock:
+            car_ids = sorted(k for k in self.items if car_id is None or k > car_id)[:limit]
+            return [dict(self.items[k]) for k in car_ids]
+
+    def _carsInCells(self, cells: set) -> list:
+        with self.lock:
+            return [dict(car) for car in self.items.values() if car.get('geo_cell') in cells]
+
+    def _appendOutbox(self, record: dict):
+        self.outbox.append(record)
+
+    def _addStats(self, delta: dict):
+        with self.lock:
+            for name, count in delta.items():
+                self.stats[name] = self.stats.get(name, 0) + count
+
+    def _readStats(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+    def _replaceStats(self, counters: dict):
+        with self.lock:
+            self.stats = dict(counters)
+
+
+class _SqliteTransaction:
+    def __init__(self, repository):
+        self.repository = repository
+
+    def __enter__(self):
+        self.repository.lock.acquire()
+        self.repository.depth += 1
+        if self.repository.depth == 1:
+            self.repository.connection.execute("BEGIN IMMEDIATE")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.repository.depth -= 1
+            if self.repository.depth == 0:
+                self.repository.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.repository.lock.release()
+        return False
+
+
+class SqliteCarRepository(LocalCarRepository):
+    """
+    Cars stored as JSON documents in a SQLite table, with the indexed geo_cell in its own column.
+    The path comes from definition["sqlite_path"] or CAR_SQLITE_PATH, in memory by default.
+    """
+
+    def __init__(self, definition: dict = None):
+        definition = definition or {}
+        super().__init__(definition)
+        self.table_name = definition.get("table_name", "acm_cars")
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.connection = sqlite3.connect(definition.get("sqlite_path", CAR_SQLITE_PATH),
+                                          isolation_level=None, check_same_thread=False)
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (car_id TEXT PRIMARY KEY, geo_cell TEXT, item TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS {self.table_name}_geo_cell ON {self.table_name} (geo_cell);
+            CREATE TABLE IF NOT EXISTS {self.table_name}_outbox (car_id TEXT, sequence TEXT, event_id TEXT,
+                                                                 entry TEXT, expires_at INTEGER,
+                                                                 PRIMARY KEY (car_id, sequence));
+            CREATE TABLE IF NOT EXISTS {self.table_name}_stats (name TEXT PRIMARY KEY, value);
+        """)
+
+    def _transaction(self):
+        return _SqliteTransaction(self)
+
+    def _query(self, sql: str, parameters=()) -> list:
+        with self.lock:
+            return [json.loads(row[0]) for row in self.connection.execute(sql, parameters)]
+
+    def _get(self, car_id: str) -> dict:
+        rows = self._query(f"SELECT item FROM {self.table_name} WHERE car_id = ?", (car_id,))
+        return rows[0] if rows else None
+
+    def _put(self, car: dict):
+        with self.lock:
+            self.connection.execute(f"INSERT OR REPLACE INTO {self.table_name} (car_id, geo_cell, item) VALUES (?, ?, ?)",
+                                    (car['car_id'], car.get('geo_cell'), jsonSerializer(car)))
+
+    def _delete(self, car_id: str) -> dict:
+        with self._transaction():
+            car = self._get(car_id)
+            self.connection.execute(f"DELETE FROM {self.table_name} WHERE car_id = ?", (car_id,))
+        return car
+
+    def _scanAfter(self, car_id: str, limit: int) -> list:
+        return self._query(f"SELECT item FROM {self.table_name} WHERE car_id > ? ORDER BY car_id LIMIT ?",
+                           (car_id or "", limit))
+
+    def _carsInCells(self, cells: set) -> list:
+        cells = list(cells)
+        placeholders = ", ".join("?" * len(cells))
+        return self._query(f"SELECT item FROM {self.table_name} WHERE geo_cell IN ({placeholders})", cells)
+
+    def _appendOutbox(self, record: dict):
+        with self.lock:
+            self.connection.execute(f"INSERT INTO {self.table_name}_outbox (car_id, sequence, event_id, entry, expires_at) "
+                                    "VALUES (?, ?, ?, ?, ?)",
+                                    (record['car_id'], record['sequence'], record['event_id'], record['entry'],
+                                     record['expires_at']))
+
+    def _addStats(self, delta: dict):
+        with self.lock:
+            self.connection.executemany(f"INSERT INTO {self.table_name}_stats (name, value) VALUES (?, ?) "
+                                        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                                        list(delta.items()))
+
+    def _readStats(self) -> dict:
+        with self.lock:
+            return dict(self.connection.execute(f"SELECT name, value FROM {self.table_name}_stats"))
+
+    def _replaceStats(self, counters: dict):
+        with self._transaction():
+            self.connection.execute(f"DELETE FROM {self.table_name}_stats")
+            self.connection.executemany(f"INSERT INTO {self.table_name}_stats (name, value) VALUES (?, ?)",
+                                        list(counters.items()))
@@ -0,0 +1,93 @@
+"""
+Parallel segmented scan of a DynamoDB table.
+
+The table is split in TotalSegments segments, each scanned by a worker of a thread pool.
+Pages are streamed back to the caller through a bounded queue, so at most max_in_flight
+pages are held in memory whatever the table size.
+"""
+import os, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.types import TypeDeserializer
+
+DEFAULT_SEGMENTS = int(os.environ.get("CARS_SCAN_SEGMENTS", "4"))
+MAX_SEGMENTS = 1000000  # DynamoDB upper bound for TotalSegments
+
+_deserializer = TypeDeserializer()
+_END_OF_SEGMENT = object()
+
+
+def _deserialize(item: dict) -> dict:
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
+def _scanSegment(client, table_name: str, segment: int, total_segments: int, pages: queue.Queue,
+                 stop: threading.Event, deserialize: bool, scan_args: dict):
+    try:
+        args = dict(scan_args, TableName=table_name, Segment=segment, TotalSegments=total_segments)
+        while not stop.is_set():
+            response = client.scan(**args)
+            page = response.get("Items", [])
+            if deserialize:
+                page = [_deserialize(item) for item in page]
+            if page and not _put(pages, page, stop):
+                return
+            last_key = response.get("LastEvaluatedKey")
+            if last_key is None:
+                return
+            args["ExclusiveStartKey"] = last_key
+    except Exception as e:
+        _put(pages, e, stop)
+    finally:
+        _put(pages, _END_OF_SEGMENT, stop)
+
+
+def _put(pages: queue.Queue, value, stop: threading.Event) -> bool:
+    """Block until the consumer takes room in the queue, give up when the scan is cancelled"""
+    while not stop.is_set():
+        try:
+            pages.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def parallelScan(client, table_name: str, total_segments: int = DEFAULT_SEGMENTS,
+                 page_size: int = None, max_in_flight: int = None, deserialize: bool = True, **scan_args):
+    """
+    Yield pages of deserialized items, in completion order, from total_segments concurrent
+    scan workers. client is a boto3 DynamoDB client, which is thread safe: use deserialize=False
+    with the client of a DynamoDB resource (resource.meta.client), which already returns python values.
+    max_in_flight bounds the number of pages read but not yet consumed (default 2 per segment).
+    Any other keyword argument (FilterExpression, ProjectionExpression...) is passed to scan.
+    """
+    if not 1 <= total_segments <= MAX_SEGMENTS:
+        raise ValueError(f"total_segments must be between 1 and {MAX_SEGMENTS}")
+    if page_size:
+        scan_args["Limit"] = page_size
+    pages = queue.Queue(maxsize=max_in_flight or 2 * total_segments)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=total_segments, thread_name_prefix="scan-segment")
+    try:
+        for segment in range(total_segments):
+            executor.submit(_scanSegment, client, table_name, segment, total_segments, pages, stop, deserialize, scan_args)
+        running = total_segments
+        while running:
+            page = pages.get()
+            if page is _END_OF_SEGMENT:
+                running -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def parallelScanAll(client, table_name: str, total_segments: int = DEFAULT_SEGMENTS, **kwargs) -> list:
+    """Merge the pages of a parallel scan into one list"""
+    items = []
+    for page in parallelScan(client, table_name, total_segments, **kwargs):
+        items.extend(page)
+    return items
@@ -0,0 +1,90 @@
+"""
+Concurrent car writes and event publications on the request path.
+
+Without the outbox, a route writes the cars and buffers their events, sent by the handler
+once the route returns: the request waits for the write, then for the publish. With
+CAR_CONCURRENT_IO=true, the events of the car creations are published on a shared thread pool,
+started when the module loads, while the route writes, and the telemetry writes of distinct cars
+run on the pool. Updates and dispatches are conditional writes, which often lose to another
+write: their events are buffered once written, as in series. The ordering rules, applied by writeAndPublish and map:
+  - the write runs on the request thread, the publication of its events on the pool, and the
+    route returns only once both are done, as in series
+  - an undelivered event fails nothing, it is counted in CarEventsFailed, as in series
+  - an event delivered for a car whose write failed is followed by a CarWriteFailed event of
+    the same car, its compensation, then the write error is raised
+  - the writes of one car are never concurrent: map runs distinct cars only
+"""
+import os, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_lambda_powertools import Logger
+
+from car_event_producer import CarEventProducer, EVENTS_PER_PUT
+
+logger = Logger()
+
+CAR_CONCURRENT_IO = os.environ.get("CAR_CONCURRENT_IO", "false").lower() == "true"
+# threads of the pool, shared by the requests of the container
+EXECUTOR_WORKERS = int(os.environ.get("CAR_EXECUTOR_WORKERS", "16"))
+
+
+class RequestExecutor:
+
+    def __init__(self, workers: int = EXECUTOR_WORKERS):
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="car-io")
+
+    def prewarm(self):
+        """Start all the threads of the pool now, rather than on the first requests"""
+        # each task holds its thread until all are running, so every submit starts a new one
+        barrier = threading.Barrier(self.workers + 1)
+        for _ in range(self.workers):
+            self.pool.submit(barrier.wait, 5)
+        barrier.wait(5)
+        return self
+
+    def writeAndPublish(self, write, entries: list, producer: CarEventProducer, failedEntries=None):
+        """
+        Call write() on this thread while the entries are published on the pool, return its result.
+        failedEntries(result) returns the entries of the cars write() reported as not written,
+        for the writes of many cars which do not raise on a failed car.
+        """
+        if not entries:
+            return write()
+        # one task per PutEvents call, the events of a bulk write are published in parallel
+        publishing = [self.pool.submit(producer.publishEntries, entries[start:start + EVENTS_PER_PUT])
+                      for start in range(0, len(entries), EVENTS_PER_PUT)]
+        try:
+            result = write()
+        except Exception:
+            self._compensate(entries, self._undelivered(publishing), producer)
+            raise
+        undelivered = self._undelivered(publishing)
+        failed = failedEntries(result) if failedEntries else []
+        if failed:
+            self._compensate(failed, undelivered, producer)
+        return result
+
+    def map(self, fn, items: list) -> list:
+        """Call fn on each item on the pool, return the results in order or raise the first error"""
+        futures = [self.pool.submit(fn, item) for item in items]
+        # all the calls are finished before an error is raised, none is left running
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+    def _undelivered(self, publishing: list) -> list:
+        return [entry for future in publishing for entry in future.result()]
+
+    def _compensate(self, entries: list, undelivered: list, producer: CarEventProducer):
+        delivered = [entry for entry in entries if not any(entry is u for u in undelivered)]
+        if not delivered:
+            return
+        logger.warning(f"{len(delivered)} car events delivered for failed writes, sending their compensation")
+        producer.publishEntries([producer.compensationEntry(entry) for entry in delivered])
+
+
+# pre-warmed with the container, only when the concurrent mode is on
+request_executor = RequestExecutor().prewarm() if CAR_CONCURRENT_IO else None
@@ -0,0 +1,60 @@
+"""
+Size bounded LRU cache with a time to live per entry, to keep hot items in a warm container.
+"""
+import threading, time
+from collections import OrderedDict
+
+
+class TTLCache:
+
+    def __init__(self, max_size: int, ttl: float, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value, None when absent or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def drainStats(self) -> dict:
+        """Return the hit, miss and eviction counts since the last call"""
+        with self.lock:
+            stats = {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+            self.hits = self.misses = self.evictions = 0
+            return stats
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,80 @@
+"""
+Measure the cold start of the car manager function, phase by phase.
+
+Each run starts a fresh interpreter which times, in order: the boto3, powertools and pydantic
+imports, the import of app.py (module initialization), the first DynamoDB resource and
+EventBridge client creations, and the first GET /cars/<car_id> request against moto.
+The median of each phase over the runs is reported, and saved as JSON with --output.
+
+    python tests/perf/bench_cold_start.py --runs 10 --output cold_start.json
+"""
+import argparse, json, os, statistics, subprocess, sys
+from pathlib import Path
+
+SRC = Path(__file__).parent.parent.parent / "src"
+
+CHILD = r'''
+import json, sys, time
+timings = {}
+start = last = time.perf_counter()
+def phase(name):
+    global last
+    now = time.perf_counter()
+    timings[name] = (now - last) * 1000
+    last = now
+
+import boto3
+phase("import_boto3")
+import aws_lambda_powertools.event_handler, aws_lambda_powertools.metrics, aws_lambda_powertools.tracing
+phase("import_powertools")
+import pydantic, acm_model
+phase("import_pydantic_model")
+import app
+phase("import_app")
+
+from moto import mock_aws
+with mock_aws():
+    boto3.client("dynamodb").create_table(TableName=app.car_repository.table_name,
+        KeySchema=[{"AttributeName": "car_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "car_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST")
+    boto3.client("dynamodb").put_item(TableName=app.car_repository.table_name,
+        Item={"car_id": {"S": "1"}, "model": {"S": "Model_1"}, "status": {"S": "Available"}})
+    last = time.perf_counter()
+    app.car_repository.table
+    phase("create_dynamodb_resource")
+    app.event_producer.event_backbone
+    phase("create_events_client")
+
+    class Context:
+        function_name = "bench"
+        memory_limit_in_mb = 128
+        invoked_function_arn = "arn:aws:lambda:us-west-2:123456789012:function:bench"
+        aws_request_id = "bench"
+    response = app.handler({"httpMethod": "GET", "path": "/cars/1"}, Context())
+    assert response["statusCode"] == 200, response
+    phase("first_get_request")
+print(json.dumps(timings))
+'''
+
+
+def run_once() -> dict:
+    env = dict(os.environ, PYTHONPATH=str(SRC), AWS_DEFAULT_REGION="us-west-2",
+               AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+               POWERTOOLS_TRACE_DISABLED="1", POWERTOOLS_METRICS_DISABLED="1", POWERTOOLS_LOG_LEVEL="ERROR")
+    out = subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args()
+    runs = [run_once() for _ in range(args.runs)]
+    summary = {name: round(statistics.median(run[name] for run in runs), 2) for name in runs[0]}
+    summary["total"] = round(sum(summary.values()), 2)
+    for name, ms in summary.items():
+        print(f"{name:28s} {ms:9.2f} ms")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"runs": args.runs, "median_ms": summary}, indent=2))
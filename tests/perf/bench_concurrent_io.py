@@ -0,0 +1,140 @@
+"""
+Request latency of the write routes with the writes and the event publications in series, the
+default, and concurrent on the pre-warmed pool of request_executor (CAR_CONCURRENT_IO=true).
+
+The memory backend and the EventBridge stub get an injected latency, log-normally distributed
+around --write-ms, --read-ms and --publish-ms, standing in for DynamoDB and EventBridge. In series
+a create costs a write then a publish; concurrent, the larger of both. PUT /cars/{car_id} is a
+conditional write, which publishes after the write in both modes: it is measured to show that
+the concurrent mode leaves it unchanged. With the defaults below, the p50/p99 reduction of the
+concurrent mode is about 35%/34% for POST /cars, 60%/49% for a batch of 25, 75%/64% for the
+telemetry of 20 cars, and none for PUT /cars/{car_id}.
+
+    python tests/perf/bench_concurrent_io.py --write-ms 8 --read-ms 4 --publish-ms 15 --iterations 200
+"""
+import argparse, contextlib, json, os, random, sys, threading, time, warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from bench_handler import Context, Fleet, percentile, restEvent
+
+import app
+from car_repository import newCarRepository
+from request_executor import RequestExecutor
+
+warnings.filterwarnings("ignore", message="No application metrics to publish")
+
+
+class Latency:
+    """Log-normal waits of mean mean_ms, their tail stands in for the slow calls"""
+
+    def __init__(self, mean_ms: float, sigma: float = 0.5, seed: int = 7):
+        self.mean_ms = mean_ms
+        self.sigma = sigma
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if self.mean_ms <= 0:
+            return
+        with self.lock:
+            factor = self.random.lognormvariate(-self.sigma ** 2 / 2, self.sigma)
+        time.sleep(self.mean_ms / 1000 * factor)
+
+
+class SlowEventBridge:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+    def put_events(self, Entries):
+        self.latency.wait()
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": "bench"} for _ in Entries]}
+
+
+def slowRepository(cars: list, read: Latency, write: Latency):
+    """A memory repository holding cars, whose next reads and writes wait like DynamoDB calls"""
+    repository = newCarRepository({"backend": "memory", "cache_size": 0})
+    repository.createCars([dict(car) for car in cars])
+    def delayed(method, latency, calls=lambda *args, **kwargs: 1):
+        def call(*args, **kwargs):
+            for _ in range(calls(*args, **kwargs)):
+                latency.wait()
+            return method(*args, **kwargs)
+        return call
+    repository._readCar = delayed(repository._readCar, read)
+    for name in ("createCar", "applyUpdate", "recordTelemetry"):
+        setattr(repository, name, delayed(getattr(repository, name), write))
+    # one BatchWriteItem per 25 cars
+    repository.createCars = delayed(repository.createCars, write, lambda cars, **kwargs: -(-len(cars) // 25))
+    return repository
+
+
+ROUTES = {
+    "POST /cars": lambda fleet, i: restEvent("POST", "/cars", body=fleet.newCar()),
+    "PUT /cars/{car_id}": lambda fleet, i: restEvent("PUT", f"/cars/{fleet.carId(i)}",
+                                                     body={"status": "Rented" if i % 2 else "Available"}),
+    "POST /cars/batch": lambda fleet, i: restEvent("POST", "/cars/batch", body=[fleet.newCar() for _ in range(25)]),
+    "POST /cars/telemetry": lambda fleet, i: restEvent("POST", "/cars/telemetry", body=fleet.samples(i, 20)),
+}
+
+
+def measure(fleet: Fleet, make_event, iterations: int, warmup: int) -> dict:
+    latencies = []
+    for i in range(warmup + iterations):
+        event = make_event(fleet, i)
+        start = time.perf_counter()
+        response = app.handler(event, Context())
+        if response["statusCode"] >= 400:
+            raise RuntimeError(f"{event['path']} returned {response['statusCode']}: {response['body']}")
+        if i >= warmup:
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {"p50_ms": round(percentile(latencies, 50), 2), "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2)}
+
+
+def run(args) -> dict:
+    executor = RequestExecutor(workers=args.workers).prewarm()
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # the metrics are printed on stdout by each invocation
+        for route in args.routes:
+            results[route] = {}
+            for mode, request_executor in (("series", None), ("concurrent", executor)):
+                fleet = Fleet(args.fleet)
+                app.car_repository = slowRepository(fleet.cars, Latency(args.read_ms), Latency(args.write_ms))
+                app.event_producer = app.CarEventProducer({"event_bus": "bench",
+                                                          "client": SlowEventBridge(Latency(args.publish_ms))})
+                app.request_executor = request_executor
+                results[route][mode] = measure(fleet, ROUTES[route], args.iterations, args.warmup)
+    app.request_executor = None
+    executor.pool.shutdown()
+    return results
+
+
+def report(results: dict):
+    print(f"{'route':<22} {'mode':<11} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for route, modes in results.items():
+        for mode, r in modes.items():
+            print(f"{route:<22} {mode:<11} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['mean_ms']:>8.2f}")
+        series, concurrent = modes["series"], modes["concurrent"]
+        print(f"{'':<22} {'reduction':<11} {1 - concurrent['p50_ms'] / series['p50_ms']:>8.0%} "
+              f"{1 - concurrent['p99_ms'] / series['p99_ms']:>8.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write-ms', type=float, default=8)
+    parser.add_argument('--read-ms', type=float, default=4)
+    parser.add_argument('--publish-ms', type=float, default=15)
+    parser.add_argument('--fleet', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--routes', nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--output', help="save the results as JSON")
+    args = parser.parse_args()
+    results = run(args)
+    report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
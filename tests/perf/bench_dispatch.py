@@ -0,0 +1,120 @@
+"""
+Dispatch decisions per second over fleets of --sizes cars around San Francisco.
+
+- rank numpy: AvailableCars.rank on the array snapshot, the candidates of one ride
+- rank python: the same ranking with a loop over the available cars, geo.distance and sorted
+- POST /dispatch: the route through app.handler on the memory backend, the ranking plus the
+  conditional reservation of the best car and its event; the car is released after each ride,
+  outside of the measure, and the release reaches the snapshot through the write observer.
+
+    python tests/perf/bench_dispatch.py --sizes 10000 100000 --rides 2000
+"""
+import argparse, contextlib, json, os, random, sys, time, warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from bench_handler import Context, Fleet, StubEventBridge, restEvent
+
+import app
+import dispatch
+import geo
+from car_repository import newCarRepository
+from dispatch import AvailableCars, Dispatcher, freeSeats, DISPATCH_CANDIDATES, DISPATCH_RADIUS_M, DISPATCH_SEAT_PENALTY_M
+
+warnings.filterwarnings("ignore", message="No application metrics to publish")
+
+
+def dispatchFleet(size: int) -> list:
+    """The benchmark fleet, empty cars with one van of 7 seats in 5 and the default seats otherwise"""
+    return [dict(car, seats=7) if i % 5 == 0 else car for i, car in enumerate(Fleet(size).cars)]
+
+
+def rides(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    return [{"lat": rng.uniform(37.70, 37.80), "lon": rng.uniform(-122.50, -122.40),
+             "party_size": rng.choice((1, 1, 2, 3, 4)), "bike_rack": rng.random() < 0.1} for _ in range(count)]
+
+
+def rankPython(cars: list, ride: dict) -> list:
+    """The baseline: score every available car one at a time"""
+    scored = []
+    for car in cars:
+        free = freeSeats(car)
+        if car['status'] != "Available" or free < ride['party_size'] or (ride['bike_rack'] and not car['bike_rack']):
+            continue
+        distance = geo.distance(ride['lat'], ride['lon'], float(car['latitude']), float(car['longitude']))
+        if distance <= DISPATCH_RADIUS_M:
+            scored.append((distance + DISPATCH_SEAT_PENALTY_M * (free - ride['party_size']),
+                           car['car_id'], distance))
+    return [(car_id, distance) for _, car_id, distance in sorted(scored)[:DISPATCH_CANDIDATES]]
+
+
+def rate(decide, requests: list) -> dict:
+    start = time.perf_counter()
+    for request in requests:
+        decide(request)
+    elapsed = time.perf_counter() - start
+    return {"decisions_per_s": round(len(requests) / elapsed), "us_per_decision": round(elapsed / len(requests) * 1e6, 1)}
+
+
+def runSize(size: int, count: int) -> dict:
+    cars = dispatchFleet(size)
+    requests = rides(count)
+    snapshot = AvailableCars()
+    start = time.perf_counter()
+    for car in cars:
+        snapshot.apply(car)
+    results = {"snapshot_build_ms": round((time.perf_counter() - start) * 1000, 1)}
+    # both rankings agree on the candidates
+    for ride in requests[:20]:
+        expected = [car_id for car_id, _ in rankPython(cars, ride)]
+        ranked = [car_id for car_id, _ in snapshot.rank(ride['lat'], ride['lon'], ride['party_size'], ride['bike_rack'])]
+        assert ranked == expected, (ranked, expected)
+    results["rank numpy"] = rate(lambda ride: snapshot.rank(ride['lat'], ride['lon'], ride['party_size'],
+                                                            ride['bike_rack']), requests)
+    # the baseline is slow, a tenth of the rides is enough
+    results["rank python"] = rate(lambda ride: rankPython(cars, ride), requests[:max(1, count // 10)])
+
+    repository = newCarRepository({"backend": "memory", "cache_size": 0})
+    repository.createCars([dict(car) for car in cars])
+    app.car_repository = repository
+    app.event_producer = app.CarEventProducer({"event_bus": "bench", "client": StubEventBridge()})
+    dispatch.dispatcher = Dispatcher()
+    dispatch.dispatcher.snapshot(repository)
+    reserved, elapsed = 0, 0.0
+    for ride in requests:
+        event = restEvent("POST", "/dispatch", body=ride)
+        start = time.perf_counter()
+        response = app.handler(event, Context())
+        elapsed += time.perf_counter() - start
+        if response["statusCode"] == 200:
+            reserved += 1
+            repository.updateCar({"car_id": json.loads(response["body"])["car_id"], "status": "Available"})
+    results["POST /dispatch"] = {"decisions_per_s": round(count / elapsed),
+                                 "us_per_decision": round(elapsed / count * 1e6, 1), "reserved": reserved}
+    return results
+
+
+def report(results: dict):
+    print(f"{'cars':>8} {'mode':<16} {'decisions/s':>12} {'us/decision':>12}")
+    for size, modes in results.items():
+        print(f"{size:>8} {'snapshot build':<16} {modes['snapshot_build_ms']:>9.1f} ms")
+        for mode in ("rank numpy", "rank python", "POST /dispatch"):
+            r = modes[mode]
+            print(f"{size:>8} {mode:<16} {r['decisions_per_s']:>12} {r['us_per_decision']:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument('--rides', type=int, default=2000)
+    parser.add_argument('--output', help="save the results as JSON")
+    args = parser.parse_args()
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # the metrics and the snapshot logs are printed on stdout
+        for size in args.sizes:
+            results[str(size)] = runSize(size, args.rides)
+    report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
@@ -0,0 +1,269 @@
+"""
+Handler level benchmark: API Gateway REST events for every route, run through app.handler.
+
+The cars are stored in a local backend (memory or sqlite) so the numbers measure the handler
+code, routing, validation and serialization, not the storage latency. EventBridge is replaced
+by a stub accepting every entry. For each fleet size and route, the latency percentiles and
+the throughput are measured first, then the peak memory of one request above the baseline
+and the memory still allocated after all the requests, with tracemalloc.
+
+GET /cars/stats runs on a repository with the fleet counters on, GET /cars/snapshot on a
+snapshot of the fleet built in an in-memory S3 stub. Each POST /dispatch reserves one of the
+Available cars, two in three of the fleet, all empty: the fleet must be larger than 1.7 times
+the requests of a route, warmup and memory runs included.
+
+Results are saved as JSON with --output; --compare reads a previous result file and exits
+with status 1 when a route is slower, or uses more memory, by more than --threshold.
+
+    python tests/perf/bench_handler.py --sizes 1000 10000 --output baseline.json
+    python tests/perf/bench_handler.py --sizes 1000 10000 --compare baseline.json --threshold 0.1
+"""
+import argparse, contextlib, io, json, os, platform, random, sys, time, tracemalloc, warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "WARNING")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "bench")
+
+import app
+import dispatch
+from car_repository import newCarRepository
+from dispatch import Dispatcher
+from fleet_snapshot import FleetSnapshotStore
+from http_cache import carETag
+
+EVENTS = Path(__file__).parent.parent / "events"
+warnings.filterwarnings("ignore", message="No application metrics to publish")
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "memory_peak_kib")
+
+
+class Context:
+    function_name = "bench"
+    memory_limit_in_mb = 128
+    invoked_function_arn = "arn:aws:lambda:us-west-2:123456789012:function:bench"
+    aws_request_id = "bench"
+
+
+class StubEventBridge:
+    def put_events(self, Entries):
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": "bench"} for _ in Entries]}
+
+
+class StubS3:
+    """The S3 calls of FleetSnapshotStore, on objects kept in memory"""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, output, bucket, key, ExtraArgs=None):
+        self.objects[key] = output.read()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+REQUEST_CONTEXT = json.loads((EVENTS / "postCar.json").read_text())["requestContext"]
+
+
+def restEvent(method: str, path: str, query: dict = None, body=None, headers: dict = None) -> dict:
+    """An API Gateway REST (v1) proxy event, shaped like tests/events/postCar.json"""
+    return {"resource": path, "path": path, "httpMethod": method,
+            "headers": {"Content-Type": "application/json", "Host": "id.execute-api.us-west-2.amazonaws.com",
+                        "User-Agent": "bench", **(headers or {})},
+            "multiValueHeaders": {}, "queryStringParameters": query, "multiValueQueryStringParameters": None,
+            "pathParameters": None, "stageVariables": None,
+            "requestContext": dict(REQUEST_CONTEXT, httpMethod=method, path=path),
+            "body": None if body is None else json.dumps(body), "isBase64Encoded": False}
+
+
+class Fleet:
+    """The benchmark cars, empty, around San Francisco"""
+
+    def __init__(self, size: int, seed: int = 42):
+        rng = random.Random(seed)
+        self.cars = [{"car_id": f"car-{i:07d}", "model": f"Model_{i % 5}", "year": 2024,
+                      "status": "Available" if i % 3 else "Rented",
+                      "latitude": f"{rng.uniform(37.70, 37.80):.5f}", "longitude": f"{rng.uniform(-122.50, -122.40):.5f}",
+                      "nb_passengers": 0, "bike_rack": i % 2 == 0}
+                     for i in range(size)]
+        self.created = 0
+        self.ticks = 0
+        self.rng = random.Random(seed)
+
+    def carId(self, i: int) -> str:
+        return self.cars[i % len(self.cars)]['car_id']
+
+    def newCar(self) -> dict:
+        self.created += 1
+        return {"car_id": f"new-{self.created:07d}", "model": "Model_1", "year": 2024,
+                "latitude": "37.7749", "longitude": "-122.4194"}
+
+    def samples(self, i: int, count: int) -> list:
+        self.ticks += 1
+        return [{"car_id": self.carId(i * count + j), "lat": 37.70 + (self.ticks % 1000) / 10000,
+                 "lon": -122.45, "nb_passengers": j % 4, "ts": self.ticks} for j in range(count)]
+
+    def ride(self, i: int) -> dict:
+        return {"lat": self.rng.uniform(37.70, 37.80), "lon": self.rng.uniform(-122.50, -122.40),
+                "party_size": 1 + i % 4}
+
+
+ROUTES = {
+    "GET /cars": lambda fleet, i: restEvent("GET", "/cars", {"limit": "100"}),
+    "GET /cars?fields": lambda fleet, i: restEvent("GET", "/cars", {"limit": "100", "fields": "status,latitude,longitude"}),
+    "GET /cars/{car_id}": lambda fleet, i: restEvent("GET", f"/cars/{fleet.carId(i * 7919)}"),
+    # pollers revalidating an unchanged car or page, answered with 304
+    "GET /cars/{car_id} If-None-Match": lambda fleet, i: restEvent(
+        "GET", f"/cars/{fleet.carId(i * 7919)}",
+        headers={"If-None-Match": carETag(app.car_repository.getCarVersion(fleet.carId(i * 7919)))}),
+    "GET /cars If-None-Match": lambda fleet, i: restEvent(
+        "GET", "/cars", {"limit": "100"},
+        headers={"If-None-Match": invoke(restEvent("GET", "/cars", {"limit": "100"}))["multiValueHeaders"]["ETag"][0]}),
+    "GET /cars/nearby": lambda fleet, i: restEvent("GET", "/cars/nearby", {"lat": "37.7749", "lon": "-122.4194",
+                                                                          "radius": "1000", "limit": "20"}),
+    "POST /cars": lambda fleet, i: restEvent("POST", "/cars", body=fleet.newCar()),
+    "POST /cars/batch": lambda fleet, i: restEvent("POST", "/cars/batch", body=[fleet.newCar() for _ in range(25)]),
+    "PUT /cars/{car_id}": lambda fleet, i: restEvent("PUT", f"/cars/{fleet.carId(i)}",
+                                                     body={"status": "Rented" if i % 2 else "Available"}),
+    "POST /cars/telemetry": lambda fleet, i: restEvent("POST", "/cars/telemetry", body=fleet.samples(i, 100)),
+    "GET /cars/stats": lambda fleet, i: restEvent("GET", "/cars/stats"),
+    "GET /cars/snapshot": lambda fleet, i: restEvent("GET", "/cars/snapshot", {"format": "columns"}),
+    "POST /dispatch": lambda fleet, i: restEvent("POST", "/dispatch", body=fleet.ride(i)),
+}
+
+
+def setUp(backend: str, fleet: Fleet, route: str):
+    # the counters are only maintained for the route reading them, the writes of the others stay comparable
+    app.car_repository = newCarRepository({"backend": backend, "table_name": "bench_cars",
+                                           "fleet_stats": route == "GET /cars/stats"})
+    app.event_producer = app.CarEventProducer({"event_bus": "bench", "client": StubEventBridge()})
+    for start in range(0, len(fleet.cars), 1000):
+        app.car_repository.createCars([dict(car) for car in fleet.cars[start:start + 1000]])
+    app.snapshot_store = FleetSnapshotStore({"bucket": "bench-snapshots", "client": StubS3()})
+    if route == "GET /cars/snapshot":
+        app.snapshot_store.build(app.car_repository.iterFleetPages())
+    # the snapshot of the dispatcher is loaded by the first request, a warmup one
+    dispatch.dispatcher = Dispatcher()
+
+
+def percentile(values: list, p: float) -> float:
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def invoke(event: dict) -> dict:
+    response = app.handler(event, Context())
+    if response["statusCode"] >= 400:
+        raise RuntimeError(f"{event['httpMethod']} {event['path']} returned {response['statusCode']}: {response['body']}")
+    return response
+
+
+def measureRoute(fleet: Fleet, make_event, iterations: int, warmup: int) -> dict:
+    for i in range(warmup):
+        invoke(make_event(fleet, i))
+    events = [make_event(fleet, warmup + i) for i in range(iterations)]
+    latencies = []
+    start = time.perf_counter()
+    for event in events:
+        t0 = time.perf_counter()
+        invoke(event)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    memory_events = [make_event(fleet, warmup + iterations + i) for i in range(max(1, iterations // 10))]
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    peak = 0
+    for event in memory_events:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        invoke(event)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {"requests": iterations,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "throughput_rps": round(iterations / elapsed, 1),
+            "memory_peak_kib": round(peak / 1024, 1),
+            "memory_retained_kib": round(retained / 1024, 1)}
+
+
+def run(sizes: list, backend: str, iterations: int, warmup: int, routes: list) -> dict:
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # the metrics are printed on stdout by each invocation, their cost is kept in the numbers
+        for size in sizes:
+            fleet = Fleet(size)
+            results[str(size)] = {}
+            for route in routes:
+                setUp(backend, fleet, route)
+                results[str(size)][route] = measureRoute(fleet, ROUTES[route], iterations, warmup)
+    return {"meta": {"backend": backend, "iterations": iterations, "python": platform.python_version(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results}
+
+
+def report(run_results: dict):
+    header = f"{'route':<34} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9} {'peak KiB':>9} {'kept KiB':>9}"
+    for size, routes in run_results["results"].items():
+        print(f"fleet={size} backend={run_results['meta']['backend']}")
+        print(header)
+        for route, r in routes.items():
+            print(f"{route:<34} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['throughput_rps']:>9.1f} "
+                  f"{r['memory_peak_kib']:>9.1f} {r['memory_retained_kib']:>9.1f}")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Return the regressions of current over baseline, a value more than threshold above its baseline"""
+    regressions = []
+    for size, routes in current["results"].items():
+        for route, result in routes.items():
+            before = baseline["results"].get(size, {}).get(route)
+            if before is None:
+                continue
+            for metric in COMPARED:
+                if before[metric] > 0 and result[metric] > before[metric] * (1 + threshold):
+                    regressions.append(f"fleet={size} {route} {metric}: {before[metric]} -> {result[metric]} "
+                                       f"(+{(result[metric] / before[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument('--backend', choices=["memory", "sqlite"], default="memory")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--routes', nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--output', help="save the results as JSON")
+    parser.add_argument('--compare', help="results JSON of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.10, help="accepted slow down, 0.10 for 10%%")
+    args = parser.parse_args()
+    results = run(args.sizes, args.backend, args.iterations, args.warmup, args.routes)
+    report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), results, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regression above {args.threshold:.0%}")
@@ -0,0 +1,83 @@
+"""
+Measure the AutonomousCar model paths in cars per second, for 1, 100 and 10k cars:
+
+* validation: one model_validate per car, and validateCars with the cached list TypeAdapter
+* event construction: the former builder mutating the event after creation, fromAutonomousCar,
+  and model_construct for reference
+* model_dump_json of the events
+
+    python tests/perf/bench_model.py --sizes 1 100 10000
+"""
+import argparse, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
+
+from acm_model import AutonomousCar, AutonomousCarEvent, validateCars
+
+EVENT_TYPE = "acme.acs.acm.events.CarCreated"
+
+
+def cars(size: int) -> list:
+    return [{"car_id": f"car-{i:07d}", "model": f"Model_{i % 5}", "year": 2024, "status": "Available",
+             "latitude": "37.7", "longitude": "-122.42", "nb_passengers": i % 4, "bike_rack": i % 2 == 0}
+            for i in range(size)]
+
+
+def mutatedEvent(aCar: AutonomousCar, eventType: str) -> AutonomousCarEvent:
+    """The former event builder, assigning the optional attributes after creation, kept as the baseline"""
+    carEvent = AutonomousCarEvent(car_id=aCar.car_id, model=aCar.model, year=aCar.year, status=aCar.status,
+                                  nb_passengers=aCar.nb_passengers, event_type=eventType,
+                                  event_source="acs.acm", event_version="1.0")
+    if aCar.latitude != None:
+        carEvent.latitude = aCar.latitude
+    if aCar.bike_rack != None:
+        carEvent.bike_rack = aCar.bike_rack
+    if aCar.longitude != None:
+        carEvent.longitude = aCar.longitude
+    return carEvent
+
+
+def constructedEvent(aCar: AutonomousCar, eventType: str) -> AutonomousCarEvent:
+    return AutonomousCarEvent.model_construct(car_id=aCar.car_id, model=aCar.model, year=aCar.year, status=aCar.status,
+                                              latitude=aCar.latitude, longitude=aCar.longitude,
+                                              nb_passengers=aCar.nb_passengers, bike_rack=aCar.bike_rack,
+                                              event_type=eventType, event_source="acs.acm", event_version="1.0")
+
+
+def rate(size: int, run, min_seconds: float = 0.5) -> float:
+    """Repeat run until min_seconds elapsed, return the processed cars per second"""
+    run()
+    count = 0
+    start = time.perf_counter()
+    while True:
+        run()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return size * count / elapsed
+
+
+def bench(size: int):
+    data = cars(size)
+    models = [AutonomousCar.model_validate(car) for car in data]
+    events = [AutonomousCarEvent.fromAutonomousCar(aCar, EVENT_TYPE) for aCar in models]
+    results = {
+        "validate per car": rate(size, lambda: [AutonomousCar.model_validate(car) for car in data]),
+        "validate in bulk": rate(size, lambda: validateCars(data)),
+        "event mutated": rate(size, lambda: [mutatedEvent(aCar, EVENT_TYPE) for aCar in models]),
+        "event fromAutonomousCar": rate(size, lambda: [AutonomousCarEvent.fromAutonomousCar(aCar, EVENT_TYPE) for aCar in models]),
+        "event model_construct": rate(size, lambda: [constructedEvent(aCar, EVENT_TYPE) for aCar in models]),
+        "event model_dump_json": rate(size, lambda: [event.model_dump_json() for event in events]),
+    }
+    print(f"cars={size}")
+    for name, value in results.items():
+        print(f"  {name:<24} {value:>12,.0f} cars/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs="+", default=[1, 100, 10000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        bench(size)
@@ -0,0 +1,92 @@
+"""
+Benchmark the paginated fleet read of CarRepository against a moto DynamoDB table.
+
+For each fleet size, report the latency per page and the peak memory used while
+streaming the fleet with iterCarPages, compared to materializing the full list.
+Latency and memory are measured in separate passes as tracemalloc slows moto down.
+moto scans the whole table to find the ExclusiveStartKey, so the page latency it reports
+grows with the fleet size where DynamoDB does not: compare memory across sizes, latency
+across page sizes.
+
+    python tests/perf/bench_pagination.py --sizes 10000 100000 --page-size 100
+"""
+import argparse, os, statistics, sys, time, tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import boto3
+from moto import mock_aws
+from car_repository import CarRepository
+
+TABLE_NAME = "bench_cars"
+
+
+def load_fleet(dynamodb, size: int):
+    dynamodb.create_table(TableName=TABLE_NAME,
+                          KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}],
+                          AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'}],
+                          BillingMode="PAY_PER_REQUEST")
+    table = dynamodb.Table(TABLE_NAME)
+    with table.batch_writer() as batch:
+        for i in range(size):
+            batch.put_item(Item={"car_id": f"car-{i:07d}", "model": f"Model_{i % 5}", "year": 2024,
+                                 "status": "Available", "latitude": "37.7", "longitude": "-122.42",
+                                 "nb_passengers": 0, "bike_rack": i % 2 == 0})
+
+
+def stream_pages(repository: CarRepository, page_size: int):
+    latencies = []
+    count = 0
+    start = time.perf_counter()
+    pages = repository.iterCarPages(page_size=page_size)
+    while True:
+        t0 = time.perf_counter()
+        page = next(pages, None)
+        if page is None:
+            break
+        latencies.append((time.perf_counter() - t0) * 1000)
+        count += len(page)
+    return count, time.perf_counter() - start, latencies
+
+
+def peak_memory(read):
+    tracemalloc.start()
+    read()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def full_list(repository: CarRepository):
+    start = time.perf_counter()
+    cars = repository.getAllCars()
+    return len(cars), time.perf_counter() - start
+
+
+def run(size: int, page_size: int):
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb")
+        load_fleet(dynamodb, size)
+        repository = CarRepository({"resource": dynamodb, "table_name": TABLE_NAME})
+        count, elapsed, latencies = stream_pages(repository, page_size)
+        full_count, full_elapsed = full_list(repository)
+        peak = peak_memory(lambda: [None for _ in repository.iterCarPages(page_size=page_size)])
+        full_peak = peak_memory(repository.getAllCars)
+    latencies.sort()
+    print(f"fleet={size} page_size={page_size} pages={len(latencies)} cars={count}")
+    print(f"  streamed: total={elapsed:.2f}s page p50={statistics.median(latencies):.2f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}ms peak_mem={peak / 1024:.0f}KiB")
+    print(f"  full list: cars={full_count} total={full_elapsed:.2f}s peak_mem={full_peak / 1024:.0f}KiB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.page_size)
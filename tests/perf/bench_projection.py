@@ -0,0 +1,109 @@
+"""
+Compare GET /cars and GET /cars/<car_id> responses with and without the fields projection.
+
+A moto table is loaded with the fleet, then the whole fleet is read page by page through
+app.handler, once with every attribute and once with --fields. For each mode the response
+bytes and the handler latency per page are reported, then the same for single car reads.
+The projection shrinks the transferred and serialized payload; DynamoDB still bills the read
+units on the full item size.
+
+    python tests/perf/bench_projection.py --size 10000 --fields status,latitude,longitude
+"""
+import argparse, json, os, statistics, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "bench")
+
+import boto3
+from moto import mock_aws
+import app
+from car_repository import CarRepository
+
+TABLE_NAME = "bench_cars"
+
+
+class Context:
+    function_name = "bench"
+    memory_limit_in_mb = 128
+    invoked_function_arn = "arn:aws:lambda:us-west-2:123456789012:function:bench"
+    aws_request_id = "bench"
+
+
+def load_fleet(dynamodb, size: int):
+    dynamodb.create_table(TableName=TABLE_NAME,
+                          KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}],
+                          AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'}],
+                          BillingMode="PAY_PER_REQUEST")
+    table = dynamodb.Table(TABLE_NAME)
+    with table.batch_writer() as batch:
+        for i in range(size):
+            batch.put_item(Item={"car_id": f"car-{i:07d}", "model": f"Model_{i % 5}", "year": 2024,
+                                 "status": "Available", "latitude": "37.7", "longitude": "-122.42",
+                                 "nb_passengers": 0, "bike_rack": i % 2 == 0, "max_passenger": 4,
+                                 "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00"})
+
+
+def read_fleet(page_size: int, fields: str = None):
+    sizes, latencies = [], []
+    params = {"limit": str(page_size)}
+    while True:
+        if fields:
+            params["fields"] = fields
+        t0 = time.perf_counter()
+        response = app.handler({"httpMethod": "GET", "path": "/cars", "queryStringParameters": params}, Context())
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert response["statusCode"] == 200, response
+        sizes.append(len(response["body"].encode("utf-8")))
+        cursor = json.loads(response["body"])["next_cursor"]
+        if cursor is None:
+            return sizes, latencies
+        params = {"limit": str(page_size), "cursor": cursor}
+
+
+def read_cars(count: int, fields: str = None):
+    sizes, latencies = [], []
+    for i in range(count):
+        # a new repository per read, so every read goes to the table and not to the cache
+        app.car_repository = CarRepository({"resource": app.car_repository.resource, "table_name": TABLE_NAME})
+        event = {"httpMethod": "GET", "path": f"/cars/car-{i:07d}"}
+        if fields:
+            event["queryStringParameters"] = {"fields": fields}
+        t0 = time.perf_counter()
+        response = app.handler(event, Context())
+        latencies.append((time.perf_counter() - t0) * 1000)
+        sizes.append(len(response["body"].encode("utf-8")))
+    return sizes, latencies
+
+
+def report(label: str, sizes: list, latencies: list):
+    print(f"  {label:<10} requests={len(sizes)} bytes total={sum(sizes)} mean={statistics.mean(sizes):.0f} "
+          f"latency p50={statistics.median(latencies):.2f}ms mean={statistics.mean(latencies):.2f}ms")
+
+
+def run(size: int, page_size: int, fields: str, reads: int):
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb")
+        load_fleet(dynamodb, size)
+        app.car_repository = CarRepository({"resource": dynamodb, "table_name": TABLE_NAME})
+        print(f"fleet={size} page_size={page_size} fields={fields}")
+        print(" GET /cars")
+        report("full", *read_fleet(page_size))
+        report("projected", *read_fleet(page_size, fields))
+        print(" GET /cars/<car_id>")
+        report("full", *read_cars(reads))
+        report("projected", *read_cars(reads, fields))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--fields', default="status,latitude,longitude")
+    parser.add_argument('--reads', type=int, default=200)
+    args = parser.parse_args()
+    run(args.size, args.page_size, args.fields, args.reads)
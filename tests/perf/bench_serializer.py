@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of the GET /cars response serialization, in items per second.
+
+The page body {"cars": [...], "next_cursor": ...} is built from items shaped like the ones
+the DynamoDB resource returns (Decimal numbers), then encoded with the resolver default
+serializer (json with the powertools Encoder, which turns Decimal into strings) and with
+car_serializer on its json and orjson backends.
+
+    python tests/perf/bench_serializer.py --items 1000 --repeat 50
+"""
+import argparse, json, os, sys, time
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
+
+from aws_lambda_powertools.shared.json_encoder import Encoder
+from car_serializer import carSerializer, jsonSerializer
+
+
+def page(size: int) -> dict:
+    cars = [{"car_id": f"car-{i:07d}", "model": f"Model_{i % 5}", "year": Decimal(2024),
+             "status": "Available", "latitude": "37.7", "longitude": "-122.42",
+             "nb_passengers": Decimal(i % 4), "max_passenger": Decimal(4), "bike_rack": i % 2 == 0,
+             "version": Decimal(3), "geohash": "9q8yyk8yt", "geo_cell": "9q8yy",
+             "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00"}
+            for i in range(size)]
+    return {"cars": cars, "next_cursor": "eyJjYXJfaWQiOiAiY2FyLTAwMDA5OTkifQ=="}
+
+
+def measure(serializer, body: dict, repeat: int) -> float:
+    serializer(body)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        serializer(body)
+    return len(body["cars"]) * repeat / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    body = page(args.items)
+    serializers = {"powertools default": partial(json.dumps, separators=(",", ":"), cls=Encoder),
+                   "car_serializer json": jsonSerializer}
+    orjson_serializer = carSerializer("orjson")
+    if orjson_serializer is not jsonSerializer:
+        serializers["car_serializer orjson"] = orjson_serializer
+    baseline = None
+    for name, serializer in serializers.items():
+        rate = measure(serializer, body, args.repeat)
+        baseline = baseline or rate
+        print(f"{name:<22} {rate:>12,.0f} items/s  x{rate / baseline:.2f}")
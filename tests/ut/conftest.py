@@ -4,6 +4,7 @@ import json
 from pathlib import Path
 from typing import Any
 import app as app
+import aws_clients
 import boto3
 import moto
 from moto import mock_aws
@@ -53,4 +54,12 @@ def event_client(aws_credentials):
 def secret_client(aws_credentials):
     with mock_aws():
         conn = boto3.client("secretsmanager", region_name="us-west-2")
-        yield conn
\ No newline at end of file
+        yield conn
+
+
+@pytest.fixture(autouse=True)
+def reset_aws_clients():
+    """Clients are memoized by aws_clients, do not share them, or their mocks, between tests"""
+    aws_clients.reset()
+    yield
+    aws_clients.reset()
@@ -1,3 +1,4 @@
+import base64
 import os
 import pytest
 from boto3 import resource
@@ -7,6 +8,7 @@ import json
 from pathlib import Path
 from typing import Any
 import app as app
+from car_repository import GEO_INDEX_NAME, newCarRepository
 from unittest import mock
 
 
@@ -31,6 +33,21 @@ def create_table(dynamodb_client):
                 'AttributeName': 'car_id',
                 'AttributeType': 'S'
             },
+            {
+                'AttributeName': 'geo_cell',
+                'AttributeType': 'S'
+            },
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': GEO_INDEX_NAME,
+                'KeySchema': [
+                    {'AttributeName': 'geo_cell', 'KeyType': 'HASH'},
+                    {'AttributeName': 'car_id', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 10, 'WriteCapacityUnits': 10}
+            }
         ],
         ProvisionedThroughput={
             'ReadCapacityUnits': 10,
@@ -76,18 +93,352 @@ def load_event(file_name: str) -> Any:
 class TestCarMgr:
 
         
-    def test_shouldGetFirstCarByUsingId(self,getApp):
-        aCar=getApp.getCarUsingCarId("1")
+    def test_shouldGetFirstCarByUsingId(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars/1"}
+        aCar=json.loads(getApp.handler(aAPIevent, lambda_context)['body'])
         print(aCar)
         assert aCar != None
         assert aCar['status'] == "Free"
 
 
-    def test_shouldGetAllCars(self,getApp):
-        allCars=getApp.getAllCars()
+    def test_shouldGetAllCars(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars"}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        allCars=json.loads(resp['body'])
         print(allCars)
-        assert allCars != None
-        assert len(allCars) > 0
+        assert resp['statusCode'] == 200
+        assert len(allCars['cars']) > 0
+        assert allCars['next_cursor'] == None
+
+    def test_shouldPaginateAllCars(self,lambda_context,getApp):
+        seen = []
+        params = {"limit": "1"}
+        while True:
+            aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": params}
+            page=json.loads(getApp.handler(aAPIevent, lambda_context)['body'])
+            assert len(page['cars']) <= 1
+            seen.extend(car['car_id'] for car in page['cars'])
+            if page['next_cursor'] is None:
+                break
+            params = {"limit": "1", "cursor": page['next_cursor']}
+        allIds = [car['car_id'] for car in getApp.car_repository.getAllCars()]
+        assert sorted(seen) == sorted(allIds)
+
+    def test_shouldRejectInvalidCursor(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": {"cursor": "not-a-cursor"}}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        assert resp['statusCode'] == 400
+        for key in ({"car_id": 1, "x": 2}, {"car_id": "1", "x": 2}, {"car_id": 1}, ["car_id"]):
+            cursor = base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+            aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": {"cursor": cursor}}
+            resp=getApp.handler(aAPIevent, lambda_context)
+            assert resp['statusCode'] == 400
+
+    def test_shouldReturnOnlyRequestedFields(self,lambda_context,getApp):
+        params = {"fields": "status, model"}
+        resp=getApp.handler({ "httpMethod": "GET", "path":"/cars", "queryStringParameters": params}, lambda_context)
+        assert resp['statusCode'] == 200
+        cars = json.loads(resp['body'])['cars']
+        assert cars and all(set(car) <= {"car_id", "status", "model"} for car in cars)
+        resp=getApp.handler({ "httpMethod": "GET", "path":"/cars/1", "queryStringParameters": params}, lambda_context)
+        assert json.loads(resp['body']) == {"car_id": "1", "status": "Free", "model": "Model_1"}
+
+    def test_shouldProjectCachedCar(self,lambda_context,getApp):
+        repository = getApp.car_repository
+        full = repository.getCarUsingCarId("1")
+        with mock.patch.object(repository, "_readCar") as readCar:
+            assert repository.getCarUsingCarId("1", fields=["status"]) == {"car_id": "1", "status": full['status']}
+            readCar.assert_not_called()
+
+    def test_shouldReturnNumbersAsJsonNumbers(self,lambda_context,getApp):
+        getApp.car_repository.createCar({"car_id": "numbers-1", "model": "Model_1", "year": 2024, "nb_passengers": 2})
+        resp=getApp.handler({ "httpMethod": "GET", "path":"/cars/numbers-1"}, lambda_context)
+        aCar = json.loads(resp['body'])
+        assert aCar['year'] == 2024 and aCar['nb_passengers'] == 2
+
+    def test_shouldRejectUnknownFields(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": {"fields": "status,owner"}}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        assert resp['statusCode'] == 400
+        assert "owner" in resp['body']
+
+    def test_shouldGetAllCarsWithParallelScan(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": {"segments": "3"}}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        allCars=json.loads(resp['body'])
+        expected = [car['car_id'] for car in getApp.car_repository.getAllCars()]
+        assert sorted(car['car_id'] for car in allCars['cars']) == sorted(expected)
+        assert allCars['next_cursor'] == None
+
+    def test_shouldRejectTooManySegments(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": {"segments": "1000"}}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        assert resp['statusCode'] == 400
+
+    def test_shouldFindNearbyCarsByDistance(self,lambda_context,getApp):
+        repository = getApp.car_repository
+        repository.createCar({"car_id": "near-1", "model": "Model_1", "year": 2024, "status": "Available",
+                              "latitude": "37.7750", "longitude": "-122.4194"})
+        repository.createCar({"car_id": "near-2", "model": "Model_1", "year": 2024, "status": "Available",
+                              "latitude": "37.7800", "longitude": "-122.4194"})
+        repository.createCar({"car_id": "near-3", "model": "Model_1", "year": 2024, "status": "Rented",
+                              "latitude": "37.7760", "longitude": "-122.4194"})
+        repository.createCar({"car_id": "far-1", "model": "Model_1", "year": 2024, "status": "Available",
+                              "latitude": "34.0522", "longitude": "-118.2437"})
+        params = {"lat": "37.7749", "lon": "-122.4194", "radius": "2000", "status": "Available"}
+        aAPIevent={ "httpMethod": "GET", "path":"/cars/nearby", "queryStringParameters": params}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        assert resp['statusCode'] == 200
+        cars = json.loads(resp['body'])['cars']
+        assert [car['car_id'] for car in cars] == ["near-1", "near-2"]
+        assert cars[0]['distance_m'] < cars[1]['distance_m'] <= 2000
+        params["status"] = "Rented"
+        resp=getApp.handler({ "httpMethod": "GET", "path":"/cars/nearby", "queryStringParameters": params}, lambda_context)
+        assert [car['car_id'] for car in json.loads(resp['body'])['cars']] == ["near-3"]
+
+    def test_shouldReindexMovedCar(self,getApp):
+        repository = getApp.car_repository
+        aCar = repository.getCarUsingCarId("near-2")
+        aCar['latitude'] = "34.0525"
+        aCar['longitude'] = "-118.2440"
+        repository.updateCar(aCar)
+        assert repository.getCarUsingCarId("near-2")['geo_cell'] == "9q5ct"
+        cars = repository.findCarsNearby(37.7749, -122.4194, radius=2000, status="Available")
+        assert [car['car_id'] for car in cars] == ["near-1"]
+
+    def test_shouldRejectInvalidNearbyQuery(self,lambda_context,getApp):
+        # near the pole a 10 km circle covers too many geo cells
+        for params in ({"lat": "37.7"}, {"lat": "95", "lon": "0"}, {"lat": "37.7", "lon": "-122.4", "radius": "1000000"},
+                       {"lat": "89", "lon": "0", "radius": "10000"}):
+            aAPIevent={ "httpMethod": "GET", "path":"/cars/nearby", "queryStringParameters": params}
+            assert getApp.handler(aAPIevent, lambda_context)['statusCode'] == 400
+
+    def test_shouldServeFleetStats(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars/stats"}
+        assert getApp.handler(aAPIevent, lambda_context)['statusCode'] == 501
+        saved = getApp.car_repository
+        getApp.car_repository = newCarRepository({"backend": "memory", "fleet_stats": True})
+        try:
+            cars = [{"car_id": "stats-1", "model": "Model_3", "year": 2024},
+                    {"car_id": "stats-2", "model": "Model_3", "year": 2024, "status": "Rented", "bike_rack": True}]
+            getApp.handler({ "httpMethod": "POST", "path":"/cars/batch", "body": json.dumps(cars)}, lambda_context)
+            resp = getApp.handler(aAPIevent, lambda_context)
+            assert resp['statusCode'] == 200
+            assert json.loads(resp['body']) == {"total": 2, "status": {"Available": 1, "Rented": 1},
+                                                "model": {"Model_3": 2}, "bike_rack": {"true": 1, "false": 1}}
+        finally:
+            getApp.car_repository = saved
+
+    def test_shouldCreateCarsInBatch(self,lambda_context,getApp):
+        cars = [{"car_id": f"batch-{i}", "model": "Model_3", "year": 2024} for i in range(30)]
+        cars.append({"car_id": "batch-bad", "model": "Model_3", "year": "not a year"})
+        cars.append({"car_id": "batch-0", "model": "Model_3", "year": 2024})
+        getApp.event_producer.event_backbone.put_events.reset_mock()
+        aAPIevent={ "httpMethod": "POST", "path":"/cars/batch", "body": json.dumps({"cars": cars})}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        assert resp['statusCode'] == 200
+        body = json.loads(resp['body'])
+        assert body['created'] == 30
+        assert body['failed'] == 2
+        assert [r['status'] for r in body['results'][-2:]] == ["failed", "failed"]
+        assert "year" in body['results'][-2]['error']
+        assert getApp.car_repository.getCarUsingCarId("batch-29")['status'] == "Available"
+        # 30 events sent 10 per PutEvents call
+        assert getApp.event_producer.event_backbone.put_events.call_count == 3
+
+    def test_shouldAnswerConditionalCarReadWithVersionRead(self,lambda_context,getApp):
+        repository = getApp.car_repository
+        repository.createCar({"car_id": "etag-1", "model": "Model_1", "year": 2024, "status": "Available"})
+        aAPIevent={ "httpMethod": "GET", "path":"/cars/etag-1"}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        etag = resp['multiValueHeaders']['ETag'][0]
+        assert resp['statusCode'] == 200 and resp['multiValueHeaders']['Cache-Control'] == ["no-cache"]
+        repository.cache.clear()
+        with mock.patch.object(repository, "_readCar", wraps=repository._readCar) as readCar:
+            resp=getApp.handler(dict(aAPIevent, headers={"If-None-Match": etag}), lambda_context)
+            assert resp['statusCode'] == 304 and not resp['body']
+            readCar.assert_called_once_with("etag-1", fields=["version", "updated_at"])
+        # a projection has its own ETag
+        params = {"fields": "status"}
+        resp=getApp.handler(dict(aAPIevent, queryStringParameters=params, headers={"If-None-Match": etag}), lambda_context)
+        assert resp['statusCode'] == 200 and resp['multiValueHeaders']['ETag'][0] != etag
+        projected_etag = resp['multiValueHeaders']['ETag'][0]
+        resp=getApp.handler(dict(aAPIevent, queryStringParameters=params, headers={"If-None-Match": projected_etag}), lambda_context)
+        assert resp['statusCode'] == 304
+        # without If-None-Match, the projection and its version come from one read
+        with mock.patch.object(repository, "_readCar", wraps=repository._readCar) as readCar:
+            resp=getApp.handler(dict(aAPIevent, queryStringParameters=params), lambda_context)
+            readCar.assert_called_once_with("etag-1", fields=["status", "version", "updated_at"])
+        assert json.loads(resp['body']) == {"car_id": "etag-1", "status": "Available"}
+        assert resp['multiValueHeaders']['ETag'][0] == projected_etag
+        repository.updateCar({"car_id": "etag-1", "status": "Rented"})
+        resp=getApp.handler(dict(aAPIevent, headers={"If-None-Match": etag}), lambda_context)
+        assert resp['statusCode'] == 200 and json.loads(resp['body'])['status'] == "Rented"
+        assert resp['multiValueHeaders']['ETag'][0] != etag
+
+    def test_shouldRejectInvalidCar(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "POST", "path":"/cars"}
+        resp=getApp.handler(dict(aAPIevent, body=json.dumps({"car_id": "no-year", "model": "Model_1"})), lambda_context)
+        assert resp['statusCode'] == 400 and "year" in json.loads(resp['body'])['message']
+        resp=getApp.handler(dict(aAPIevent, body=json.dumps([{"car_id": "in-a-list", "model": "Model_1", "year": 2024}])),
+                            lambda_context)
+        assert resp['statusCode'] == 400
+        with pytest.raises(getApp.CarNotFoundError):
+            getApp.car_repository.getCarUsingCarId("no-year")
+
+    def test_shouldAnswer404ForMissingCar(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars/no-such-car"}
+        for headers in (None, {"If-None-Match": '"1-abc"'}):
+            for params in (None, {"fields": "status"}):
+                resp=getApp.handler(dict(aAPIevent, headers=headers, queryStringParameters=params), lambda_context)
+                assert resp['statusCode'] == 404
+                assert json.loads(resp['body'])['message'] == "car no-such-car not found"
+
+    def test_shouldAnswerConditionalListRead(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars", "queryStringParameters": {"limit": "2"}}
+        resp=getApp.handler(aAPIevent, lambda_context)
+        etag = resp['multiValueHeaders']['ETag'][0]
+        assert resp['statusCode'] == 200 and json.loads(resp['body'])['cars']
+        resp=getApp.handler(dict(aAPIevent, headers={"If-None-Match": etag}), lambda_context)
+        assert resp['statusCode'] == 304 and not resp['body']
+        resp=getApp.handler(dict(aAPIevent, queryStringParameters={"limit": "1"}, headers={"If-None-Match": etag}), lambda_context)
+        assert resp['statusCode'] == 200
+
+    def test_shouldRejectEmptyBatch(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "POST", "path":"/cars/batch", "body": json.dumps([])}
+        assert getApp.handler(aAPIevent, lambda_context)['statusCode'] == 400
+
+    def test_shouldServeRepeatedReadsFromCache(self,getApp):
+        repository = getApp.car_repository
+        repository.createCar({"car_id": "cached-1", "model": "Model_1", "year": 2024, "status": "Available"})
+        repository.cache.drainStats()
+        with mock.patch.object(repository, "_readCar", wraps=repository._readCar) as readCar:
+            assert repository.getCarUsingCarId("cached-1")['status'] == "Available"
+            repository.getCarUsingCarId("cached-1")['status'] = "changed by caller"
+            assert repository.getCarUsingCarId("cached-1")['status'] == "Available"
+            assert readCar.call_count == 1
+            repository.updateCar({"car_id": "cached-1", "model": "Model_1", "year": 2024, "status": "Rented"})
+            assert repository.getCarUsingCarId("cached-1")['status'] == "Rented"
+            # the update reads the current version, then the next read misses the invalidated entry
+            assert readCar.call_count == 3
+        assert repository.cache.drainStats() == {"hits": 2, "misses": 2, "evictions": 0}
+
+    def test_shouldRecordLatestTelemetryPerCar(self,lambda_context,getApp):
+        getApp.car_repository.createCar({"car_id": "tele-1", "model": "Model_1", "year": 2024, "status": "Available",
+                                         "latitude": "37.7749", "longitude": "-122.4194"})
+        getApp.event_producer.event_backbone.put_events.reset_mock()
+        samples = [{"car_id": "tele-1", "lat": 37.7760, "lon": -122.4194, "nb_passengers": 1, "ts": 2},
+                   {"car_id": "tele-1", "lat": 37.7750, "lon": -122.4194, "ts": 1},
+                   {"car_id": "tele-unknown", "lat": 0, "lon": 0, "ts": 1},
+                   {"car_id": "tele-1", "lat": 137, "lon": 0, "ts": 3}]
+        resp = getApp.handler({"httpMethod": "POST", "path": "/cars/telemetry", "body": json.dumps(samples)}, lambda_context)
+        result = json.loads(resp['body'])
+        assert result['accepted'] == 3 and result['coalesced'] == 1
+        assert result['written'] == 1 and result['unknown'] == 1
+        assert [r['index'] for r in result['rejected']] == [3]
+        # a move of about 120m is under the event threshold
+        assert result['events'] == 0
+        getApp.event_producer.event_backbone.put_events.assert_not_called()
+        aCar = getApp.car_repository.getCarUsingCarId("tele-1")
+        assert aCar['latitude'] == "37.776" and aCar['nb_passengers'] == 1 and aCar['version'] == 2
+
+        samples = [{"car_id": "tele-1", "lat": 37.7, "lon": -122.4194, "ts": 1}]
+        resp = getApp.handler({"httpMethod": "POST", "path": "/cars/telemetry", "body": json.dumps(samples)}, lambda_context)
+        assert json.loads(resp['body'])['stale'] == 1
+        assert getApp.car_repository.getCarUsingCarId("tele-1")['latitude'] == "37.776"
+
+    def test_shouldProduceEventOnTelemetryMoveOrStatusChange(self,lambda_context,getApp):
+        getApp.car_repository.createCar({"car_id": "tele-2", "model": "Model_1", "year": 2024, "status": "Available",
+                                         "latitude": "37.7749", "longitude": "-122.4194"})
+        getApp.event_producer.event_backbone.put_events.reset_mock()
+        samples = [{"car_id": "tele-2", "lat": 37.80, "lon": -122.4194, "ts": 10}]
+        resp = getApp.handler({"httpMethod": "POST", "path": "/cars/telemetry", "body": json.dumps(samples)}, lambda_context)
+        assert json.loads(resp['body'])['events'] == 1
+        samples = [{"car_id": "tele-2", "lat": 37.80, "lon": -122.4194, "status": "Rented", "ts": 11}]
+        resp = getApp.handler({"httpMethod": "POST", "path": "/cars/telemetry", "body": json.dumps(samples)}, lambda_context)
+        assert json.loads(resp['body'])['events'] == 1
+        assert getApp.event_producer.event_backbone.put_events.call_count == 2
+
+    def test_shouldReportTelemetryFailuresPerCar(self,lambda_context,getApp):
+        repository = getApp.car_repository
+        for car_id in ("tele-3", "tele-4"):
+            repository.createCar({"car_id": car_id, "model": "Model_1", "year": 2024, "status": "Available",
+                                  "latitude": "37.7749", "longitude": "-122.4194"})
+        # stored without a year, not a valid AutonomousCar
+        repository.createCar({"car_id": "tele-5", "model": "Model_1", "status": "Available",
+                              "latitude": "37.7749", "longitude": "-122.4194"})
+        getApp.event_producer.event_backbone.put_events.reset_mock()
+        recordTelemetry = repository.recordTelemetry
+        def failingRecord(sample):
+            if sample['car_id'] == "tele-4":
+                raise RuntimeError("throttled")
+            return recordTelemetry(sample)
+        samples = [{"car_id": car_id, "lat": 37.80, "lon": -122.4194, "ts": 1} for car_id in ("tele-3", "tele-4", "tele-5")]
+        with mock.patch.object(repository, "recordTelemetry", failingRecord):
+            resp = getApp.handler({"httpMethod": "POST", "path": "/cars/telemetry", "body": json.dumps(samples)}, lambda_context)
+        assert resp['statusCode'] == 200
+        result = json.loads(resp['body'])
+        assert result['written'] == 2 and result['failed'] == 1 and result['events'] == 1
+        assert [f['car_id'] for f in result['failures']] == ["tele-4", "tele-5"]
+        assert result['failures'][0]['error'] == "throttled"
+        assert result['failures'][1]['error'].startswith("written without event: year")
+        # the event of the car written is sent
+        entries = getApp.event_producer.event_backbone.put_events.call_args.kwargs['Entries']
+        assert [json.loads(entry['Detail'])['car_id'] for entry in entries] == ["tele-3"]
+
+    def test_shouldUpdateOnlyChangedAttributes(self,lambda_context,getApp):
+        getApp.car_repository.createCar({"car_id": "partial-1", "model": "Model_1", "year": 2024, "status": "Available",
+                                         "latitude": "37.7", "longitude": "-122.42", "bike_rack": True})
+        getApp.event_producer.event_backbone.put_events.reset_mock()
+        body = json.dumps({"latitude": "37.8", "longitude": "-122.42"})
+        resp = getApp.handler({"httpMethod": "PUT", "path": "/cars/partial-1", "body": body}, lambda_context)
+        assert json.loads(resp['body']) == {"status": "updated", "version": 2}
+        aCar = getApp.car_repository.getCarUsingCarId("partial-1")
+        assert aCar['latitude'] == "37.8"
+        assert aCar['bike_rack'] == True
+        assert aCar['model'] == "Model_1"
+        assert aCar['geo_cell'] == getApp.geo.encodeGeohash(37.8, -122.42, 5)
+        assert getApp.event_producer.event_backbone.put_events.call_count == 1
+        # replaying the same position is a no-op: no write and no event
+        resp = getApp.handler({"httpMethod": "PUT", "path": "/cars/partial-1", "body": body}, lambda_context)
+        assert json.loads(resp['body']) == {"status": "unchanged", "version": 2}
+        assert getApp.event_producer.event_backbone.put_events.call_count == 1
+
+    def test_shouldRejectStaleVersion(self,lambda_context,getApp):
+        body = json.dumps({"status": "Rented", "version": 1})
+        resp = getApp.handler({"httpMethod": "PUT", "path": "/cars/partial-1", "body": body}, lambda_context)
+        assert resp['statusCode'] == 409
+        assert getApp.car_repository.getCarUsingCarId("partial-1")['status'] == "Available"
+        body = json.dumps({"status": "Rented", "version": 2})
+        resp = getApp.handler({"httpMethod": "PUT", "path": "/cars/partial-1", "body": body}, lambda_context)
+        assert json.loads(resp['body']) == {"status": "updated", "version": 3}
+
+    def test_shouldRetryUpdateOnConcurrentChange(self,getApp):
+        repository = getApp.car_repository
+        planUpdate = repository.planUpdate
+        planned = []
+        def concurrentPlan(car, expected_version=None):
+            update = planUpdate(car, expected_version)
+            planned.append(update)
+            if len(planned) == 1:
+                # another writer bumps the version between the read and the write
+                repository.applyUpdate(planUpdate({"car_id": "partial-1", "nb_passengers": 2}))
+            return update
+        with mock.patch.object(repository, "planUpdate", side_effect=concurrentPlan):
+            update = repository.updateCar({"car_id": "partial-1", "status": "Available"})
+        assert len(planned) == 2
+        assert update.version == 5
+        assert repository.getCarUsingCarId("partial-1")['nb_passengers'] == 2
+
+    def test_shouldRejectInvalidUpdate(self,lambda_context,getApp):
+        body = json.dumps({"year": "next year"})
+        resp = getApp.handler({"httpMethod": "PUT", "path": "/cars/partial-1", "body": body}, lambda_context)
+        assert resp['statusCode'] == 400
+
+    def test_shouldIterateCarPages(self,getApp):
+        pages = list(getApp.car_repository.iterCarPages(page_size=1))
+        assert len(pages) >= 2
+        assert all(len(page) == 1 for page in pages)
 
 
     def test_shouldCreateANewCar(self,getApp):
@@ -107,8 +458,9 @@ class TestCarMgr:
             print(resp)
 
 
-    def test_shouldUpdateExistingCar(self,getApp):
-        aCar=getApp.getCarUsingCarId("1")
+    def test_shouldUpdateExistingCar(self,lambda_context,getApp):
+        aAPIevent={ "httpMethod": "GET", "path":"/cars/1"}
+        aCar=json.loads(getApp.handler(aAPIevent, lambda_context)['body'])
         aCar['status']="Rented"
         print(aCar)
         resp = getApp.car_repository.updateCar(aCar)
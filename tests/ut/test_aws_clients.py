@@ -0,0 +1,56 @@
+import json
+import time
+import pytest
+from unittest import mock
+
+import aws_clients
+from aws_clients import SecretCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def secret(secret_client):
+    secret_client.create_secret(Name="test_secret", SecretString=json.dumps({"username": "postgres"}))
+    yield "test_secret"
+    secret_client.delete_secret(SecretId="test_secret", ForceDeleteWithoutRecovery=True)
+
+
+def test_clients_are_created_once():
+    with mock.patch('boto3.client') as mock_boto3_client:
+        assert aws_clients.client('events') is aws_clients.client('events')
+        assert mock_boto3_client.call_count == 1
+
+
+def test_secret_is_cached_until_ttl(secret):
+    clock = FakeClock()
+    cache = SecretCache(ttl=10, clock=clock)
+    with mock.patch.object(cache, "_load", wraps=cache._load) as load:
+        assert cache.get(secret) == {"username": "postgres"}
+        clock.now = 9
+        cache.get(secret)
+        assert load.call_count == 1
+        clock.now = 11
+        cache.get(secret)
+        assert load.call_count == 2
+
+
+def test_secret_refreshed_in_background(secret, secret_client):
+    clock = FakeClock()
+    cache = SecretCache(ttl=10, background_refresh=True, clock=clock)
+    assert cache.get(secret)["username"] == "postgres"
+    secret_client.put_secret_value(SecretId=secret, SecretString=json.dumps({"username": "admin"}))
+    clock.now = 9
+    # the current value is served while the refresh runs
+    assert cache.get(secret)["username"] == "postgres"
+    for _ in range(50):
+        if not cache.refreshing:
+            break
+        time.sleep(0.01)
+    assert cache.get(secret)["username"] == "admin"
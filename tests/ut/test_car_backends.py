@@ -0,0 +1,136 @@
+import pytest
+from boto3 import resource
+
+from car_repository import GEO_INDEX_NAME, CarNotFoundError, CarVersionConflictError, newCarRepository
+
+TABLE_NAME="backend_test_cars"
+STATS_TABLE_NAME="backend_test_car_stats"
+
+
+@pytest.fixture(params=["memory", "sqlite", "dynamodb"])
+def repository(request, dynamodb_client):
+    definition = {"backend": request.param, "table_name": TABLE_NAME, "fleet_stats": True}
+    if request.param != "dynamodb":
+        yield newCarRepository(definition)
+        return
+    dynamodb_client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'geo_cell', 'AttributeType': 'S'}],
+        GlobalSecondaryIndexes=[{'IndexName': GEO_INDEX_NAME,
+                                 'KeySchema': [{'AttributeName': 'geo_cell', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'car_id', 'KeyType': 'RANGE'}],
+                                 'Projection': {'ProjectionType': 'ALL'}}],
+        BillingMode='PAY_PER_REQUEST')
+    dynamodb_client.create_table(
+        TableName=STATS_TABLE_NAME,
+        KeySchema=[{'AttributeName': 'stats_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'stats_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    yield newCarRepository(dict(definition, resource=resource('dynamodb'), stats_table_name=STATS_TABLE_NAME))
+    dynamodb_client.delete_table(TableName=TABLE_NAME)
+    dynamodb_client.delete_table(TableName=STATS_TABLE_NAME)
+
+
+def newCar(car_id: str, **attributes) -> dict:
+    return dict({"car_id": car_id, "model": "Model_1", "year": 2024, "status": "Available",
+                 "latitude": "37.7749", "longitude": "-122.4194"}, **attributes)
+
+
+def test_create_get_and_delete(repository):
+    repository.createCar(newCar("car-1"))
+    car = repository.getCarUsingCarId("car-1")
+    assert car['status'] == "Available" and car['version'] == 1 and car['geo_cell'] == "9q8yy"
+    assert repository.getCarUsingCarId("car-1", fields=["model"]) == {"car_id": "car-1", "model": "Model_1"}
+    repository.deleteCar("car-1")
+    with pytest.raises(CarNotFoundError):
+        repository.getCarUsingCarId("car-1")
+
+
+def test_pages_cover_the_fleet_once(repository):
+    results = repository.createCars([newCar(f"car-{i}") for i in range(7)])
+    assert all(result['status'] == "created" for result in results)
+    seen = [car['car_id'] for page in repository.iterCarPages(page_size=3) for car in page]
+    assert sorted(seen) == sorted(f"car-{i}" for i in range(7))
+    cars, cursor = repository.getCarsPage(limit=3)
+    assert len(cars) == 3 and cursor is not None
+
+
+def test_versioned_partial_update(repository):
+    repository.createCar(newCar("car-1"))
+    update = repository.updateCar({"car_id": "car-1", "status": "Rented", "model": "Model_1"})
+    assert update.changes == {"status": "Rented"} and update.version == 2
+    assert repository.updateCar({"car_id": "car-1", "status": "Rented"}).changes == {}
+    with pytest.raises(CarVersionConflictError):
+        repository.updateCar({"car_id": "car-1", "status": "Free", "version": 1})
+    car = repository.getCarUsingCarId("car-1")
+    assert car['status'] == "Rented" and car['version'] == 2
+
+
+def test_telemetry_ordering(repository):
+    repository.createCar(newCar("car-1"))
+    outcome, previous, car = repository.recordTelemetry({"car_id": "car-1", "lat": 37.78, "lon": -122.41, "ts": 10})
+    assert outcome == "written" and previous['latitude'] == "37.7749" and car['version'] == 2
+    assert repository.recordTelemetry({"car_id": "car-1", "lat": 37.7, "lon": -122.41, "ts": 9})[0] == "stale"
+    assert repository.recordTelemetry({"car_id": "car-2", "lat": 37.7, "lon": -122.41, "ts": 9})[0] == "unknown"
+    assert repository.getCarUsingCarId("car-1")['latitude'] == "37.78"
+
+
+def test_nearby_cars(repository):
+    repository.createCars([newCar("near", latitude="37.7750", longitude="-122.4195"),
+                           newCar("rented", latitude="37.7751", longitude="-122.4194", status="Rented"),
+                           newCar("far", latitude="40.7128", longitude="-74.0060")])
+    cars = repository.findCarsNearby(37.7749, -122.4194, 1000, status="Available")
+    assert [car['car_id'] for car in cars] == ["near"]
+
+
+def test_nearby_cars_at_high_latitude(repository):
+    # the cells narrow toward the poles, a 10 km circle at 70N covers 65 of them
+    repository.createCar(newCar("tromso", latitude="70.0500", longitude="19.0000"))
+    cars = repository.findCarsNearby(70.0, 19.0, 10000)
+    assert [car['car_id'] for car in cars] == ["tromso"]
+
+
+def test_fleet_stats_follow_the_writes(repository):
+    repository.createCars([newCar("car-1"), newCar("car-2", bike_rack=True), newCar("car-3", model="Model_2")])
+    repository.createCar(newCar("car-1", status="Rented"))
+    repository.updateCar({"car_id": "car-2", "status": "Maintenance"})
+    repository.updateCar({"car_id": "car-2", "status": "Maintenance"})
+    repository.recordTelemetry({"car_id": "car-3", "lat": 37.78, "lon": -122.41, "status": "Rented", "ts": 1})
+    repository.deleteCar("car-1")
+    expected = {"total": 2, "status": {"Maintenance": 1, "Rented": 1}, "model": {"Model_1": 1, "Model_2": 1},
+                "bike_rack": {"true": 1, "false": 1}}
+    assert repository.getFleetStats() == expected
+    repository._addStats({"total": 5, "status#Available": 5})
+    rebuilt = repository.rebuildFleetStats(segments=2)
+    assert rebuilt.pop('rebuilt_at') and rebuilt == expected
+    stats = repository.getFleetStats()
+    assert stats.pop('rebuilt_at') and stats == expected
+
+
+def test_observers_are_notified_after_the_write(repository, monkeypatch):
+    observed = []
+    def observe(changes):
+        for before, after in changes:
+            car_id = (after or before)['car_id']
+            stored = repository._readCar(car_id, consistent=True)
+            observed.append((car_id, stored and stored['status']))
+    repository.observeWrites(observe)
+    repository.createCar(newCar("obs-1"))
+    repository.createCars([newCar("obs-2")])
+    repository.updateCar({"car_id": "obs-1", "status": "Rented"})
+    repository.recordTelemetry({"car_id": "obs-2", "lat": 37.78, "lon": -122.41, "status": "Maintenance", "ts": 1})
+    repository.deleteCar("obs-1")
+    # the observers see each car as written
+    assert observed == [("obs-1", "Available"), ("obs-2", "Available"), ("obs-1", "Rented"),
+                        ("obs-2", "Maintenance"), ("obs-1", None)]
+    def failedWrite(*args, **kwargs):
+        raise RuntimeError("write failed")
+    if hasattr(repository, "_put"):
+        monkeypatch.setattr(repository, "_put", failedWrite)
+    else:
+        monkeypatch.setattr(repository.table, "put_item", failedWrite)
+    with pytest.raises(RuntimeError):
+        repository.createCar(newCar("obs-3"))
+    assert len(observed) == 5 and repository.getFleetStats()['total'] == 1
@@ -0,0 +1,93 @@
+import base64
+import json
+import boto3
+import pytest
+from boto3 import resource
+from unittest import mock
+
+import car_consumer
+
+TABLE_NAME="consumer_test_cars"
+
+
+@pytest.fixture(scope="module")
+def consumer(dynamodb_client):
+    dynamodb_client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    saved = (car_consumer.car_repository, car_consumer.event_producer)
+    car_consumer.car_repository = car_consumer.CarRepository({"resource": resource('dynamodb'), "table_name": TABLE_NAME})
+    car_consumer.event_producer = car_consumer.CarEventProducer({"event_bus": "test_event_bus"})
+    car_consumer.event_producer.event_backbone = mock.Mock()
+    car_consumer.event_producer.event_backbone.put_events.return_value = {"FailedEntryCount": 0, "Entries": []}
+    for i in range(3):
+        car_consumer.car_repository.createCar({"car_id": f"queued-{i}", "model": "Model_1", "year": 2024,
+                                               "status": "Available"})
+    yield car_consumer
+    car_consumer.car_repository, car_consumer.event_producer = saved
+
+
+def sqs_records(messages: list) -> dict:
+    """Send the messages to a moto queue and receive them in the Lambda event source format"""
+    sqs = boto3.client("sqs", region_name="us-west-2")
+    queue_url = sqs.create_queue(QueueName="car-updates")['QueueUrl']
+    for message in messages:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
+    received = []
+    while len(received) < len(messages):
+        received.extend(sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get('Messages', []))
+    return {"Records": [{"messageId": m['MessageId'], "body": m['Body'], "eventSource": "aws:sqs"} for m in received]}
+
+
+def kinesis_records(messages: list) -> dict:
+    """Put the messages in a moto stream and read them in the Lambda event source format"""
+    kinesis = boto3.client("kinesis", region_name="us-west-2")
+    kinesis.create_stream(StreamName="car-updates", ShardCount=1)
+    for message in messages:
+        kinesis.put_record(StreamName="car-updates", Data=json.dumps(message), PartitionKey=message['car_id'])
+    shard_id = kinesis.describe_stream(StreamName="car-updates")['StreamDescription']['Shards'][0]['ShardId']
+    iterator = kinesis.get_shard_iterator(StreamName="car-updates", ShardId=shard_id,
+                                          ShardIteratorType="TRIM_HORIZON")['ShardIterator']
+    records = kinesis.get_records(ShardIterator=iterator)['Records']
+    return {"Records": [{"eventSource": "aws:kinesis",
+                         "kinesis": {"sequenceNumber": r['SequenceNumber'],
+                                     "data": base64.b64encode(r['Data']).decode()}} for r in records]}
+
+
+def test_sqs_updates_are_merged_per_car(consumer, lambda_context):
+    consumer.event_producer.event_backbone.put_events.reset_mock()
+    event = sqs_records([{"car_id": "queued-0", "status": "Rented"},
+                         {"car_id": "queued-0", "nb_passengers": 2},
+                         {"car_id": "queued-1", "status": "Maintenance"},
+                         {"car_id": "queued-2", "status": "Available"},
+                         {"status": "no car_id"}])
+    with mock.patch.object(consumer.car_repository, "applyUpdate", wraps=consumer.car_repository.applyUpdate) as apply:
+        result = consumer.handler(event, lambda_context)
+    assert result == {"batchItemFailures": []}
+    # queued-2 is unchanged, queued-0 is written once for its two records
+    assert sorted(call.args[0].car_id for call in apply.call_args_list) == ["queued-0", "queued-1"]
+    car = consumer.car_repository.getCarUsingCarId("queued-0")
+    assert car['status'] == "Rented" and car['nb_passengers'] == 2
+    sent = consumer.event_producer.event_backbone.put_events.call_args.kwargs['Entries']
+    assert len(sent) == 2
+
+
+def test_kinesis_reports_failed_car_records(consumer, lambda_context):
+    event = kinesis_records([{"car_id": "queued-1", "status": "Rented"},
+                             {"car_id": "queued-2", "status": "Rented"},
+                             {"car_id": "queued-1", "nb_passengers": 3}])
+    applyUpdate = consumer.car_repository.applyUpdate
+
+    def failingApply(update, outbox_entry=None):
+        if update.car_id == "queued-1":
+            raise RuntimeError("throttled")
+        return applyUpdate(update, outbox_entry=outbox_entry)
+
+    with mock.patch.object(consumer.car_repository, "applyUpdate", side_effect=failingApply):
+        result = consumer.handler(event, lambda_context)
+    sequences = [r['kinesis']['sequenceNumber'] for r in event['Records']]
+    assert result == {"batchItemFailures": [{"itemIdentifier": sequences[0]}, {"itemIdentifier": sequences[2]}]}
+    assert consumer.car_repository.getCarUsingCarId("queued-2")['status'] == "Rented"
+    assert consumer.car_repository.getCarUsingCarId("queued-1")['status'] == "Maintenance"
@@ -1,5 +1,5 @@
 
-from acm_model import AutonomousCar, AutonomousCarEvent
+from acm_model import AutonomousCar, AutonomousCarEvent, validateCars
 import json 
 from pydantic.json import pydantic_encoder
 
@@ -12,10 +12,10 @@ def test_car_serialization():
                 )                  
     print(aCar)
     outCar=aCar.model_dump_json()
-    assert outCar == '{"car_id":"car01","model":"Model_1","year":2024,"status":"Available","latitude":null,"longitude":null,"nb_passengers":0,"bike_rack":false,"created_at":null,"updated_at":null}'
+    assert outCar == '{"car_id":"car01","model":"Model_1","year":2024,"status":"Available","latitude":null,"longitude":null,"nb_passengers":0,"seats":null,"bike_rack":false,"created_at":null,"updated_at":null}'
     outCar=json.dumps(aCar, default=pydantic_encoder)
     print(outCar)
-    assert outCar == '{"car_id": "car01", "model": "Model_1", "year": 2024, "status": "Available", "latitude": null, "longitude": null, "nb_passengers": 0, "bike_rack": false, "created_at": null, "updated_at": null}'
+    assert outCar == '{"car_id": "car01", "model": "Model_1", "year": 2024, "status": "Available", "latitude": null, "longitude": null, "nb_passengers": 0, "seats": null, "bike_rack": false, "created_at": null, "updated_at": null}'
     
 
 def test_car_deserialization():
@@ -32,6 +32,18 @@ def test_createEvent():
                 )
     aEvent = AutonomousCarEvent.fromAutonomousCar(aCar,"a.test.event.type")
     assert aEvent.status == "Available"
+    assert aEvent.model_dump_json() == '{"car_id":"XXXXX","model":"Model_1","year":2024,"status":"Available","latitude":null,"longitude":null,"nb_passengers":0,"bike_rack":false,"event_type":"a.test.event.type","event_source":"acs.acm","event_version":"1.0"}'
+
+
+def test_validate_cars_in_bulk():
+    cars = [{"car_id": "1", "model": "Model_1", "year": 2024, "status": "Available"},
+            {"car_id": "2", "model": "Model_1", "year": "not a year", "status": "Available"},
+            {"car_id": "3", "model": "Model_2", "year": "2023", "status": "Rented"}]
+    models, errors = validateCars(cars)
+    assert [aCar.car_id for aCar in models] == ["1", "3"]
+    assert models[1].year == 2023
+    assert list(errors) == [1]
+    assert errors[1][0]['loc'] == ("year",)
     
 
 def test_car_to_dict():
@@ -0,0 +1,38 @@
+from car_repository import batchWriteItems, BATCH_WRITE_SIZE
+
+
+class FakeBatchClient:
+    """Leave the last item of each request unprocessed for the first `throttled` calls"""
+
+    def __init__(self, throttled: int):
+        self.throttled = throttled
+        self.requests = []
+
+    def batch_write_item(self, RequestItems):
+        requests = RequestItems["acm_cars"]
+        self.requests.append(len(requests))
+        if self.throttled > 0:
+            self.throttled -= 1
+            return {"UnprocessedItems": {"acm_cars": requests[-1:]}}
+        return {"UnprocessedItems": {}}
+
+
+def test_batch_write_chunks_items():
+    client = FakeBatchClient(throttled=0)
+    failed = batchWriteItems(client, "acm_cars", [{"car_id": str(i)} for i in range(60)], base_delay=0)
+    assert failed == {}
+    assert client.requests == [BATCH_WRITE_SIZE, BATCH_WRITE_SIZE, 10]
+
+
+def test_batch_write_retries_unprocessed_items():
+    client = FakeBatchClient(throttled=2)
+    failed = batchWriteItems(client, "acm_cars", [{"car_id": str(i)} for i in range(3)], base_delay=0)
+    assert failed == {}
+    assert client.requests == [3, 1, 1]
+
+
+def test_batch_write_reports_items_unprocessed_after_retries():
+    client = FakeBatchClient(throttled=10)
+    failed = batchWriteItems(client, "acm_cars", [{"car_id": str(i)} for i in range(3)], max_attempts=3, base_delay=0)
+    assert list(failed) == ["2"]
+    assert client.requests == [3, 1, 1]
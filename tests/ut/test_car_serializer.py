@@ -0,0 +1,26 @@
+import datetime, json
+from decimal import Decimal
+
+import pytest
+
+from car_serializer import carSerializer, jsonSerializer
+
+ITEM = {"car_id": "1", "year": Decimal("2024"), "max_passenger": Decimal("4"), "score": Decimal("0.5"),
+        "tags": {"b", "a"}, "created_at": datetime.datetime(2024, 1, 2, 3, 4, 5)}
+EXPECTED = {"car_id": "1", "year": 2024, "max_passenger": 4, "score": 0.5,
+            "tags": ["a", "b"], "created_at": "2024-01-02T03:04:05"}
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_encode_dynamodb_types(backend):
+    serializer = carSerializer(backend)
+    assert json.loads(serializer({"cars": [ITEM], "next_cursor": None})) == {"cars": [EXPECTED], "next_cursor": None}
+
+
+def test_integral_decimal_is_an_int():
+    assert jsonSerializer({"year": Decimal("2024"), "big": Decimal("1E+3")}) == '{"year":2024,"big":1000}'
+
+
+def test_reject_unknown_type():
+    with pytest.raises(TypeError):
+        jsonSerializer({"car": object()})
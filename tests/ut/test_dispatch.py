@@ -0,0 +1,144 @@
+import json
+import pytest
+
+import app
+from car_repository import newCarRepository
+from dispatch import AvailableCars, Dispatcher, RESERVED
+
+
+class CountingEventBridge:
+    def put_events(self, Entries):
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": "1"} for _ in Entries]}
+
+
+def car(car_id: str, lat: float, lon: float, seats: int = None, passengers: int = 0, bike_rack: bool = False,
+        status: str = "Available") -> dict:
+    """An empty car, with the default seat capacity unless seats is given"""
+    aCar = {"car_id": car_id, "model": "Model_1", "year": 2024, "status": status, "latitude": str(lat),
+            "longitude": str(lon), "nb_passengers": passengers, "bike_rack": bike_rack}
+    if seats is not None:
+        aCar["seats"] = seats
+    return aCar
+
+
+def test_rank_by_distance_and_empty_seats():
+    cars = AvailableCars(capacity=2)
+    for c in [car("far", 37.7900, -122.4000), car("near", 37.7750, -122.4190),
+              car("van", 37.7751, -122.4191, seats=7), car("taken", 37.7749, -122.4194, status="Rented"),
+              car("bike", 37.7800, -122.4100, bike_rack=True), car("nowhere", None, None),
+              car("full", 37.7749, -122.4194, passengers=4), car("shared", 37.7749, -122.4194, seats=7, passengers=5)]:
+        cars.apply(c)
+    # rows grow past the initial capacity
+    assert len(cars) == 6
+    ranked = cars.rank(37.7749, -122.4194)
+    # the full car has no free seat, the 2 left in the shared one fit one rider best
+    assert [car_id for car_id, _ in ranked] == ["shared", "near", "van", "bike", "far"]
+    assert ranked[1][1] < 50
+    assert [car_id for car_id, _ in cars.rank(37.7749, -122.4194, party_size=3)] == ["near", "van", "bike", "far"]
+    assert [car_id for car_id, _ in cars.rank(37.7749, -122.4194, party_size=5)] == ["van"]
+    assert [car_id for car_id, _ in cars.rank(37.7749, -122.4194, bike_rack=True)] == ["bike"]
+    assert [car_id for car_id, _ in cars.rank(37.7749, -122.4194, radius=100)] == ["shared", "near", "van"]
+    assert len(cars.rank(37.7749, -122.4194, limit=2)) == 2
+
+
+def test_rank_across_the_antimeridian():
+    cars = AvailableCars()
+    cars.apply(car("east", 0.0, -179.9995))
+    for i in range(5):
+        cars.apply(car(f"west{i}", 0.0, 179.99 - i * 0.001))
+    # the shortlist of a single candidate keeps the car 111 m away across the antimeridian
+    ranked = cars.rank(0.0, 179.9995, limit=1)
+    assert [car_id for car_id, _ in ranked] == ["east"]
+    assert ranked[0][1] < 120
+
+
+def test_removed_rows_are_reused():
+    cars = AvailableCars(capacity=4)
+    cars.apply(car("a", 1.0, 1.0))
+    cars.apply(car("b", 1.0, 1.001))
+    cars.apply(dict(car("a", 1.0, 1.0), status=RESERVED))
+    cars.apply(car("c", 1.0, 1.002))
+    assert cars.size == 2 and cars.rows == {"b": 1, "c": 0}
+    assert [car_id for car_id, _ in cars.rank(1.0, 1.0)] == ["b", "c"]
+
+
+def test_snapshot_follows_the_writes():
+    repository = newCarRepository({"backend": "memory"})
+    repository.createCars([car("a", 48.8566, 2.3522), car("b", 48.8570, 2.3530)])
+    now = [0.0]
+    dispatcher = Dispatcher(reload_seconds=60, clock=lambda: now[0])
+    assert [car_id for car_id, _ in dispatcher.rank(repository, 48.8566, 2.3522)] == ["a", "b"]
+    # incremental: no reload on the writes of this container
+    repository.iterFleetPages = None
+    repository.updateCar({"car_id": "a", "status": "Rented"})
+    repository.createCar(car("c", 48.8567, 2.3523))
+    repository.deleteCar("b")
+    assert [car_id for car_id, _ in dispatcher.rank(repository, 48.8566, 2.3522)] == ["c"]
+    del repository.iterFleetPages
+    # a full reload catches the writes of other containers
+    repository.items["a"]["status"] = "Available"
+    now[0] = 60.0
+    assert [car_id for car_id, _ in dispatcher.rank(repository, 48.8566, 2.3522)] == ["a", "c"]
+
+
+@pytest.fixture
+def dispatchApp(monkeypatch):
+    import dispatch
+    repository = newCarRepository({"backend": "memory"})
+    monkeypatch.setattr(app, "car_repository", repository)
+    monkeypatch.setattr(app, "event_producer", app.CarEventProducer({"event_bus": "test", "client": CountingEventBridge()}))
+    monkeypatch.setattr(dispatch, "dispatcher", Dispatcher())
+    return repository
+
+
+def dispatchRequest(body: dict) -> dict:
+    return {"httpMethod": "POST", "path": "/dispatch", "body": json.dumps(body)}
+
+
+def test_dispatch_reserves_each_car_once(dispatchApp, lambda_context):
+    dispatchApp.createCars([car("d1", 40.7128, -74.0060), car("d2", 40.7130, -74.0062)])
+    ride = {"lat": 40.7128, "lon": -74.0060}
+    first = app.handler(dispatchRequest(ride), lambda_context)
+    assert first["statusCode"] == 200
+    assert json.loads(first["body"])["car_id"] == "d1"
+    assert dispatchApp.getCarUsingCarId("d1")["status"] == RESERVED
+    assert json.loads(app.handler(dispatchRequest(ride), lambda_context)["body"])["car_id"] == "d2"
+    assert app.handler(dispatchRequest(ride), lambda_context)["statusCode"] == 404
+    assert app.handler(dispatchRequest({"lat": 91, "lon": 0}), lambda_context)["statusCode"] == 400
+
+
+def test_dispatch_empty_car_without_seats(dispatchApp, lambda_context):
+    # created through the API: no seats, no passengers
+    dispatchApp.createCar({"car_id": "f1", "model": "Model_1", "year": 2024, "status": "Available",
+                           "latitude": "40.7128", "longitude": "-74.0060"})
+    response = app.handler(dispatchRequest({"lat": 40.7128, "lon": -74.0060, "party_size": 4}), lambda_context)
+    assert json.loads(response["body"])["car_id"] == "f1"
+    assert app.handler(dispatchRequest({"lat": 40.7128, "lon": -74.0060}), lambda_context)["statusCode"] == 404
+
+
+def test_dispatch_skips_cars_taken_elsewhere(dispatchApp, lambda_context):
+    dispatchApp.createCars([car("e1", 40.7128, -74.0060), car("e2", 40.7130, -74.0062)])
+    ride = {"lat": 40.7128, "lon": -74.0060}
+    import dispatch
+    dispatch.dispatcher.snapshot(dispatchApp)
+    # another container rents e1, unseen by the snapshot
+    dispatchApp.items["e1"]["status"] = "Rented"
+    response = app.handler(dispatchRequest(ride), lambda_context)
+    assert json.loads(response["body"])["car_id"] == "e2"
+    assert "e1" not in dispatch.dispatcher.cars.rows
+    # a stale candidate left alone is lost
+    dispatch.dispatcher.cars.apply(dict(dispatchApp.items["e2"], status="Available"))
+    assert app.handler(dispatchRequest(ride), lambda_context)["statusCode"] == 409
+
+
+def test_dispatch_skips_boarded_and_invalid_cars(dispatchApp, lambda_context):
+    dispatchApp.createCars([car("g1", 40.7128, -74.0060), car("g2", 40.71285, -74.00605),
+                            car("g3", 40.7130, -74.0062)])
+    import dispatch
+    dispatch.dispatcher.snapshot(dispatchApp)
+    # unseen by the snapshot: passengers boarded g1, g2 is stored without a year
+    dispatchApp.items["g1"]["nb_passengers"] = 3
+    del dispatchApp.items["g2"]["year"]
+    response = app.handler(dispatchRequest({"lat": 40.7128, "lon": -74.0060, "party_size": 2}), lambda_context)
+    assert json.loads(response["body"])["car_id"] == "g3"
+    assert dispatchApp.items["g2"]["status"] == "Available"
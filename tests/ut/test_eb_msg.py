@@ -29,3 +29,82 @@ def test_send_event_producer():
 
 
 
+
+
+def failing_put_events(fail_first: int):
+    """Build a put_events side effect failing the first `fail_first` entries of its first call"""
+    calls = []
+    def put_events(Entries):
+        calls.append(len(Entries))
+        failed = fail_first if len(calls) == 1 else 0
+        results = [{'ErrorCode': 'ThrottlingException'} if i < failed else {'EventId': str(i)} for i in range(len(Entries))]
+        return {'FailedEntryCount': failed, 'Entries': results}
+    return put_events, calls
+
+
+def test_flush_batches_buffered_events():
+    with mock.patch('boto3.client') as mock_boto3_client:
+        client = mock.Mock()
+        put_events, calls = failing_put_events(0)
+        client.put_events.side_effect = put_events
+        mock_boto3_client.return_value = client
+        producer = app.CarEventProducer(app.DEFAULT_EVENT_PRODUCER)
+        for i in range(23):
+            producer.bufferCarEvent(app.AutonomousCar(model="Model_2",car_id=str(i),status="Available",year=2024),"a.test.event")
+        assert calls == []
+        stats = producer.flush()
+        assert calls == [10, 10, 3]
+        assert stats == {"sent": 23, "retried": 0, "failed": 0}
+        assert producer.flush() == {"sent": 0, "retried": 0, "failed": 0}
+
+
+def test_flush_retries_only_failed_entries():
+    with mock.patch('boto3.client') as mock_boto3_client:
+        client = mock.Mock()
+        put_events, calls = failing_put_events(2)
+        client.put_events.side_effect = put_events
+        mock_boto3_client.return_value = client
+        producer = app.CarEventProducer(app.DEFAULT_EVENT_PRODUCER)
+        producer.base_delay = 0
+        cars = [app.AutonomousCar(model="Model_2",car_id=str(i),status="Available",year=2024) for i in range(5)]
+        stats = producer.produceCarEvents(cars, "a.test.event")
+        assert calls == [5, 2]
+        assert stats == {"sent": 5, "retried": 2, "failed": 0}
+
+
+def test_flush_splits_on_request_size():
+    with mock.patch('boto3.client') as mock_boto3_client:
+        client = mock.Mock()
+        put_events, calls = failing_put_events(0)
+        client.put_events.side_effect = put_events
+        mock_boto3_client.return_value = client
+        producer = app.CarEventProducer(app.DEFAULT_EVENT_PRODUCER)
+        for size in (100 * 1024, 100 * 1024, 100 * 1024, 300 * 1024):
+            producer.bufferEntry({'Source': 'acs.acm', 'DetailType': 'a.test.event', 'Detail': "x" * size})
+        stats = producer.flush()
+        assert calls == [2, 1]
+        assert stats == {"sent": 3, "retried": 0, "failed": 1}
+
+
+def test_flush_reports_the_automatic_flushes():
+    with mock.patch('boto3.client') as mock_boto3_client:
+        client = mock.Mock()
+        calls = []
+        def put_events(Entries):
+            # the third batch, sent by the automatic flush, always fails
+            calls.append([json.loads(entry['Detail'])['car_id'] for entry in Entries])
+            failing = calls[-1][0] == "20"
+            results = [{'ErrorCode': 'InternalFailure'} if failing else {'EventId': '1'} for _ in Entries]
+            return {'FailedEntryCount': len(Entries) if failing else 0, 'Entries': results}
+        client.put_events.side_effect = put_events
+        mock_boto3_client.return_value = client
+        producer = app.CarEventProducer(app.DEFAULT_EVENT_PRODUCER)
+        producer.base_delay = 0
+        for i in range(600):
+            producer.bufferCarEvent(app.AutonomousCar(model="Model_2",car_id=str(i),status="Available",year=2024),"a.test.event")
+        # the buffer was sent once full
+        assert len(producer.buffer) == 100
+        stats = producer.flush()
+        assert stats == {"sent": 590, "retried": 3 * 10, "failed": 10}
+        assert [json.loads(entry['Detail'])['car_id'] for entry in producer.failed_entries] == [str(i) for i in range(20, 30)]
+        assert producer.flush() == {"sent": 0, "retried": 0, "failed": 0} and producer.failed_entries == []
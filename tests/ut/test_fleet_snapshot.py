@@ -0,0 +1,67 @@
+import gzip
+import json
+import boto3
+import pytest
+from moto import mock_aws
+
+import app
+import fleet_snapshot
+from car_repository import newCarRepository
+from fleet_snapshot import FleetSnapshotStore
+
+BUCKET="test-car-snapshots"
+
+
+@pytest.fixture
+def store(aws_credentials):
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-west-2")
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "us-west-2"})
+        yield FleetSnapshotStore({"bucket": BUCKET, "client": s3, "pointer_ttl": 0})
+
+
+@pytest.fixture
+def repository():
+    repository = newCarRepository({"backend": "memory"})
+    repository.createCars([{"car_id": f"car-{i}", "model": "Model_1", "year": 2024, "status": "Available",
+                            **({"bike_rack": True} if i % 2 else {})} for i in range(5)])
+    return repository
+
+
+def read(store, pointer) -> bytes:
+    return gzip.decompress(store.s3.get_object(Bucket=BUCKET, Key=pointer["key"])["Body"].read())
+
+
+def test_rows_and_columns_snapshots(store, repository):
+    pointers = store.build(repository.iterFleetPages())
+    assert pointers["rows"]["version"] == pointers["columns"]["version"] and pointers["rows"]["count"] == 5
+    rows = [json.loads(line) for line in read(store, pointers["rows"]).splitlines()]
+    assert sorted(car["car_id"] for car in rows) == [f"car-{i}" for i in range(5)]
+    snapshot = json.loads(read(store, pointers["columns"]))
+    assert snapshot["count"] == 5 and snapshot["columns"]["car_id"] == [car["car_id"] for car in rows]
+    # bike_rack is missing from the first car
+    assert snapshot["columns"]["bike_rack"] == [None, True, None, True, None]
+    assert store.latest("rows") == pointers["rows"]
+
+
+def test_unchanged_fleet_keeps_its_version(store, repository):
+    first = store.build(repository.iterFleetPages(), formats=["rows"])["rows"]
+    assert store.build(repository.iterFleetPages(), formats=["rows"])["rows"] == first
+    assert store.s3.list_objects_v2(Bucket=BUCKET)["KeyCount"] == 2
+    repository.updateCar({"car_id": "car-1", "status": "Rented"})
+    assert store.build(repository.iterFleetPages(), formats=["rows"])["rows"]["version"] != first["version"]
+
+
+def test_snapshot_route_answers_304_for_the_latest_version(store, repository, lambda_context, monkeypatch):
+    monkeypatch.setattr(app, "snapshot_store", store)
+    event = {"httpMethod": "GET", "path": "/cars/snapshot", "queryStringParameters": {"format": "columns"}}
+    assert app.handler(event, lambda_context)["statusCode"] == 404
+    store.build(repository.iterFleetPages())
+    response = app.handler(event, lambda_context)
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    etag = response["multiValueHeaders"]["ETag"][0]
+    assert etag == f'"{body["version"]}"' and body["count"] == 5 and BUCKET in body["url"]
+    response = app.handler(dict(event, headers={"If-None-Match": etag}), lambda_context)
+    assert response["statusCode"] == 304 and not response["body"]
+    assert app.handler(dict(event, queryStringParameters={"format": "xml"}), lambda_context)["statusCode"] == 400
@@ -0,0 +1,34 @@
+import geo
+
+
+def test_encode_geohash():
+    assert geo.encodeGeohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geo.encodeGeohash(37.7749, -122.4194, 5) == "9q8yy"
+
+
+def test_distance():
+    # San Francisco to Los Angeles
+    d = geo.distance(37.7749, -122.4194, 34.0522, -118.2437)
+    assert 558000 < d < 561000
+    assert geo.distance(10, 10, 10, 10) == 0
+
+
+def test_covering_cells_contains_neighbors():
+    cells = geo.coveringCells(37.7749, -122.4194, 3000, 5)
+    assert "9q8yy" in cells
+    # every point on the circle bounding box falls in a covering cell
+    for lat, lon in ((37.80, -122.4194), (37.75, -122.4194), (37.7749, -122.45), (37.7749, -122.385)):
+        assert geo.encodeGeohash(lat, lon, 5) in cells
+    assert len(cells) <= 9
+
+
+def test_covering_cells_wraps_antimeridian():
+    cells = geo.coveringCells(0.0, 179.99, 5000, 5)
+    assert geo.encodeGeohash(0.0, -179.99, 5) in cells
+
+
+def test_parse_coordinates():
+    assert geo.parseCoordinates("37.7", "-122.42") == (37.7, -122.42)
+    assert geo.parseCoordinates(None, "1") is None
+    assert geo.parseCoordinates("north", "1") is None
+    assert geo.parseCoordinates("91", "1") is None
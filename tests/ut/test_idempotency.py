@@ -0,0 +1,86 @@
+import json
+import boto3
+import pytest
+from moto import mock_aws
+
+import app
+from car_idempotency import IdempotentWrites, REPLAYED_HEADER
+from car_repository import newCarRepository
+
+TABLE_NAME = "test_idempotency"
+
+
+class CountingEventBridge:
+    def __init__(self):
+        self.calls = 0
+
+    def put_events(self, Entries):
+        self.calls += 1
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": "1"} for _ in Entries]}
+
+
+@pytest.fixture
+def idempotentApp(aws_credentials, monkeypatch):
+    with mock_aws():
+        client = boto3.client("dynamodb", region_name="us-west-2")
+        client.create_table(TableName=TABLE_NAME, KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+                            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+                            BillingMode="PAY_PER_REQUEST")
+        monkeypatch.setattr(app, "idempotent_writes", IdempotentWrites({"table_name": TABLE_NAME, "client": client}))
+        monkeypatch.setattr(app, "car_repository", newCarRepository({"backend": "memory"}))
+        monkeypatch.setattr(app, "event_producer", app.CarEventProducer({"event_bus": "test", "client": CountingEventBridge()}))
+        yield app
+
+
+def post(body: dict, key: str) -> dict:
+    return {"httpMethod": "POST", "path": "/cars", "headers": {"Idempotency-Key": key}, "body": json.dumps(body)}
+
+
+def test_retry_gets_the_stored_response(idempotentApp, lambda_context, monkeypatch):
+    car = {"car_id": "idem-1", "model": "Model_1", "year": 2024}
+    first = idempotentApp.handler(post(car, "key-1"), lambda_context)
+    assert first["statusCode"] == 200 and REPLAYED_HEADER not in first["multiValueHeaders"]
+    writes = []
+    monkeypatch.setattr(idempotentApp.car_repository, "createCar", lambda *args, **kwargs: writes.append(args))
+    # from the container cache, then from the table in a new container
+    for container in ("warm", "new"):
+        if container == "new":
+            client = idempotentApp.idempotent_writes._client
+            monkeypatch.setattr(idempotentApp, "idempotent_writes", IdempotentWrites({"table_name": TABLE_NAME, "client": client}))
+        replay = idempotentApp.handler(post(car, "key-1"), lambda_context)
+        assert replay["statusCode"] == 200 and replay["body"] == first["body"]
+        assert replay["multiValueHeaders"][REPLAYED_HEADER] == ["true"]
+    assert writes == [] and idempotentApp.event_producer.event_backbone.calls == 1
+    # the same key on another body, or another route, is not a replay
+    assert idempotentApp.handler(post(dict(car, year=2025), "key-1"), lambda_context)["statusCode"] == 422
+    update = {"httpMethod": "PUT", "path": "/cars/idem-1", "headers": {"Idempotency-Key": "key-1"},
+              "body": json.dumps({"status": "Rented"})}
+    assert REPLAYED_HEADER not in idempotentApp.handler(update, lambda_context)["multiValueHeaders"]
+
+
+def test_retry_during_the_first_request_gets_409(idempotentApp, lambda_context, monkeypatch):
+    car = {"car_id": "idem-2", "model": "Model_1", "year": 2024}
+    retries = []
+    createCar = idempotentApp.car_repository.createCar
+    def createCarWhileRetried(*args, **kwargs):
+        retries.append(idempotentApp.handler(post(car, "key-2"), lambda_context))
+        return createCar(*args, **kwargs)
+    monkeypatch.setattr(idempotentApp.car_repository, "createCar", createCarWhileRetried)
+    assert idempotentApp.handler(post(car, "key-2"), lambda_context)["statusCode"] == 200
+    assert retries[0]["statusCode"] == 409 and retries[0]["multiValueHeaders"]["Retry-After"] == ["1"]
+
+
+def test_failed_request_can_be_retried(idempotentApp, lambda_context, monkeypatch):
+    idempotentApp.car_repository.createCar({"car_id": "idem-3", "model": "Model_1", "year": 2024})
+    planned = []
+    planUpdate = idempotentApp.car_repository.planUpdate
+    def countedPlanUpdate(*args, **kwargs):
+        planned.append(args)
+        return planUpdate(*args, **kwargs)
+    monkeypatch.setattr(idempotentApp.car_repository, "planUpdate", countedPlanUpdate)
+    stale = {"httpMethod": "PUT", "path": "/cars/idem-3", "headers": {"Idempotency-Key": "key-3"},
+             "body": json.dumps({"status": "Rented", "version": 7})}
+    # the record of a failed request is deleted, its retry runs again
+    assert idempotentApp.handler(stale, lambda_context)["statusCode"] == 409
+    assert idempotentApp.handler(stale, lambda_context)["statusCode"] == 409
+    assert len(planned) == 2
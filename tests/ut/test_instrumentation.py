@@ -0,0 +1,55 @@
+import json
+import pytest
+from boto3 import resource
+from aws_lambda_powertools import Metrics
+
+import instrumentation
+from car_repository import CarRepository
+
+TABLE_NAME="instrumented_cars"
+
+
+@pytest.fixture
+def repository(dynamodb_client, monkeypatch):
+    dynamodb_client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    dynamodb = resource('dynamodb')
+    instrumentation.instrument(dynamodb.meta.client)
+    monkeypatch.setenv("CAR_INSTRUMENTATION", "true")
+    instrumentation.stats.drain()
+    yield CarRepository({"resource": dynamodb, "table_name": TABLE_NAME, "cache_size": 0})
+    instrumentation.stats.drain()
+    dynamodb_client.delete_table(TableName=TABLE_NAME)
+
+
+def test_calls_are_aggregated_by_operation(repository):
+    repository.createCar({"car_id": "car-1", "model": "Model_1", "year": 2024, "status": "Available"})
+    repository.getCarUsingCarId("car-1")
+    repository.getCarUsingCarId("car-1")
+    operations = instrumentation.stats.drain()
+    get_item = operations[("dynamodb", "GetItem")]
+    assert get_item["calls"] == 2 and get_item["errors"] == 0 and get_item["retries"] == 0
+    assert get_item["time_ms"] > 0 and get_item["request_bytes"] > 0 and get_item["response_bytes"] > 0
+    assert operations[("dynamodb", "PutItem")]["calls"] == 1
+    assert instrumentation.stats.drain() == {}
+
+
+def test_disabled_by_environment(repository, monkeypatch):
+    monkeypatch.setenv("CAR_INSTRUMENTATION", "false")
+    repository.createCar({"car_id": "car-1", "model": "Model_1", "year": 2024, "status": "Available"})
+    assert instrumentation.stats.drain() == {}
+
+
+def test_publish_one_blob_per_operation(repository, capsys):
+    repository.createCar({"car_id": "car-1", "model": "Model_1", "year": 2024, "status": "Available"})
+    repository.getCarUsingCarId("car-1")
+    summary = instrumentation.publish(Metrics(namespace="test"))
+    assert set(summary) == {"dynamodb.PutItem", "dynamodb.GetItem"}
+    blobs = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert {blob["Operation"] for blob in blobs} == {"PutItem", "GetItem"}
+    for blob in blobs:
+        assert blob["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Service", "Operation"]]
+        assert blob["AwsCalls"] == [1.0] and "ConsumedCapacity" in blob
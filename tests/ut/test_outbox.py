@@ -0,0 +1,107 @@
+import json
+import boto3
+import pytest
+from boto3 import resource
+from unittest import mock
+
+import app as app
+import car_outbox
+
+TABLE_NAME="outbox_test_cars"
+OUTBOX_TABLE_NAME="outbox_test_events"
+
+
+@pytest.fixture(scope="module")
+def outboxApp(dynamodb_client):
+    dynamodb_client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    dynamodb_client.create_table(
+        TableName=OUTBOX_TABLE_NAME,
+        KeySchema=[{'AttributeName': 'car_id', 'KeyType': 'HASH'}, {'AttributeName': 'sequence', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'car_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'sequence', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+        StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_IMAGE'})
+    saved = (app.car_repository, app.event_producer, app.CAR_EVENT_OUTBOX)
+    app.car_repository = app.CarRepository({"resource": resource('dynamodb'), "table_name": TABLE_NAME,
+                                            "outbox_table_name": OUTBOX_TABLE_NAME})
+    app.event_producer = app.CarEventProducer({"event_bus": "test_event_bus"})
+    app.event_producer.event_backbone = mock.Mock()
+    app.CAR_EVENT_OUTBOX = True
+    yield app
+    app.car_repository, app.event_producer, app.CAR_EVENT_OUTBOX = saved
+
+
+def read_stream_records(dynamodb_client) -> dict:
+    """Read the outbox stream with moto, in the Lambda event source format"""
+    streams = boto3.client("dynamodbstreams", region_name="us-west-2")
+    stream_arn = dynamodb_client.describe_table(TableName=OUTBOX_TABLE_NAME)['Table']['LatestStreamArn']
+    shard = streams.describe_stream(StreamArn=stream_arn)['StreamDescription']['Shards'][0]
+    iterator = streams.get_shard_iterator(StreamArn=stream_arn, ShardId=shard['ShardId'],
+                                          ShardIteratorType='TRIM_HORIZON')['ShardIterator']
+    return {"Records": streams.get_records(ShardIterator=iterator)['Records']}
+
+
+def test_outbox_write_does_not_publish(outboxApp, dynamodb_client, lambda_context):
+    aCar = {"car_id": "outbox-1", "model": "Model_1", "year": 2024}
+    resp = outboxApp.handler({"httpMethod": "POST", "path": "/cars", "body": json.dumps(aCar)}, lambda_context)
+    assert resp['statusCode'] == 200
+    aCar = {"model": "Model_1", "year": 2024, "status": "Rented"}
+    resp = outboxApp.handler({"httpMethod": "PUT", "path": "/cars/outbox-1", "body": json.dumps(aCar)}, lambda_context)
+    assert resp['statusCode'] == 200
+    outboxApp.event_producer.event_backbone.put_events.assert_not_called()
+    assert outboxApp.car_repository.getCarUsingCarId("outbox-1")['status'] == "Rented"
+    events = dynamodb_client.scan(TableName=OUTBOX_TABLE_NAME)['Items']
+    assert len(events) == 2
+
+
+def test_relay_forwards_stream_records(outboxApp, dynamodb_client, lambda_context):
+    event_backbone = mock.Mock()
+    event_backbone.put_events.return_value = {'FailedEntryCount': 0, 'Entries': [{}, {}]}
+    with mock.patch.object(car_outbox.event_producer, "event_backbone", event_backbone):
+        resp = car_outbox.handler(read_stream_records(dynamodb_client), lambda_context)
+    assert resp == {"batchItemFailures": []}
+    entries = event_backbone.put_events.call_args.kwargs['Entries']
+    assert [entry['DetailType'] for entry in entries] == [app.CAR_CREATED_EVENT, app.CAR_UPDATED_EVENT]
+    assert json.loads(entries[1]['Detail'])['status'] == "Rented"
+
+
+def test_relay_reports_first_undelivered_record(outboxApp, dynamodb_client, lambda_context):
+    def put_events(Entries):
+        # the CarUpdated event is always throttled
+        results = [{'ErrorCode': 'ThrottlingException'} if entry['DetailType'] == app.CAR_UPDATED_EVENT else {}
+                   for entry in Entries]
+        return {'FailedEntryCount': sum('ErrorCode' in r for r in results), 'Entries': results}
+    event_backbone = mock.Mock()
+    event_backbone.put_events.side_effect = put_events
+    records = read_stream_records(dynamodb_client)
+    with mock.patch.object(car_outbox.event_producer, "event_backbone", event_backbone), \
+         mock.patch.object(car_outbox.event_producer, "base_delay", 0):
+        resp = car_outbox.handler(records, lambda_context)
+    assert resp == {"batchItemFailures": [{"itemIdentifier": records["Records"][1]['dynamodb']['SequenceNumber']}]}
+
+
+def test_outbox_batch_is_transactional(outboxApp, dynamodb_client, lambda_context):
+    cars = [{"car_id": f"outbox-batch-{i}", "model": "Model_1", "year": 2024} for i in range(60)]
+    resp = outboxApp.handler({"httpMethod": "POST", "path": "/cars/batch", "body": json.dumps(cars)}, lambda_context)
+    assert json.loads(resp['body'])['created'] == 60
+    events = dynamodb_client.scan(TableName=OUTBOX_TABLE_NAME)['Items']
+    assert len(events) == 62
+
+
+def test_outbox_keeps_the_writes_of_a_car_in_order(outboxApp, dynamodb_client, lambda_context):
+    aCar = {"car_id": "outbox-order", "model": "Model_1", "year": 2024}
+    outboxApp.handler({"httpMethod": "POST", "path": "/cars", "body": json.dumps(aCar)}, lambda_context)
+    for status in ("Rented", "Available"):
+        outboxApp.handler({"httpMethod": "PUT", "path": "/cars/outbox-order", "body": json.dumps({"status": status})},
+                          lambda_context)
+    # one partition for the car, its records sorted by version
+    records = dynamodb_client.query(TableName=OUTBOX_TABLE_NAME, KeyConditionExpression="car_id = :car_id",
+                                    ExpressionAttributeValues={":car_id": {"S": "outbox-order"}})['Items']
+    entries = [json.loads(record['entry']['S']) for record in records]
+    assert [(entry['DetailType'], json.loads(entry['Detail'])['status']) for entry in entries] == [
+        (app.CAR_CREATED_EVENT, "Available"), (app.CAR_UPDATED_EVENT, "Rented"), (app.CAR_UPDATED_EVENT, "Available")]
+    assert [record['sequence']['S'][:12] for record in records] == ["000000000001", "000000000002", "000000000003"]
@@ -0,0 +1,57 @@
+import threading
+import pytest
+from parallel_scan import parallelScan, parallelScanAll
+
+
+class FakeScanClient:
+    """Return pages_per_segment pages of 2 items for each segment"""
+
+    def __init__(self, pages_per_segment: int, fail_segment: int = None):
+        self.pages_per_segment = pages_per_segment
+        self.fail_segment = fail_segment
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def scan(self, **kwargs):
+        segment = kwargs["Segment"]
+        with self.lock:
+            self.calls.append(kwargs)
+        if segment == self.fail_segment:
+            raise RuntimeError("throttled")
+        page = int(kwargs.get("ExclusiveStartKey", {"page": {"N": "0"}})["page"]["N"])
+        items = [{"car_id": {"S": f"{segment}-{page}-{i}"}, "year": {"N": "2024"}} for i in range(2)]
+        response = {"Items": items}
+        if page + 1 < self.pages_per_segment:
+            response["LastEvaluatedKey"] = {"page": {"N": str(page + 1)}}
+        return response
+
+
+def test_parallel_scan_reads_all_segments():
+    client = FakeScanClient(pages_per_segment=3)
+    cars = parallelScanAll(client, "acm_cars", total_segments=4, page_size=2)
+    assert len(cars) == 4 * 3 * 2
+    assert len({car["car_id"] for car in cars}) == len(cars)
+    assert cars[0]["year"] == 2024
+    assert {call["TotalSegments"] for call in client.calls} == {4}
+    assert {call["Limit"] for call in client.calls} == {2}
+
+
+def test_parallel_scan_streams_pages():
+    client = FakeScanClient(pages_per_segment=5)
+    pages = parallelScan(client, "acm_cars", total_segments=2, max_in_flight=1)
+    first = next(pages)
+    assert len(first) == 2
+    pages.close()
+    # workers stop once the consumer leaves, without reading the remaining pages
+    assert len(client.calls) < 10
+
+
+def test_parallel_scan_raises_worker_error():
+    client = FakeScanClient(pages_per_segment=2, fail_segment=1)
+    with pytest.raises(RuntimeError):
+        parallelScanAll(client, "acm_cars", total_segments=3)
+
+
+def test_parallel_scan_rejects_invalid_segments():
+    with pytest.raises(ValueError):
+        parallelScanAll(FakeScanClient(1), "acm_cars", total_segments=0)
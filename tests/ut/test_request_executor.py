@@ -0,0 +1,121 @@
+import json, threading
+import pytest
+
+import app
+from acm_model import AutonomousCar
+from car_event_producer import CarEventProducer, CAR_WRITE_FAILED_EVENT
+from car_repository import newCarRepository
+from request_executor import RequestExecutor
+
+
+class RecordingEventBridge:
+    """put_events stub recording the entries, failing those of the car ids in undeliverable"""
+
+    def __init__(self, undeliverable=()):
+        self.entries = []
+        self.undeliverable = set(undeliverable)
+        self.called = threading.Event()
+
+    def put_events(self, Entries):
+        self.entries.extend(Entries)
+        self.called.set()
+        results = [{"ErrorCode": "InternalFailure"} if json.loads(e["Detail"])["car_id"] in self.undeliverable
+                   else {"EventId": "1"} for e in Entries]
+        return {"FailedEntryCount": sum("ErrorCode" in r for r in results), "Entries": results}
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = RequestExecutor(workers=4).prewarm()
+    yield executor
+    executor.pool.shutdown()
+
+
+def producerWith(client) -> CarEventProducer:
+    producer = CarEventProducer({"event_bus": "test", "client": client})
+    producer.base_delay = 0
+    return producer
+
+
+def entry(producer, car_id: str) -> dict:
+    return producer.carEventEntry(AutonomousCar(car_id=car_id, model="Model_1", year=2024, status="Available"),
+                                  "acme.acs.acm.events.CarCreated")
+
+
+def test_publish_runs_while_the_write_waits(executor):
+    client = RecordingEventBridge()
+    producer = producerWith(client)
+    # the write only completes once the event is published, which would never happen in series
+    result = executor.writeAndPublish(lambda: client.called.wait(5) and "written", [entry(producer, "c1")], producer)
+    assert result == "written" and len(client.entries) == 1
+    assert producer.drainPublishStats() == {"sent": 1, "retried": 0, "failed": 0}
+
+
+def test_failed_write_compensates_the_delivered_events(executor):
+    client = RecordingEventBridge(undeliverable={"c2"})
+    producer = producerWith(client)
+    def write():
+        client.called.wait(5)
+        raise RuntimeError("write failed")
+    with pytest.raises(RuntimeError):
+        executor.writeAndPublish(write, [entry(producer, "c1"), entry(producer, "c2")], producer)
+    compensations = [e for e in client.entries if e["DetailType"] == CAR_WRITE_FAILED_EVENT]
+    # c2 was never delivered, it has nothing to compensate
+    assert [json.loads(e["Detail"])["car_id"] for e in compensations] == ["c1"]
+    assert json.loads(compensations[0]["Detail"])["failed_event_type"] == "acme.acs.acm.events.CarCreated"
+
+
+def test_map_finishes_every_call_before_raising(executor):
+    done = []
+    def record(i):
+        if i == 0:
+            raise ValueError("first")
+        done.append(i)
+        return i
+    with pytest.raises(ValueError):
+        executor.map(record, range(8))
+    assert sorted(done) == list(range(1, 8))
+    assert executor.map(lambda i: i * 2, [1, 2, 3]) == [2, 4, 6]
+
+
+def test_concurrent_routes_publish_without_the_buffer(executor, lambda_context, monkeypatch):
+    client = RecordingEventBridge()
+    repository = newCarRepository({"backend": "memory"})
+    monkeypatch.setattr(app, "request_executor", executor)
+    monkeypatch.setattr(app, "car_repository", repository)
+    monkeypatch.setattr(app, "event_producer", producerWith(client))
+    cars = [{"car_id": "b1", "model": "Model_1", "year": 2024}, {"car_id": "b2", "model": "Model_1", "year": 2024}]
+    app.handler({"httpMethod": "POST", "path": "/cars", "body": json.dumps(cars[0])}, lambda_context)
+    app.handler({"httpMethod": "PUT", "path": "/cars/b1", "body": json.dumps({"status": "Rented"})}, lambda_context)
+    assert [e["DetailType"] for e in client.entries] == ["acme.acs.acm.events.CarCreated", "acme.acs.acm.events.CarUpdated"]
+    assert not app.event_producer.buffer
+    assert repository.getCarUsingCarId("b1")["status"] == "Rented"
+    # the event of a car the batch failed to write is compensated
+    client.entries.clear()
+    monkeypatch.setattr(repository, "createCars", lambda cars: [{"car_id": "b1", "status": "created"},
+                                                                 {"car_id": "b2", "status": "failed", "error": "x"}])
+    response = app.handler({"httpMethod": "POST", "path": "/cars/batch", "body": json.dumps(cars)}, lambda_context)
+    assert json.loads(response["body"])["created"] == 1
+    assert [(json.loads(e["Detail"])["car_id"], e["DetailType"]) for e in client.entries] == [
+        ("b1", "acme.acs.acm.events.CarCreated"), ("b2", "acme.acs.acm.events.CarCreated"), ("b2", CAR_WRITE_FAILED_EVENT)]
+
+
+def test_concurrent_update_publishes_once_written(executor, lambda_context, monkeypatch):
+    client = RecordingEventBridge()
+    repository = newCarRepository({"backend": "memory"})
+    monkeypatch.setattr(app, "request_executor", executor)
+    monkeypatch.setattr(app, "car_repository", repository)
+    monkeypatch.setattr(app, "event_producer", producerWith(client))
+    repository.createCar({"car_id": "u1", "model": "Model_1", "year": 2024, "status": "Available"})
+    plan = repository.planUpdate
+    def planThenRaced(car, expected_version=None):
+        # another write lands between the first read and the conditional write
+        update = plan(car, expected_version=expected_version)
+        if update.expected_version == 1:
+            repository.items["u1"]["version"] = 2
+        return update
+    monkeypatch.setattr(repository, "planUpdate", planThenRaced)
+    response = app.handler({"httpMethod": "PUT", "path": "/cars/u1", "body": json.dumps({"status": "Rented"})}, lambda_context)
+    assert json.loads(response["body"]) == {"status": "updated", "version": 3}
+    # the lost write sent no event, hence no compensation, the replay sent one
+    assert [e["DetailType"] for e in client.entries] == ["acme.acs.acm.events.CarUpdated"]
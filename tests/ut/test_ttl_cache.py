@@ -0,0 +1,44 @@
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_hit_and_expiry():
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl=5, clock=clock)
+    assert cache.get("1") is None
+    cache.put("1", {"car_id": "1"})
+    assert cache.get("1") == {"car_id": "1"}
+    clock.now = 6
+    assert cache.get("1") is None
+    assert cache.drainStats() == {"hits": 1, "misses": 2, "evictions": 0}
+    assert cache.drainStats() == {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.put("1", 1)
+    cache.put("2", 2)
+    cache.get("1")
+    cache.put("3", 3)
+    assert cache.get("2") is None
+    assert cache.get("1") == 1
+    assert cache.get("3") == 3
+    assert len(cache) == 2
+    assert cache.drainStats()["evictions"] == 1
+
+
+def test_cache_invalidate_and_disable():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.put("1", 1)
+    cache.invalidate("1")
+    assert cache.get("1") is None
+    disabled = TTLCache(max_size=0, ttl=60)
+    disabled.put("1", 1)
+    assert disabled.get("1") is None